@@ -0,0 +1,175 @@
+"""
+Admission control for the OCR service.
+
+At most ``OCR_MAX_IN_FLIGHT`` images are processed at once and the decoded pixels
+in flight stay under ``OCR_PIXEL_BUDGET``, so a burst cannot push the host into
+swap. Requests beyond that wait in a short FIFO queue. A request that cannot
+start early enough to finish before its client gives up (its timeout minus the
+recent average processing time) is turned away at once with a 503 and a
+Retry-After, rather than being served late to a client that has already left.
+Rejecting early keeps the latency of the admitted requests flat under overload.
+
+Bulk work (batch items) has its own lane: it is never rejected and has no
+deadline, it waits as long as it takes, and it only starts when no interactive
+request is waiting. Shedding protects interactive callers; a bulk import slows
+down under live traffic instead of failing item by item.
+"""
+import asyncio
+import math
+import os
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Optional, Tuple
+
+
+class AdmissionConfig:
+    MAX_IN_FLIGHT = int(os.getenv("OCR_MAX_IN_FLIGHT", str(os.cpu_count() or 1)))  # 0: no limit
+    MAX_WAITING = int(os.getenv("OCR_MAX_WAITING", str(2 * (os.cpu_count() or 1))))
+    PIXEL_BUDGET = int(os.getenv("OCR_PIXEL_BUDGET", str(40_000_000)))  # decoded pixels in flight
+    DEFAULT_TIMEOUT = float(os.getenv("OCR_DEFAULT_CLIENT_TIMEOUT", "30"))  # when the client sends none
+    INITIAL_SERVICE_TIME = float(os.getenv("OCR_INITIAL_SERVICE_TIME", "1.0"))  # until measured
+    TIMEOUT_HEADER = "X-Request-Timeout"  # seconds the client is willing to wait
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"OCR service overloaded ({reason})")
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight: Optional[int] = None, max_waiting: Optional[int] = None,
+                 pixel_budget: Optional[int] = None, default_timeout: Optional[float] = None):
+        self.max_in_flight = AdmissionConfig.MAX_IN_FLIGHT if max_in_flight is None else max_in_flight
+        self.max_waiting = AdmissionConfig.MAX_WAITING if max_waiting is None else max_waiting
+        self.pixel_budget = pixel_budget or AdmissionConfig.PIXEL_BUDGET
+        self.default_timeout = default_timeout or AdmissionConfig.DEFAULT_TIMEOUT
+        self.service_time = AdmissionConfig.INITIAL_SERVICE_TIME  # moving average, seconds
+        self.in_flight = 0
+        self.pixels_in_flight = 0
+        self._waiters: Deque[Tuple[asyncio.Future, int]] = deque()
+        self._bulk_waiters: Deque[Tuple[asyncio.Future, int]] = deque()
+        self.counters = {"admitted": 0, "admitted_bulk": 0, "rejected_queue_full": 0, "rejected_deadline": 0,
+                         "timed_out_waiting": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_in_flight > 0
+
+    def _fits(self, pixels: int) -> bool:
+        # An image over the whole budget still runs, alone
+        return self.in_flight < self.max_in_flight and (
+            self.pixels_in_flight + pixels <= self.pixel_budget or self.in_flight == 0)
+
+    def estimated_wait(self) -> float:
+        """
+        Seconds a request arriving now would wait before starting.
+        """
+        if not self._waiters and self._fits(0):
+            return 0.0
+        return (len(self._waiters) // self.max_in_flight + 1) * self.service_time
+
+    def _start(self, pixels: int) -> None:
+        self.in_flight += 1
+        self.pixels_in_flight += pixels
+        self.counters["admitted"] += 1
+
+    def _wake_waiters(self) -> None:
+        while self._waiters and self._fits(self._waiters[0][1]):
+            future, pixels = self._waiters.popleft()
+            if not future.done():
+                self._start(pixels)
+                future.set_result(None)
+        # Bulk work only once no interactive request is waiting
+        while not self._waiters and self._bulk_waiters and self._fits(self._bulk_waiters[0][1]):
+            future, pixels = self._bulk_waiters.popleft()
+            if not future.done():
+                self._start(pixels)
+                self.counters["admitted_bulk"] += 1
+                future.set_result(None)
+
+    def _finish(self, pixels: int, duration: float) -> None:
+        self.in_flight -= 1
+        self.pixels_in_flight -= pixels
+        self.service_time += 0.2 * (duration - self.service_time)
+        self._wake_waiters()
+
+    def _reject(self, counter: str, reason: str) -> Overloaded:
+        self.counters[counter] += 1
+        return Overloaded(reason, self.estimated_wait() or self.service_time)
+
+    @asynccontextmanager
+    async def admit(self, pixels: int, timeout: Optional[float] = None, bulk: bool = False) -> AsyncIterator[None]:
+        """
+        Hold a processing slot and ``pixels`` of the pixel budget for the ``with`` block.
+
+        ``timeout`` is how long the client will wait for the response. Raises
+        ``Overloaded`` when the wait queue is full, when the estimated wait leaves
+        no time to process the image, or when the wait runs out. ``bulk`` work
+        waits in its own lane, behind interactive requests, and is never rejected.
+        """
+        if not self.enabled:
+            yield
+            return
+
+        loop = asyncio.get_running_loop()
+        if not self._waiters and not (bulk and self._bulk_waiters) and self._fits(pixels):
+            self._start(pixels)
+            if bulk:
+                self.counters["admitted_bulk"] += 1
+        elif bulk:
+            future = loop.create_future()
+            self._bulk_waiters.append((future, pixels))
+            try:
+                await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self._finish(pixels, self.service_time)
+                else:
+                    future.cancel()
+                    self._bulk_waiters.remove((future, pixels))
+                    self._wake_waiters()
+                raise
+        else:
+            if len(self._waiters) >= self.max_waiting:
+                raise self._reject("rejected_queue_full", "wait queue full")
+            max_wait = (timeout or self.default_timeout) - self.service_time
+            if self.estimated_wait() > max_wait:
+                raise self._reject("rejected_deadline", "cannot start before the client timeout")
+
+            future = loop.create_future()
+            self._waiters.append((future, pixels))
+            try:
+                await asyncio.wait_for(asyncio.shield(future), max(0.0, max_wait))
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if future.done() and not future.cancelled():
+                    # Granted at the last moment: hand the slot back
+                    self._finish(pixels, self.service_time)
+                else:
+                    future.cancel()
+                    self._waiters.remove((future, pixels))
+                    # It may have been a large image holding up smaller ones that fit now
+                    self._wake_waiters()
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                raise self._reject("timed_out_waiting", "waited until the client timeout")
+
+        start = loop.time()
+        try:
+            yield
+        finally:
+            self._finish(pixels, loop.time() - start)
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "waiting_bulk": len(self._bulk_waiters),
+            "pixels_in_flight": self.pixels_in_flight,
+            "max_in_flight": self.max_in_flight,
+            "max_waiting": self.max_waiting,
+            "pixel_budget": self.pixel_budget,
+            "avg_service_ms": round(self.service_time * 1000, 1),
+        }
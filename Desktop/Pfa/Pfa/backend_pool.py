@@ -0,0 +1,269 @@
+"""
+Pools of backend instances behind the gateway: least-loaded dispatch, health
+checks, ejection of failing nodes and optional hedged requests.
+
+Each pool holds the base URLs of one service (``OCR_BACKENDS`` is a comma-separated
+list). A request goes to the available backend with the fewest requests in flight
+from this gateway, so a node busy with a slow card gets the next ones only once
+the others are as busy. A backend is unavailable while:
+- its last active health check (``GET /ready`` every ``GATEWAY_HEALTH_INTERVAL``
+  seconds) failed, or
+- it is ejected: ``GATEWAY_EJECT_AFTER`` requests in a row failed (connection
+  error, timeout, 502/504), for ``GATEWAY_EJECT_FOR`` seconds.
+A 503 (admission control shedding load) is retried elsewhere but is not a fault.
+When every backend is unavailable, requests still go to the least loaded one
+rather than failing at once.
+
+Hedging (``GATEWAY_HEDGE_AFTER``, in seconds or as a latency quantile such as
+``p95``): when the first backend has not answered by then, the same request is
+also sent to another backend and the first answer wins. Only for idempotent
+requests; the OCR results are.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Deque, Iterator, List, Optional, Sequence
+
+import httpx
+
+import metrics
+from http_client import HttpConfig, backoff_delay, get_client, post_with_retry
+
+logger = logging.getLogger("backend_pool")
+
+
+class PoolConfig:
+    HEALTH_PATH = os.getenv("GATEWAY_HEALTH_PATH", "/ready")
+    HEALTH_INTERVAL = float(os.getenv("GATEWAY_HEALTH_INTERVAL", "5"))
+    HEALTH_TIMEOUT = float(os.getenv("GATEWAY_HEALTH_TIMEOUT", "1"))
+    EJECT_AFTER = int(os.getenv("GATEWAY_EJECT_AFTER", "3"))  # consecutive failed requests
+    EJECT_FOR = float(os.getenv("GATEWAY_EJECT_FOR", "30"))  # seconds
+    HEDGE_AFTER = os.getenv("GATEWAY_HEDGE_AFTER", "")  # "": no hedging, "0.8": seconds, "p95": quantile
+    HEDGE_MIN_SAMPLES = 20  # latencies needed before a quantile threshold is used
+    LATENCY_WINDOW = 256  # recent latencies kept per pool
+    FAULT_STATUSES = (502, 504)
+
+
+class Backend:
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.in_flight = 0
+        self.healthy = True  # until a health check says otherwise
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    def available(self, now: float) -> bool:
+        return self.healthy and now >= self.ejected_until
+
+    def as_dict(self, now: float) -> dict:
+        return {
+            "url": self.url,
+            "available": self.available(now),
+            "healthy": self.healthy,
+            "ejected_for_s": round(max(0.0, self.ejected_until - now), 1),
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+
+class BackendPool:
+    def __init__(self, service: str, urls: Sequence[str], hedge_after: Optional[str] = None):
+        self.service = service
+        self.backends: List[Backend] = []
+        self.set_urls(urls)
+        self.hedge_after = PoolConfig.HEDGE_AFTER if hedge_after is None else hedge_after
+        self.latencies: Deque[float] = deque(maxlen=PoolConfig.LATENCY_WINDOW)
+        self.counters: Counter = Counter()
+        self._health_task: Optional[asyncio.Task] = None
+
+    def set_urls(self, urls: Sequence[str]) -> None:
+        self.backends = [Backend(url) for url in urls if url.strip()]
+        if not self.backends:
+            raise ValueError(f"No backend configured for {self.service}")
+
+    def pick(self, exclude: Sequence[Backend] = ()) -> Backend:
+        """
+        The available backend with the fewest requests in flight (ties broken at
+        random), preferring those not in ``exclude`` (already tried).
+        """
+        now = time.monotonic()
+        candidates = [b for b in self.backends if b not in exclude] or self.backends
+        available = [b for b in candidates if b.available(now)]
+        if not available:
+            self.counters["none_available"] += 1
+            available = candidates
+        fewest = min(b.in_flight for b in available)
+        return random.choice([b for b in available if b.in_flight == fewest])
+
+    def acquire(self, backend: Backend) -> float:
+        """
+        Count a request to ``backend`` as in flight; returns its start time for ``release``.
+        """
+        backend.in_flight += 1
+        backend.requests += 1
+        return time.perf_counter()
+
+    def release(self, backend: Backend, start: float, error: Optional[BaseException] = None) -> None:
+        """
+        End a request. A connection error, a timeout or a 502/504 counts as a
+        failure of the backend; other errors (a 503, a cancelled hedge) do not.
+        """
+        backend.in_flight -= 1
+        if error is None:
+            backend.consecutive_failures = 0
+            elapsed = time.perf_counter() - start
+            self.latencies.append(elapsed)
+            metrics.observe_stage("gateway", f"backend_{self.service}", elapsed)
+        elif isinstance(error, (httpx.TransportError, OSError)) or (
+                isinstance(error, httpx.HTTPStatusError) and error.response.status_code in PoolConfig.FAULT_STATUSES):
+            self._failed(backend)
+
+    @contextmanager
+    def use(self, backend: Backend) -> Iterator[Backend]:
+        start = self.acquire(backend)
+        try:
+            yield backend
+        except BaseException as e:
+            self.release(backend, start, e)
+            raise
+        self.release(backend, start)
+
+    def _failed(self, backend: Backend) -> None:
+        backend.failures += 1
+        backend.consecutive_failures += 1
+        if backend.consecutive_failures >= PoolConfig.EJECT_AFTER and backend.ejected_until <= time.monotonic():
+            backend.ejected_until = time.monotonic() + PoolConfig.EJECT_FOR
+            self.counters["ejections"] += 1
+            logger.warning("Ejected %s backend %s for %.0f s after %d failures in a row",
+                           self.service, backend.url, PoolConfig.EJECT_FOR, backend.consecutive_failures)
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        Seconds to wait before hedging, or None when hedging is off (or the quantile
+        is not known yet, or there is no second backend).
+        """
+        if not self.hedge_after or len(self.backends) < 2:
+            return None
+        if not self.hedge_after.startswith("p"):
+            return float(self.hedge_after)
+        if len(self.latencies) < PoolConfig.HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * float(self.hedge_after[1:]) / 100))]
+
+    async def _attempt(self, backend: Backend, path: str, kwargs: dict) -> httpx.Response:
+        with self.use(backend):
+            return await post_with_retry(backend.url + path, retries=0, **kwargs)
+
+    async def _hedged(self, backend: Backend, path: str, kwargs: dict, tried: List[Backend]) -> httpx.Response:
+        first = asyncio.ensure_future(self._attempt(backend, path, kwargs))
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay())
+            if done:
+                return first.result()
+            other = self.pick(exclude=tried)
+            if other in tried:
+                return await first
+            tried.append(other)
+            self.counters["hedges"] += 1
+            second = asyncio.ensure_future(self._attempt(other, path, kwargs))
+            tasks.add(second)
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.counters["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def post(self, path: str, retries: Optional[int] = None, hedge: bool = True, **kwargs) -> httpx.Response:
+        """
+        POST ``path`` to the least-loaded backend, hedged when enabled. Connection
+        errors, timeouts and 502/503/504 are retried on another backend (with
+        jittered backoff when none is left untried). ``kwargs`` are passed to
+        ``httpx.AsyncClient.post``. Raises ``httpx.HTTPError`` once the retries are exhausted.
+        """
+        retries = HttpConfig.MAX_RETRIES if retries is None else retries
+        tried: List[Backend] = []
+        attempt = 0
+        while True:
+            backend = self.pick(exclude=tried)
+            fresh = backend not in tried
+            tried.append(backend)
+            if not fresh:
+                await asyncio.sleep(backoff_delay(attempt - 1))
+            try:
+                if hedge and self.hedge_delay() is not None:
+                    return await self._hedged(backend, path, kwargs, tried)
+                return await self._attempt(backend, path, kwargs)
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code not in HttpConfig.RETRY_STATUSES or attempt >= retries:
+                    raise
+            except httpx.TransportError:
+                if attempt >= retries:
+                    raise
+            self.counters["retries"] += 1
+            attempt += 1
+
+    async def check(self) -> None:
+        """
+        One round of active health checks, all backends in parallel.
+        """
+        client = get_client()
+
+        async def check_one(backend: Backend) -> None:
+            try:
+                response = await client.get(backend.url + PoolConfig.HEALTH_PATH, timeout=PoolConfig.HEALTH_TIMEOUT)
+                healthy = response.status_code == 200
+            except httpx.HTTPError:
+                healthy = False
+            if healthy != backend.healthy:
+                logger.warning("%s backend %s is now %s", self.service, backend.url, "healthy" if healthy else "unhealthy")
+            backend.healthy = healthy
+
+        await asyncio.gather(*(check_one(backend) for backend in self.backends))
+
+    async def _health_loop(self) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(PoolConfig.HEALTH_INTERVAL)
+
+    def start(self) -> None:
+        if self._health_task is None and PoolConfig.HEALTH_INTERVAL > 0:
+            self._health_task = asyncio.ensure_future(self._health_loop())
+
+    async def stop(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        delay = self.hedge_delay()
+        return {
+            "backends": [backend.as_dict(now) for backend in self.backends],
+            "hedge_after_s": round(delay, 3) if delay is not None else None,
+            **self.counters,
+        }
+
+
+def urls_from_env(name: str, default: str) -> List[str]:
+    return [url.strip() for url in os.getenv(name, default).split(",") if url.strip()]
@@ -0,0 +1,173 @@
+"""
+In-memory index of registered and blocklisted CINs for the validation service.
+
+Each CIN is packed into a 32-bit integer (letters and digits, keeping the number
+of digits) and stored in an open-addressing hash table held in a numpy array, so
+membership is a constant number of probes and an entry costs a few bytes rather
+than a Python string in a set. Batches are looked up with vectorized probes.
+
+The index is loaded from a text file with one ``CIN[,status]`` record per line
+(status ``registered``, the default, or ``blocked``; ``#`` starts a comment) and
+can be reloaded while the service runs: a new index is built and swapped in.
+"""
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from field_extraction import normalize_cin
+
+logger = logging.getLogger("cin_index")
+
+
+class IndexConfig:
+    FILE = os.getenv("CIN_INDEX_FILE")  # unset: empty index
+    RELOAD_INTERVAL = float(os.getenv("CIN_INDEX_RELOAD_INTERVAL", "0"))  # seconds between mtime checks, 0: off
+
+
+STATUSES = ("registered", "blocked")
+
+_DIGIT_CODES = 1_100_000  # 5-digit numbers -> 0..99999, 6-digit -> 100000..1099999
+_HASH_MULTIPLIER = np.uint64(2654435761)  # Knuth's multiplicative hash
+
+
+def pack_cin(cin: str) -> int:
+    """
+    Integer key of a normalized CIN (see ``field_extraction.normalize_cin``), never 0.
+    """
+    split = 2 if cin[1].isalpha() else 1
+    letters, digits = cin[:split], cin[split:]
+    letter_code = ord(letters[-1]) - 64 + (26 * (ord(letters[0]) - 64) if split == 2 else 0)
+    digit_code = int(digits) + (100_000 if len(digits) == 6 else 0)
+    return letter_code * _DIGIT_CODES + digit_code
+
+
+class CINSet:
+    """
+    Set of packed CIN keys in a linear-probing hash table at most half full.
+    """
+
+    def __init__(self, keys: Iterable[int]):
+        keys = np.unique(np.fromiter(keys, dtype=np.uint32))
+        self.size = len(keys)
+        self.bits = max(4, (2 * self.size - 1).bit_length())
+        self.mask = (1 << self.bits) - 1
+        self.table = np.zeros(1 << self.bits, dtype=np.uint32)
+
+        pending, slots = keys, self._slots(keys)
+        while len(pending):
+            # Of the keys probing a free slot, the first one per slot takes it;
+            # every other key moves on to the next slot
+            free = np.flatnonzero(self.table[slots] == 0)
+            _, first = np.unique(slots[free], return_index=True)
+            winners = free[first]
+            self.table[slots[winners]] = pending[winners]
+            waiting = np.ones(len(pending), dtype=bool)
+            waiting[winners] = False
+            pending, slots = pending[waiting], (slots[waiting] + 1) & self.mask
+
+    def _slots(self, keys: np.ndarray) -> np.ndarray:
+        hashed = (keys.astype(np.uint64) * _HASH_MULTIPLIER) & np.uint64(0xFFFFFFFF)
+        return (hashed >> np.uint64(32 - self.bits)).astype(np.int64) if self.bits < 32 else hashed.astype(np.int64)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, key: int) -> bool:
+        # Same hash as _slots, in plain Python: cheaper than numpy for one key
+        slot = ((int(key) * 2654435761) & 0xFFFFFFFF) >> (32 - self.bits)
+        while True:
+            value = self.table.item(slot)
+            if value == key:
+                return True
+            if value == 0:
+                return False
+            slot = (slot + 1) & self.mask
+
+    def contains_many(self, keys: np.ndarray) -> np.ndarray:
+        found = np.zeros(len(keys), dtype=bool)
+        active = np.arange(len(keys))
+        slots = self._slots(keys)
+        while len(active):
+            values = self.table[slots]
+            hit = values == keys[active]
+            found[active[hit]] = True
+            probing = (values != 0) & ~hit
+            active, slots = active[probing], (slots[probing] + 1) & self.mask
+        return found
+
+    @property
+    def nbytes(self) -> int:
+        return self.table.nbytes
+
+
+class CINIndex:
+    def __init__(self, records: Dict[str, Iterable[int]], path: Optional[str] = None,
+                 mtime: Optional[float] = None, skipped: int = 0):
+        self.sets = {status: CINSet(records.get(status, ())) for status in STATUSES}
+        self.path = path
+        self.mtime = mtime
+        self.skipped = skipped
+        self.loaded_at = time.time()
+
+    @classmethod
+    def load(cls, path: Optional[str]) -> "CINIndex":
+        """
+        Build an index from the file at ``path`` (an empty one when ``path`` is None).
+        Lines that are not a valid CIN with a known status are counted and skipped.
+        """
+        if not path:
+            return cls({})
+        records: Dict[str, List[int]] = {status: [] for status in STATUSES}
+        skipped = 0
+        mtime = os.path.getmtime(path)
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.split("#", 1)[0].strip()
+                if not line:
+                    continue
+                value, _, status = line.partition(",")
+                cin, status = normalize_cin(value), status.strip().lower() or "registered"
+                if cin is None or status not in records:
+                    skipped += 1
+                    continue
+                records[status].append(pack_cin(cin))
+        if skipped:
+            logger.warning("Skipped %d invalid lines in %s", skipped, path)
+        return cls(records, path, mtime, skipped)
+
+    def is_stale(self) -> bool:
+        if not self.path:
+            return False
+        try:
+            return os.path.getmtime(self.path) != self.mtime
+        except OSError:
+            return False
+
+    def status(self, cin: str) -> Optional[str]:
+        """
+        ``blocked``, ``registered`` or None for a normalized CIN.
+        """
+        key = pack_cin(cin)
+        if key in self.sets["blocked"]:
+            return "blocked"
+        if key in self.sets["registered"]:
+            return "registered"
+        return None
+
+    def status_many(self, cins: List[str]) -> List[Optional[str]]:
+        keys = np.fromiter((pack_cin(cin) for cin in cins), dtype=np.uint32, count=len(cins))
+        blocked = self.sets["blocked"].contains_many(keys)
+        registered = self.sets["registered"].contains_many(keys)
+        return ["blocked" if b else "registered" if r else None for b, r in zip(blocked, registered)]
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "loaded_at": self.loaded_at,
+            "skipped_lines": self.skipped,
+            **{status: len(entries) for status, entries in self.sets.items()},
+            "bytes": sum(entries.nbytes for entries in self.sets.values()),
+        }
@@ -0,0 +1,150 @@
+"""
+Executor for the CPU-heavy OCR stages (image decoding, OpenCV preprocessing, Tesseract).
+
+Running these inline in an ``async def`` endpoint blocks the event loop, so a worker
+handles one image at a time and even health checks wait. ``run_stage`` hands the
+work to a thread or process pool and records wait time per stage, and the pool's
+queue depth, so the pool size can be tuned.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+import metrics
+
+
+class ExecutorConfig:
+    KIND = os.getenv("OCR_EXECUTOR", "thread")  # thread | process
+    WORKERS = int(os.getenv("OCR_EXECUTOR_WORKERS", str(os.cpu_count() or 1)))
+
+
+class StageStats:
+    def __init__(self):
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.run_total = 0.0
+        self.run_max = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        done = self.completed + self.failed
+        return {
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "avg_wait_ms": round(self.wait_total / done * 1000, 2) if done else 0.0,
+            "max_wait_ms": round(self.wait_max * 1000, 2),
+            "avg_run_ms": round(self.run_total / done * 1000, 2) if done else 0.0,
+            "max_run_ms": round(self.run_max * 1000, 2),
+        }
+
+
+def _timed_call(fn: Callable, args: tuple, kwargs: dict):
+    # Wall-clock timestamps so they can be compared across worker processes
+    started = time.time()
+    try:
+        result = fn(*args, **kwargs)
+    except Exception as e:
+        return started, time.time(), None, e
+    return started, time.time(), result, None
+
+
+class StageExecutor:
+    def __init__(self, kind: Optional[str] = None, workers: Optional[int] = None, service: str = "ocr"):
+        self.kind = kind or ExecutorConfig.KIND
+        self.workers = workers or ExecutorConfig.WORKERS
+        self.service = service  # label of the stage metrics
+        self._executor: Optional[Executor] = None
+        self._stats: Dict[str, StageStats] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            elif self.kind == "thread":
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ocr-stage")
+            else:
+                raise ValueError(f"Unknown executor kind: {self.kind}")
+        return self._executor
+
+    def _stage(self, name: str) -> StageStats:
+        stats = self._stats.get(name)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(name, StageStats())
+        return stats
+
+    async def run(self, stage: str, fn: Callable, *args, **kwargs):
+        """
+        Run ``fn(*args, **kwargs)`` on the pool and await its result.
+
+        With the process pool, ``fn`` and its arguments must be picklable
+        (module-level functions, ``functools.partial``, numpy arrays, bytes).
+        """
+        stats = self._stage(stage)
+        with self._lock:
+            stats.submitted += 1
+            stats.in_flight += 1
+            stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+        submitted = time.time()
+        loop = asyncio.get_running_loop()
+        try:
+            started, finished, result, error = await loop.run_in_executor(
+                self.executor, _timed_call, fn, args, kwargs
+            )
+        except BaseException:
+            with self._lock:
+                stats.in_flight -= 1
+                stats.failed += 1
+            raise
+        wait, run = max(0.0, started - submitted), finished - started
+        with self._lock:
+            stats.in_flight -= 1
+            stats.wait_total += wait
+            stats.wait_max = max(stats.wait_max, wait)
+            stats.run_total += run
+            stats.run_max = max(stats.run_max, run)
+            if error is None:
+                stats.completed += 1
+            else:
+                stats.failed += 1
+        metrics.observe_stage(self.service, "queue", wait)
+        metrics.observe_stage(self.service, stage, run)
+        if error is not None:
+            raise error
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            in_flight = sum(s.in_flight for s in self._stats.values())
+            return {
+                "kind": self.kind,
+                "workers": self.workers,
+                "in_flight": in_flight,
+                # All stages share the pool: work beyond its size waits for a free worker
+                "queue_depth": max(0, in_flight - self.workers),
+                "stages": {name: s.as_dict() for name, s in self._stats.items()},
+            }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+stage_executor = StageExecutor()
+
+
+async def run_stage(stage: str, fn: Callable, *args, **kwargs):
+    return await stage_executor.run(stage, fn, *args, **kwargs)
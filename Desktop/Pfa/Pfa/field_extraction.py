@@ -0,0 +1,176 @@
+"""
+Field extraction engine shared by the OCR services and the gateways.
+
+All pattern tables are compiled once at import time and the OCR text is scanned
+in a single pass over its lines: lines without digits are only considered for the
+name, lines with digits only for the CIN and the birth date. The results are the
+same as the previous ``DataExtractor`` heuristics, with the position of each field.
+"""
+import re
+from typing import Dict, NamedTuple, Optional, Sequence, Tuple
+
+VALID_YEAR_RANGE = (1900, 2024)
+
+# CIN candidates in priority order: a match of the first pattern anywhere in the
+# text wins over any match of the second one.
+CIN_PATTERNS = (
+    re.compile(r"[A-Z]{1,2}\d{5,6}", re.IGNORECASE),  # Standard format
+    re.compile(r"[A-Z]{1,2}\s*\d{5,6}", re.IGNORECASE),  # With space between letters and numbers
+)
+CIN_FORMAT = re.compile(r"^[A-Z]{1,2}\d{5,6}$")  # the one CIN rule, also used by the validation service
+
+# Birth date patterns, tried in this order on each lower-cased line
+DATE_PATTERNS = tuple(re.compile(p) for p in (
+    r"(?<!\d)(\d{1,2})[.\s-](\d{1,2})[.\s-](\d{4})(?!\d)",
+    r"né\s?le\s*:?\s*(\d{1,2})[.\s-](\d{1,2})[.\s-](\d{4})",
+    r"nele\s*:?\s*(\d{1,2})[.\s-](\d{1,2})[.\s-](\d{4})",
+    r"(?:تاريخ الازدياد|تاريخ الميلاد)\s*:?\s*(\d{1,2})[.\s-](\d{1,2})[.\s-](\d{4})",
+    r"(?<!\d)(\d{2})[.\s-](\d{2})[.\s-](\d{4})(?!\d)",
+))
+
+DIGIT = re.compile(r"\d")
+YEAR = re.compile(r"\d{4}")  # every date pattern needs one
+NUMBER = re.compile(r"\d+")
+NAME_JUNK = re.compile(r"[^\w\s\u0600-\u06FF]")
+
+
+def normalize_cin(value: str) -> Optional[str]:
+    """
+    ``value`` in canonical form (upper case, no whitespace) if it is a valid CIN, else None.
+    """
+    cin = "".join(value.split()).upper()
+    return cin if cin.isascii() and CIN_FORMAT.match(cin) else None
+
+
+class FieldMatch(NamedTuple):
+    value: str
+    start: int  # offsets in the input text: of the match for the CIN,
+    end: int  # of the source line for the names and the birth date
+
+
+class FieldExtractor:
+    def __init__(self, valid_years: Tuple[int, int] = VALID_YEAR_RANGE):
+        self.valid_years = valid_years
+
+    def _is_valid_date(self, day: str, month: str, year: str) -> bool:
+        try:
+            day, month, year = int(day), int(month), int(year)
+        except ValueError:
+            return False
+        return self.valid_years[0] <= year <= self.valid_years[1] and 1 <= month <= 12 and 1 <= day <= 31
+
+    @staticmethod
+    def _cin(line: str, pattern: "re.Pattern") -> Optional[Tuple[str, int, int]]:
+        for match in pattern.finditer(line):
+            cin = match.group(0).replace(" ", "").upper()
+            if CIN_FORMAT.match(cin):
+                return cin, match.start(), match.end()
+        return None
+
+    def _date(self, line: str) -> Optional[str]:
+        line = " ".join(line.split()).lower()
+        for pattern in DATE_PATTERNS:
+            for match in pattern.finditer(line):
+                day, month, year = match.groups()
+                day, month = day.zfill(2), month.zfill(2)
+                if self._is_valid_date(day, month, year):
+                    return f"{day}/{month}/{year}"
+        return None
+
+    def _fallback_date(self, line: str) -> Optional[str]:
+        # Three numbers in a row that form a valid date, separators ignored
+        numbers = NUMBER.findall(line)
+        for i in range(len(numbers) - 2):
+            day, month, year = numbers[i:i + 3]
+            if len(year) == 4 and self._is_valid_date(day, month, year):
+                return f"{day.zfill(2)}/{month.zfill(2)}/{year}"
+        return None
+
+    @staticmethod
+    def _names(line: str) -> Optional[Tuple[str, str]]:
+        words = NAME_JUNK.sub("", line).split()
+        if len(words) >= 2 and all(word.isalpha() for word in words):
+            return " ".join(words[1:]), words[0]
+        return None
+
+    def extract(self, text: str) -> Dict[str, Optional[FieldMatch]]:
+        """
+        Extract the CIN, name, first name and birth date from OCR text.
+
+        Returns a ``FieldMatch`` (value and position) or None for each field.
+        """
+        cin_candidates = [None] * len(CIN_PATTERNS)
+        names = birth_date = fallback_date = None
+        offset = 0
+
+        for line in text.split("\n"):
+            start, offset = offset, offset + len(line) + 1
+
+            if DIGIT.search(line) is None:
+                if names is None:
+                    stripped = line.strip()
+                    if len(stripped) >= 2:
+                        found = self._names(stripped)
+                        if found:
+                            names = (found, start, start + len(line))
+                continue
+
+            if cin_candidates[0] is None:
+                for priority, pattern in enumerate(CIN_PATTERNS):
+                    if cin_candidates[priority] is None:
+                        found = self._cin(line, pattern)
+                        if found:
+                            cin, s, e = found
+                            cin_candidates[priority] = FieldMatch(cin, start + s, start + e)
+
+            if birth_date is None and YEAR.search(line):
+                found = self._date(line)
+                if found:
+                    birth_date = FieldMatch(found, start, start + len(line))
+                elif fallback_date is None:
+                    found = self._fallback_date(line)
+                    if found:
+                        fallback_date = FieldMatch(found, start, start + len(line))
+
+        cin = next((c for c in cin_candidates if c is not None), None)
+        name = first_name = None
+        if names:
+            (name_value, first_name_value), s, e = names
+            name, first_name = FieldMatch(name_value, s, e), FieldMatch(first_name_value, s, e)
+        return {
+            "cin": cin,
+            "name": name,
+            "first_name": first_name,
+            "birth_date": birth_date or fallback_date,
+        }
+
+    def extract_values(self, text: str) -> Dict[str, Optional[str]]:
+        return {field: match.value if match else None for field, match in self.extract(text).items()}
+
+
+extractor = FieldExtractor()
+
+
+def extract_fields(text: str) -> Dict[str, Optional[str]]:
+    """
+    Field values (CIN, name, first name, birth date) found in ``text``.
+    """
+    return extractor.extract_values(text)
+
+
+# ``text_source`` of an OCR service response whose raw text is full-page OCR text
+FULL_PAGE = "full"
+
+
+def complete_fields(ocr_data: dict, names: Sequence[str]) -> Dict[str, Optional[str]]:
+    """
+    Fields ``names`` of an OCR service response, the missing ones filled in from
+    its raw text only when that is full-page OCR text (``text_source`` "full").
+    The field-zone text is "field: value" lines and the MRZ text is not the card's
+    text: the extractor would take their labels for names.
+    """
+    fields = {field: ocr_data.get(field) for field in names}
+    if not all(fields.values()) and ocr_data.get("raw_text") and ocr_data.get("text_source") == FULL_PAGE:
+        extracted = extract_fields(ocr_data["raw_text"])
+        fields = {field: value or extracted.get(field) for field, value in fields.items()}
+    return fields
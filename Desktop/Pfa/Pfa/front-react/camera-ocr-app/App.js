@@ -5,6 +5,9 @@ import * as ImagePicker from 'expo-image-picker';
 import axios from 'axios';
 
 const API_URL = 'http://192.168.11.106:8000/process/'; 
+// Scan en direct : flux d'images réduites, le serveur ne lit que les plus nettes
+const STREAM_URL = 'ws://192.168.11.106:8000/process/stream';
+const STREAM_PICTURE_WIDTH = 1280; // images du flux d'environ cette largeur, pas la pleine résolution
 
 export default function App() {
   const [hasPermission, setHasPermission] = useState(null);
@@ -12,7 +15,11 @@ export default function App() {
   const [capturedImage, setCapturedImage] = useState(null);
   const [processing, setProcessing] = useState(false);
   const [result, setResult] = useState(null);
+  const [streamStatus, setStreamStatus] = useState(null);
+  const [pictureSize, setPictureSize] = useState(undefined);
   const cameraRef = useRef(null);
+  const streamRef = useRef(null);
+  const lastFrameRef = useRef(null);
   
   const windowHeight = Dimensions.get('window').height;
   const windowWidth = Dimensions.get('window').width;
@@ -49,6 +56,24 @@ export default function App() {
     }
   };
 
+  const showResult = (data) => {
+    if (data.valid) {
+      setResult({
+        valid: true,
+        cin: data.cin,
+        name: data.name,        // Vérification de la structure des données ici
+        surname: data.first_name, // Vérification ici aussi
+        birthDate: data.birth_date,
+        message: 'CIN Validé avec succès!',
+      });
+    } else {
+      setResult({
+        valid: false,
+        message: data.message || 'CIN Invalide',
+      });
+    }
+  };
+
   const processImage = async (uri) => {
     setProcessing(true);
     try {
@@ -65,21 +90,7 @@ export default function App() {
         },
       });
 
-      if (response.data.valid) {
-        setResult({
-          valid: true,
-          cin: response.data.cin,
-          name: response.data.name,        // Vérification de la structure des données ici
-          surname: response.data.first_name, // Vérification ici aussi
-          birthDate: response.data.birth_date,
-          message: 'CIN Validé avec succès!',
-        });
-      } else {
-        setResult({
-          valid: false,
-          message: response.data.message || 'CIN Invalide',
-        });
-      }
+      showResult(response.data);
     } catch (error) {
       console.error('Erreur lors du traitement:', error);
       setResult({ error: 'Erreur lors du traitement de l\'image' });
@@ -88,6 +99,66 @@ export default function App() {
     }
   };
 
+  // Le serveur renvoie un message par image (carte détectée, netteté), un par lecture
+  // OCR, puis le résultat une fois le CIN, le nom et la date de naissance stables
+  const startStream = async () => {
+    if (!cameraRef.current || streamRef.current) return;
+    // Plus petite taille de photo d'au moins STREAM_PICTURE_WIDTH pixels de large
+    const sizes = await cameraRef.current.getAvailablePictureSizesAsync('4:3').catch(() => []);
+    const widths = sizes.map((size) => [size, parseInt(size.split('x')[0], 10)])
+      .filter(([, width]) => width >= STREAM_PICTURE_WIDTH).sort((a, b) => a[1] - b[1]);
+    if (widths.length) setPictureSize(widths[0][0]);
+
+    const ws = new WebSocket(STREAM_URL);
+    streamRef.current = ws;
+    setStreamStatus('Cadrez la carte...');
+
+    ws.onopen = async () => {
+      while (streamRef.current === ws && ws.readyState === WebSocket.OPEN && cameraRef.current) {
+        try {
+          const frame = await cameraRef.current.takePictureAsync({ quality: 0.4, base64: true, skipProcessing: true });
+          lastFrameRef.current = frame.uri;
+          if (ws.readyState === WebSocket.OPEN) ws.send(JSON.stringify({ frame: frame.base64 }));
+        } catch (error) {
+          console.error('Erreur lors de la capture:', error);
+          break;
+        }
+      }
+    };
+    ws.onmessage = (event) => {
+      const message = JSON.parse(event.data);
+      if (message.type === 'frame') {
+        setStreamStatus(!message.card ? 'Carte non détectée' : message.accepted ? 'Lecture...' : 'Image floue, ne bougez pas');
+      } else if (message.type === 'ocr' && message.stable) {
+        setStreamStatus(`Lecture... (${message.stable.length} champ(s) confirmé(s))`);
+      } else if (message.type === 'result' || message.type === 'error') {
+        stopStream();
+        setCapturedImage(lastFrameRef.current);
+        if (message.type === 'error') {
+          setResult({ error: message.error });
+        } else if (message.status !== 'stable' && !message.valid) {
+          setResult({ valid: false, message: 'Lecture incomplète, réessayez' });
+        } else {
+          showResult(message);
+        }
+      }
+    };
+    ws.onerror = (error) => {
+      console.error('Erreur du flux:', error.message);
+      stopStream();
+      setResult({ error: 'Erreur lors du traitement de l\'image' });
+      setCapturedImage(lastFrameRef.current);
+    };
+  };
+
+  const stopStream = () => {
+    const ws = streamRef.current;
+    streamRef.current = null;
+    setStreamStatus(null);
+    setPictureSize(undefined);
+    if (ws && ws.readyState === WebSocket.OPEN) ws.close();
+  };
+
   const resetCapture = () => {
     setCapturedImage(null);
     setResult(null);
@@ -107,9 +178,10 @@ export default function App() {
       </View>
 
       {!capturedImage ? (
-        <Camera style={[styles.camera, { height: windowHeight - 100 }]} type={type} ref={cameraRef}>
+        <Camera style={[styles.camera, { height: windowHeight - 100 }]} type={type} ref={cameraRef} pictureSize={pictureSize}>
           <View style={styles.overlay}>
             <View style={styles.frame} />
+            {streamStatus && <Text style={styles.text}>{streamStatus}</Text>}
           </View>
           <View style={styles.buttonContainer}>
             <TouchableOpacity style={styles.button} onPress={takePicture}>
@@ -118,6 +190,9 @@ export default function App() {
             <TouchableOpacity style={styles.button} onPress={pickImage}>
               <Text style={styles.text}>Choisir Image</Text>
             </TouchableOpacity>
+            <TouchableOpacity style={styles.button} onPress={streamStatus ? stopStream : startStream}>
+              <Text style={styles.text}>{streamStatus ? 'Arrêter' : 'Scan en direct'}</Text>
+            </TouchableOpacity>
           </View>
         </Camera>
       ) : (
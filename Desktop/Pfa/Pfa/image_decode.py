@@ -0,0 +1,121 @@
+"""
+Upload decoding straight to a grayscale array of the size the pipeline needs.
+
+Decoding through PIL produced a full-resolution RGB(A) array, followed by another
+full-size buffer for the grayscale conversion. Here the upload bytes are wrapped
+without a copy, the image header is checked against a byte and pixel budget
+before anything is decoded, and OpenCV decodes directly to grayscale. Oversized
+photos are decoded at 1/2, 1/4 or 1/8 scale (done inside the JPEG decoder for
+JPEGs), never below the side the preprocessing would resize them to anyway.
+"""
+import io
+import os
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+from fastapi import UploadFile
+from PIL import Image
+
+
+class DecodeConfig:
+    MAX_UPLOAD_BYTES = int(os.getenv("OCR_MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+    MAX_PIXELS = int(os.getenv("OCR_MAX_PIXELS", str(40_000_000)))
+    TARGET_SIDE = int(os.getenv("OCR_DECODE_TARGET_SIDE", "2000"))  # long side kept at least this large
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+# Reduction factor -> imdecode flag, largest first
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+)
+
+
+async def read_upload(upload: UploadFile, max_bytes: Optional[int] = None) -> bytes:
+    """
+    Read an upload into a single buffer, refusing it before reading when the
+    declared size is over budget. Raises ``ImageTooLarge``.
+    """
+    max_bytes = max_bytes or DecodeConfig.MAX_UPLOAD_BYTES
+    if upload.size is not None and upload.size > max_bytes:
+        raise ImageTooLarge(f"Upload of {upload.size} bytes exceeds {max_bytes} bytes")
+    data = await upload.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise ImageTooLarge(f"Upload exceeds {max_bytes} bytes")
+    return data
+
+
+def probe(data: bytes) -> Tuple[int, int, bool]:
+    """
+    Width, height and whether the image has an alpha channel, read from the image
+    header without decoding the pixels.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+            return image.width, image.height, has_alpha
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError(f"Unreadable image: {e}")
+
+
+def _decode_with_pil(data: bytes, size: Tuple[int, int]) -> np.ndarray:
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft("L", size)
+        if image.mode in ("RGBA", "LA", "PA", "P"):
+            # Transparent areas become white paper rather than black
+            rgba = image.convert("RGBA")
+            image = Image.alpha_composite(Image.new("RGBA", rgba.size, "white"), rgba)
+        gray = image.convert("L")
+    if gray.size != size:
+        gray = gray.resize(size, Image.Resampling.BOX)
+    return np.asarray(gray)
+
+
+def reduction_for(size: Tuple[int, int], target_side: int) -> int:
+    long_side = max(size)
+    for factor, _ in _REDUCED_FLAGS:
+        if long_side // factor >= target_side:
+            return factor
+    return 1
+
+
+def decoded_pixels(data: bytes, target_side: Optional[int] = None) -> int:
+    """
+    Pixel count of the array ``decode_gray`` would return, from the header only.
+    """
+    width, height, _ = probe(data)
+    factor = reduction_for((width, height), target_side or DecodeConfig.TARGET_SIDE)
+    return max(1, width // factor) * max(1, height // factor)
+
+
+def decode_gray(data: bytes, target_side: Optional[int] = None,
+                max_bytes: Optional[int] = None, max_pixels: Optional[int] = None) -> np.ndarray:
+    """
+    Decode image bytes to a uint8 grayscale array, reduced by a power of two while
+    the long side stays at least ``target_side``.
+
+    Raises ``ImageTooLarge`` when the bytes or the header's pixel count exceed the
+    budget, ``ValueError`` when the image cannot be decoded.
+    """
+    max_bytes = max_bytes or DecodeConfig.MAX_UPLOAD_BYTES
+    max_pixels = max_pixels or DecodeConfig.MAX_PIXELS
+    if len(data) > max_bytes:
+        raise ImageTooLarge(f"Image of {len(data)} bytes exceeds {max_bytes} bytes")
+    width, height, has_alpha = probe(data)
+    if width * height > max_pixels:
+        raise ImageTooLarge(f"Image of {width}x{height} pixels exceeds {max_pixels} pixels")
+
+    factor = reduction_for((width, height), target_side or DecodeConfig.TARGET_SIDE)
+    gray = None
+    if not has_alpha:
+        flag = dict(_REDUCED_FLAGS).get(factor, cv2.IMREAD_GRAYSCALE)
+        gray = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flag)
+    if gray is None:
+        # Transparent images, and formats OpenCV was built without
+        gray = _decode_with_pil(data, (max(1, width // factor), max(1, height // factor)))
+    return gray
@@ -0,0 +1,163 @@
+"""
+Non-blocking, structured logging for the services.
+
+``logging.basicConfig`` writes each record to the stream from the thread that
+logs it, so every log call on the request path pays for formatting (including
+tracebacks) and for the write. Here the service's handler only puts the record
+on a bounded queue; a background ``QueueListener`` thread formats it as one
+compact JSON line and writes it. When the queue is full the record is dropped
+and counted rather than making the request wait.
+
+OCR text is personal data (CIN, names, birth date) and is large: it is only
+attached to a record through ``sample_text``, which keeps a ``LOG_TEXT_SAMPLE_RATE``
+share of texts, redacts the identifiers and truncates the rest.
+
+    log_pipeline.setup("ocr")
+    logger.info("ocr done", extra=log_pipeline.fields(passes=["raw"], text=log_pipeline.sample_text(text)))
+"""
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+from collections import Counter
+from typing import Any, Dict, Optional
+
+
+class LogConfig:
+    FORMAT = os.getenv("LOG_FORMAT", "json")  # json | text
+    LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    FILE = os.getenv("LOG_FILE")  # unset: standard error
+    QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    TEXT_SAMPLE_RATE = float(os.getenv("LOG_TEXT_SAMPLE_RATE", "0.01"))  # share of OCR texts logged
+    TEXT_MAX_CHARS = int(os.getenv("LOG_TEXT_MAX_CHARS", "300"))
+
+
+# Printed card labels, left readable in sampled texts; any other word, in any case
+# (OCR output is not reliably capitalized), may be a name or a place
+CARD_WORDS = {"ROYAUME", "DU", "MAROC", "CARTE", "NATIONALE", "D'IDENTITE", "IDENTITE", "NE", "LE",
+              "VALABLE", "JUSQU'AU", "FILS", "FILLE", "DE", "ADRESSE", "SEXE", "ETAT", "CIVIL"}
+# Same shape as card_layout.CIN_PATTERN, without importing OpenCV into every service
+_CIN = re.compile(r"\b[A-Z]{1,2}\d{5,6}\b", re.IGNORECASE)
+_DATE = re.compile(r"\b\d{1,2}[./-]\d{1,2}[./-]\d{2,4}\b")
+_WORD = re.compile(r"[A-Za-zÀ-ÿ'][A-Za-zÀ-ÿ'-]{2,}")
+# Attributes of every LogRecord, so that only the ``extra`` ones are serialized
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+counters: Counter = Counter()
+_listener: Optional[logging.handlers.QueueListener] = None
+_output: Optional[logging.Handler] = None
+_queue: Optional[queue.Queue] = None
+_lock = threading.Lock()
+
+
+def fields(**values: Any) -> Dict[str, Any]:
+    """
+    ``extra`` argument for a log call: the values become keys of the JSON record.
+    """
+    return values
+
+
+def redact(text: str) -> str:
+    """
+    ``text`` with CINs, dates and words other than card labels masked, whatever
+    their case, e.g. ``AB123456`` -> ``AB******``, ``alami`` -> ``a****``.
+    """
+    text = _CIN.sub(lambda match: re.sub(r"\d", "*", match.group(0)), text)
+    text = _DATE.sub(lambda match: re.sub(r"\d", "*", match.group(0)), text)
+    return _WORD.sub(lambda match: match.group(0) if match.group(0).upper() in CARD_WORDS
+                     else match.group(0)[0] + "*" * (len(match.group(0)) - 1), text)
+
+
+def sample_text(text: Optional[str]) -> Optional[str]:
+    """
+    Redacted, truncated ``text`` for ``LOG_TEXT_SAMPLE_RATE`` of the calls, else None.
+    """
+    if not text or random.random() >= LogConfig.TEXT_SAMPLE_RATE:
+        return None
+    counters["texts_sampled"] += 1
+    text = redact(" ".join(text.split()))
+    return text if len(text) <= LogConfig.TEXT_MAX_CHARS else text[:LogConfig.TEXT_MAX_CHARS] + "..."
+
+
+class JSONFormatter(logging.Formatter):
+    def __init__(self, service: str):
+        super().__init__()
+        self.service = service
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "service": self.service,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items()
+                     if key not in _RECORD_ATTRIBUTES and value is not None)
+        if record.exc_info:
+            entry["error"] = f"{record.exc_info[0].__name__}: {record.exc_info[1]}"
+            entry["traceback"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str, separators=(",", ":"))
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The listener runs in this process: the record is formatted there, not here
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+            counters["enqueued"] += 1
+        except queue.Full:
+            counters["dropped"] += 1
+
+
+def setup(service: str) -> None:
+    """
+    Route the root logger through the queue to the background writer. Only the
+    first call configures logging (the services of a monolith share it).
+    """
+    global _listener, _output, _queue
+    with _lock:
+        if _output is not None:
+            return
+        if LogConfig.FILE:
+            _output = logging.FileHandler(LogConfig.FILE, encoding="utf-8")
+        else:
+            _output = logging.StreamHandler(sys.stderr)
+        _output.setFormatter(JSONFormatter(service) if LogConfig.FORMAT == "json"
+                             else logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        _queue = queue.Queue(LogConfig.QUEUE_SIZE)
+        root = logging.getLogger()
+        root.handlers = [_QueueHandler(_queue)]
+        root.setLevel(LogConfig.LEVEL)
+        _listener = logging.handlers.QueueListener(_queue, _output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown)
+
+
+def shutdown() -> None:
+    """
+    Write the records still queued and stop the writer thread. Records logged
+    afterwards (e.g. by the other services of a monolith) are written directly.
+    """
+    global _listener
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        _listener = None
+        logging.getLogger().handlers = [_output]
+
+
+def stats() -> Dict[str, int]:
+    return {**counters, "queue_depth": _queue.qsize() if _queue is not None else 0,
+            "queue_capacity": LogConfig.QUEUE_SIZE}
@@ -1,40 +1,297 @@
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import JSONResponse
-import re
-import requests
+from fastapi import FastAPI, File, Form, UploadFile, WebSocket
+from fastapi.responses import JSONResponse, StreamingResponse
+import asyncio
+import httpx
+import json
 from datetime import datetime
+from typing import List, Optional
+
+import field_extraction
+import log_pipeline
+import metrics
+from admission import AdmissionConfig
+from backend_pool import BackendPool, urls_from_env
+from batch import ndjson_line
+from http_client import HttpConfig, close_client, get_client
+from jobs import InvalidCallback, JobQueue, QueueFull
+from readiness import Readiness, add_ready_route
+
+# Optional WebSocket client, to relay camera-frame streams to the OCR service
+try:
+    import websockets
+except ImportError:
+    websockets = None
 
 app = FastAPI()
+metrics.instrument(app, "gateway")
+log_pipeline.setup("gateway")
+
+# One or more instances of each service (comma-separated base URLs, adjust to your
+# setup): every request goes to the least-loaded healthy one (see backend_pool)
+ocr_backends = BackendPool("ocr", urls_from_env("OCR_BACKENDS", "http://192.168.11.106:8003"))
+# Registration writes: never hedged
+registration_backends = BackendPool("registration", urls_from_env("REGISTRATION_BACKENDS", "http://192.168.11.106:8004"),
+                                    hedge_after="")
+
+readiness = Readiness("gateway")
+add_ready_route(app, readiness)
+
+@app.on_event("startup")
+async def startup():
+    # One shared client so keep-alive connections are reused across uploads
+    get_client()
+    # Active health checks of the backends, in the background
+    ocr_backends.start()
+    registration_backends.start()
+    await job_queue.start()
+    readiness.set_ready()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await job_queue.stop()
+    await ocr_backends.stop()
+    await registration_backends.stop()
+    await close_client()
+    log_pipeline.shutdown()
 
-OCR_SERVICE_URL = "http://192.168.11.106:8003/ocr/"
-REGISTRATION_SERVICE_URL = "http://192.168.11.106:8004/register/"  # Adjust based on your setup
+@app.get("/backends/stats")
+def backend_stats():
+    """
+    OCR and registration instances: availability, requests in flight, failures,
+    ejections and hedged requests.
+    """
+    return {"ocr": ocr_backends.stats(), "registration": registration_backends.stats()}
+
+class ProcessingError(Exception):
+    """
+    A failed processing step, with the HTTP status to return to the client.
+    """
+
+    def __init__(self, message: str, status_code: int = 500):
+        super().__init__(message)
+        self.status_code = status_code
+
+async def process_card(content: bytes, content_type: str) -> dict:
+    """
+    OCR then registration for an image already read. Raises ProcessingError.
+    """
+    # Ask the OCR service for its own stage timings when the client asked for ours
+    timing_headers = {metrics.MetricsConfig.TIMINGS_HEADER: "1"} if metrics.timings_requested() else {}
+    try:
+        # The OCR service refuses at once (503) what it could not process before
+        # our read timeout expires
+        with metrics.timed("gateway", "ocr_call"):
+            ocr_response = await ocr_backends.post(
+                "/ocr/",
+                files={"file": ("id_card.jpg", content, content_type)},
+                headers={AdmissionConfig.TIMEOUT_HEADER: str(HttpConfig.READ_TIMEOUT), **timing_headers}
+            )
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 503:
+            raise ProcessingError("OCR service overloaded, retry later.", status_code=503)
+        if e.response.status_code == 413:
+            raise ProcessingError("Image too large for the OCR service.", status_code=413)
+        raise ProcessingError(f"OCR service failed: {str(e)}")
+    except httpx.HTTPError as e:
+        raise ProcessingError(f"OCR service failed: {str(e)}")
+    metrics.merge_server_timing(ocr_response.headers.get("Server-Timing"), "ocr.")
+
+    try:
+        ocr_data = ocr_response.json()
+    except ValueError:
+        raise ProcessingError("Failed to parse OCR response.")
+
+    try:
+        return await register_identity(ocr_data)
+    except httpx.HTTPError as e:
+        raise ProcessingError(f"Registration service failed: {str(e)}")
 
 @app.post("/process/")
 async def process_id_card(file: UploadFile = File(...)):
     if file.content_type not in ["image/jpeg", "image/png"]:
         return JSONResponse(content={"error": "Invalid file format. Please upload a JPEG or PNG image."}, status_code=400)
     
+    # Read the upload once so the same bytes can be re-sent on retry
+    content = await file.read()
+    try:
+        return await process_card(content, file.content_type)
+    except ProcessingError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=e.status_code)
+
+async def process_job(payload) -> dict:
+    content, content_type = payload
+    return await process_card(content, content_type)
+
+# Bounded queue of background cards, drained by a fixed number of workers
+# (job records in memory or on disk, see JOB_STORE)
+job_queue = JobQueue(process_job)
+
+@app.post("/process/jobs", status_code=202)
+async def submit_job(file: UploadFile = File(...), callback_url: Optional[str] = Form(None)):
+    """
+    Queue a card for background OCR and registration: the job ID is returned at
+    once, the outcome is polled at GET /process/jobs/{job_id} or POSTed to
+    callback_url (http(s) on a JOB_CALLBACK_HOSTS host, else 400). A full queue
+    is refused at once (503) with its depth.
+    """
+    if file.content_type not in ["image/jpeg", "image/png"]:
+        return JSONResponse(content={"error": "Invalid file format. Please upload a JPEG or PNG image."}, status_code=400)
+
+    content = await file.read()
     try:
-        ocr_response = requests.post(
-            OCR_SERVICE_URL,
-            files={"file": ("id_card.jpg", file.file, file.content_type)}
+        job = await job_queue.submit((content, file.content_type), callback_url=callback_url)
+    except InvalidCallback as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    except QueueFull as e:
+        return JSONResponse(
+            content={"error": "Job queue full", "queue_depth": e.depth, "queue_capacity": e.capacity},
+            status_code=503,
+            headers={"Retry-After": "1"}
         )
-        ocr_response.raise_for_status()
-    except requests.RequestException as e:
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "poll_url": f"/process/jobs/{job['id']}",
+        "queue_depth": job_queue.depth,
+        "queue_capacity": job_queue.capacity
+    }
+
+@app.get("/process/jobs/stats")
+def job_stats():
+    return job_queue.stats()
+
+@app.get("/process/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await job_queue.get(job_id)
+    if job is None:
+        return JSONResponse(content={"error": "Unknown job"}, status_code=404)
+    return job
+
+@app.post("/process/batch")
+async def process_batch(files: List[UploadFile] = File(...)):
+    """
+    Process many ID cards (images and/or zip archives): the batch goes to the OCR
+    service's /ocr/batch in one request, then each card read is registered as by
+    /process/ and its outcome streamed back as one NDJSON line as soon as it arrives.
+    """
+    uploads = [("files", (f.filename, await f.read(), f.content_type)) for f in files]
+    client = get_client()
+    # The batch counts against its OCR instance until the streamed response ends
+    backend = ocr_backends.pick()
+    start = ocr_backends.acquire(backend)
+    try:
+        ocr_response = await client.send(
+            client.build_request("POST", backend.url + "/ocr/batch", files=uploads), stream=True
+        )
+    except httpx.HTTPError as e:
+        ocr_backends.release(backend, start, e)
         return JSONResponse(content={"error": f"OCR service failed: {str(e)}"}, status_code=500)
+    if ocr_response.is_error:
+        await ocr_response.aread()
+        await ocr_response.aclose()
+        try:
+            ocr_response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            ocr_backends.release(backend, start, e)
+        return JSONResponse(content={"error": f"OCR service failed: {ocr_response.text}"},
+                            status_code=ocr_response.status_code)
+
+    async def generate():
+        total = failed = 0
+        error = None
+        try:
+            async for line in ocr_response.aiter_lines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if "summary" in record:
+                    continue
+                total += 1
+                if record.get("status") == "ok":
+                    try:
+                        record["result"] = await register_identity(record["result"])
+                    except httpx.HTTPError as e:
+                        record.update(status="error", error=f"Registration service failed: {str(e)}")
+                failed += record.get("status") != "ok"
+                yield ndjson_line(record)
+        except httpx.HTTPError as e:
+            error = e
+            yield ndjson_line({"error": f"OCR service failed: {str(e)}"})
+        finally:
+            await ocr_response.aclose()
+            ocr_backends.release(backend, start, error)
+        yield ndjson_line({"summary": {"total": total, "ok": total - failed, "failed": failed}})
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
 
+@app.websocket("/process/stream")
+async def process_stream(websocket: WebSocket):
+    """
+    Stream of camera frames, relayed to the OCR service's /ocr/stream (see
+    frame_stream): its per-frame and per-OCR messages are passed through, then the
+    voted fields are registered as by /process/ and the outcome is sent last.
+    """
+    await websocket.accept()
+    if websockets is None:
+        await websocket.send_json({"type": "error", "error": "Streaming needs the 'websockets' package on the gateway."})
+        await websocket.close(code=1011)
+        return
     try:
-        ocr_data = ocr_response.json()
-        extracted_text = ocr_data.get("text", "")
-    except ValueError:
-        return JSONResponse(content={"error": "Failed to parse OCR response."}, status_code=500)
+        result = await relay_stream(websocket)
+    except (OSError, websockets.WebSocketException) as e:
+        await websocket.send_json({"type": "error", "error": f"OCR service failed: {str(e)}"})
+        await websocket.close(code=1011)
+        return
+    if result is None:
+        return  # the client disconnected
 
-    # Extract CIN, name, and first name from the text
-    cin = extract_cin(extracted_text)
-    name, first_name = extract_name_and_first_name(extracted_text)
+    try:
+        result.update(await register_identity(result["fields"]))
+    except httpx.HTTPError as e:
+        result["registration_error"] = f"Registration service failed: {str(e)}"
+    await websocket.send_json(result)
+    await websocket.close()
+
+async def relay_stream(websocket: WebSocket) -> Optional[dict]:
+    """
+    Forward the client's frames to the OCR service and its messages back, until the
+    OCR service sends its result message, which is returned (None when the client
+    disconnected).
+    """
+    backend = ocr_backends.pick()
+    with ocr_backends.use(backend):
+        async with websockets.connect(backend.url.replace("http", "ws", 1) + "/ocr/stream", max_size=None) as upstream:
+            async def forward_frames():
+                while True:
+                    message = await websocket.receive()
+                    if message["type"] == "websocket.disconnect":
+                        await upstream.close()
+                        return
+                    await upstream.send(message["bytes"] if message.get("bytes") is not None else message["text"])
+
+            forwarding = asyncio.ensure_future(forward_frames())
+            try:
+                async for message in upstream:
+                    event = json.loads(message)
+                    if event.get("type") == "result":
+                        return event
+                    await websocket.send_json(event)
+            finally:
+                forwarding.cancel()
+    return None
 
-    # Extract Birth Date (make sure this part of the code extracts a valid date)
-    birth_date = extract_birth_date(extracted_text)
+async def register_identity(ocr_data: dict) -> dict:
+    """
+    Complete the fields returned by the OCR service, check the required ones and
+    register the identity. Raises httpx.HTTPError when registration fails.
+    """
+    # The OCR service returns the extracted fields; its raw text only fills in missing
+    # ones, and only when it is full-page OCR text (not the field zones' "field: value"
+    # lines nor the MRZ)
+    with metrics.timed("gateway", "extract"):
+        fields = field_extraction.complete_fields(ocr_data, ("cin", "name", "first_name", "birth_date"))
+    cin, name, first_name = fields["cin"], fields["name"], fields["first_name"]
+    birth_date = fields["birth_date"]
 
     if not cin:
         return {"valid": False, "message": "CIN not found in the text"}
@@ -51,8 +308,9 @@ async def process_id_card(file: UploadFile = File(...)):
         "birth_date": birth_date
     }
 
-    # Register the identity
-    register_identity(registration_data)
+    # Register the identity (safe to retry: registration is idempotent on the CIN)
+    with metrics.timed("gateway", "register_call"):
+        await registration_backends.post("/register/", json=registration_data)
 
     return {
         "valid": True,
@@ -62,30 +320,3 @@ async def process_id_card(file: UploadFile = File(...)):
         "birth_date": birth_date,
         "message": "Identity processed and registration attempted."
     }
-
-def extract_cin(text: str) -> str:
-    pattern = r"[A-Z]{3} \d{6}"  # Format CIN: 3 letters followed by 6 digits
-    match = re.search(pattern, text)
-    if match:
-        return match.group(0)
-    return None
-
-def extract_name_and_first_name(text: str) -> tuple:
-    name_pattern = r"Nom\s*[:\-]?\s*([A-Za-zÀ-ÿéèôîûç]+)"
-    first_name_pattern = r"Prénom\s*[:\-]?\s*([A-Za-zÀ-ÿéèôîûç]+)"
-    
-    name_match = re.search(name_pattern, text)
-    first_name_match = re.search(first_name_pattern, text)
-    
-    name = name_match.group(1) if name_match else None
-    first_name = first_name_match.group(1) if first_name_match else None
-    
-    return name, first_name
-
-def extract_birth_date(text: str) -> str:
-    # Example: Extract birth date in the format 'DD/MM/YYYY'
-    birth_date_pattern = r"\b\d{2}/\d{2}/\d{4}\b"
-    match = re.search(birth_date_pattern, text)
-    if match:
-        return match.group(0)
-    return None
@@ -0,0 +1,217 @@
+"""
+Metrics for the services: per-stage latency histograms, request counters and
+in-flight gauges, served on ``/metrics`` in the Prometheus text format.
+
+The three metric types needed are kept here rather than pulling in a client
+library. Values are per process: with several uvicorn workers, scrape each one.
+
+A request sent with ``X-Debug-Timings: 1`` also gets its own breakdown back in a
+``Server-Timing`` response header (milliseconds per stage), e.g. to see where the
+time went for one slow card.
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
+
+
+class MetricsConfig:
+    BUCKETS = tuple(float(b) for b in os.getenv(
+        "METRICS_BUCKETS", "0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30").split(","))
+    TIMINGS_HEADER = "X-Debug-Timings"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+                    for labels, value in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Optional[Sequence[float]] = None):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets or MetricsConfig.BUCKETS))
+        # Per label set: count per bucket (plus +Inf), sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for labels, (counts, total) in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = 'le="+Inf"' if bound == float("inf") else f'le="{_number(bound)}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total[0]!r}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "idscanner_stage_duration_seconds", "Time spent in one pipeline stage.", ("service", "stage")))
+REQUESTS = REGISTRY.register(Counter(
+    "idscanner_http_requests_total", "HTTP requests handled.", ("service", "method", "route", "status")))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "idscanner_http_request_duration_seconds", "HTTP request latency until the response starts.",
+    ("service", "route")))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    "idscanner_http_requests_in_flight", "HTTP requests being handled.", ("service",)))
+
+# Stage durations (ms) of the current request, when it asked for a breakdown
+_breakdown: ContextVar[Optional[Dict[str, float]]] = ContextVar("timings_breakdown", default=None)
+
+
+def observe_stage(service: str, stage: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(seconds, service, stage)
+    timings = _breakdown.get()
+    if timings is not None:
+        # A stage run several times (e.g. OCR passes) is summed
+        timings[stage] = round(timings.get(stage, 0.0) + seconds * 1000, 2)
+
+
+@contextmanager
+def timed(service: str, stage: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(service, stage, time.perf_counter() - start)
+
+
+def timings_requested() -> bool:
+    return _breakdown.get() is not None
+
+
+def server_timing(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{stage};dur={ms}" for stage, ms in timings.items())
+
+
+def merge_server_timing(header: Optional[str], prefix: str) -> None:
+    """
+    Add a downstream service's ``Server-Timing`` breakdown to the current request's,
+    each stage name prefixed with ``prefix``.
+    """
+    timings = _breakdown.get()
+    if timings is None or not header:
+        return
+    for entry in header.split(","):
+        name, _, duration = entry.strip().partition(";dur=")
+        try:
+            timings[prefix + name] = float(duration)
+        except ValueError:
+            continue
+
+
+def instrument(app: FastAPI, service: str) -> None:
+    """
+    Count and time every request to ``app`` and serve ``GET /metrics``.
+    """
+    @app.middleware("http")
+    async def record_request(request: Request, call_next):
+        token = _breakdown.set({} if request.headers.get(MetricsConfig.TIMINGS_HEADER) else None)
+        IN_FLIGHT.inc(service)
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            timings = _breakdown.get()
+            if timings:
+                response.headers["Server-Timing"] = server_timing(timings)
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            IN_FLIGHT.dec(service)
+            route = getattr(request.scope.get("route"), "path", "unmatched")
+            REQUESTS.inc(service, request.method, route, str(status))
+            REQUEST_SECONDS.observe(elapsed, service, route)
+            _breakdown.reset(token)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
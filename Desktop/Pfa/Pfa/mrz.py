@@ -0,0 +1,201 @@
+"""
+Machine-readable zone (MRZ) of the newer Moroccan ID cards.
+
+The back of the card carries an ICAO 9303 TD1 zone: three lines of 30 OCR-B
+characters holding the document number, the CIN, the birth date, the expiry date
+and the names, protected by check digits. The zone is found as the bottom group
+of long, aligned text lines on the rectified card and read in one call restricted
+to ``A-Z0-9<``. A result is only returned when every check digit verifies, so
+unlike the front-side heuristics it needs no fallback scanning: either the fields
+are certain or the caller goes on with the other paths.
+"""
+import datetime
+import os
+import re
+from collections import Counter
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+import card_layout
+import script_router
+import tesseract_pool
+from card_layout import DIGITS, UPPERCASE
+
+
+class MRZConfig:
+    ENABLED = os.getenv("OCR_MRZ", "on") == "on"
+    # A dedicated OCR-B model (e.g. "ocrb" or "mrz") reads the zone better when installed
+    LANG = os.getenv("OCR_MRZ_LANG", "eng")
+    WHITELIST = UPPERCASE + DIGITS + "<"
+    LINE_LENGTH = 30
+    MIN_LINE_WIDTH = 0.5  # fraction of the card width (or of the photo when no card outline is found)
+    MIN_TOP = 0.45  # fraction of the card height; the zone fills the bottom of the back
+    LINE_PITCH = 48  # the band is rescaled to about this many pixels per line
+    PADDING = 0.5  # around the band, in line heights
+    PSM_BLOCK = 6
+
+
+class MRZ(NamedTuple):
+    document_number: str
+    cin: str
+    name: str
+    first_name: Optional[str]
+    birth_date: str  # dd/mm/yyyy, as the other extraction paths return it
+    sex: Optional[str]
+    expiry_date: str
+    nationality: str
+    lines: Tuple[str, str, str]
+
+    def text(self) -> str:
+        return "\n".join(self.lines)
+
+
+counters: Counter = Counter()
+
+# Characters OCR confuses, repaired by the kind of character a position must hold
+_TO_DIGIT = str.maketrans("OQDUIJLZSBGT", "000011125867")
+_TO_LETTER = str.maketrans("0125867", "OIZSBGT")
+_CHAR_VALUES = {char: value for value, char in enumerate(DIGITS + UPPERCASE)}
+
+
+def check_digit(data: str) -> str:
+    """
+    ICAO 9303 check digit of ``data``: weights 7, 3, 1 repeated, modulo 10.
+    """
+    weights = (7, 3, 1)
+    return str(sum(_CHAR_VALUES.get(char, 0) * weights[i % 3] for i, char in enumerate(data)) % 10)
+
+
+def _digits(text: str) -> str:
+    return text.translate(_TO_DIGIT)
+
+
+def _letters(text: str) -> str:
+    return text.translate(_TO_LETTER)
+
+
+def _fit(line: str, length: int = MRZConfig.LINE_LENGTH) -> Optional[str]:
+    # The filler runs are where OCR gains or loses characters; trailing fillers can
+    # be restored without changing any field or check digit (a filler counts as 0)
+    line = line.rstrip("<")
+    return line.ljust(length, "<") if len(line) <= length else None
+
+
+def _fit_line2(line: str) -> Optional[str]:
+    # Line 2 ends with the composite check digit: refit its optional data instead
+    if len(line) < 19:
+        return None
+    optional = _fit(line[18:-1], 11)
+    return line[:18] + optional + line[-1] if optional else None
+
+
+def _date(yymmdd: str, future: bool) -> Optional[str]:
+    """
+    ``dd/mm/yyyy`` of an MRZ date; birth dates are in the past, expiry dates may not be.
+    """
+    if not yymmdd.isdigit():
+        return None
+    year, month, day = int(yymmdd[:2]), int(yymmdd[2:4]), int(yymmdd[4:])
+    today = datetime.date.today()
+    century = 2000 if future or year <= today.year % 100 else 1900
+    try:
+        date = datetime.date(century + year, month, day)
+    except ValueError:
+        return None
+    return date.strftime("%d/%m/%Y")
+
+
+def parse_td1(lines: List[str]) -> Optional[MRZ]:
+    """
+    Fields of a three-line TD1 zone, or None unless every check digit verifies.
+    """
+    if len(lines) != 3:
+        return None
+    line1, line2, line3 = _fit(lines[0]), _fit_line2(lines[1]), _fit(lines[2])
+    if not (line1 and line2 and line3):
+        return None
+
+    line1 = _letters(line1[:5]) + line1[5:14] + _digits(line1[14]) + line1[15:]
+    line2 = (_digits(line2[:7]) + _letters(line2[7]) + _digits(line2[8:15]) + _letters(line2[15:18])
+             + line2[18:29] + _digits(line2[29]))
+    line3 = _letters(line3)
+
+    document_number, optional = line1[5:14], line1[15:30]
+    checks = [
+        (document_number, line1[14]),
+        (line2[0:6], line2[6]),
+        (line2[8:14], line2[14]),
+        (line1[5:30] + line2[0:7] + line2[8:15] + line2[18:29], line2[29]),
+    ]
+    if not line1.startswith(("I", "A", "C")) or any(check_digit(data) != digit for data, digit in checks):
+        return None
+
+    # The CIN is carried in the optional data, else it is the document number itself
+    cin = next((match.group(0) for match in (card_layout.CIN_PATTERN.fullmatch(value.strip("<"))
+                                             for value in (optional, document_number)) if match), None)
+    birth_date, expiry_date = _date(line2[0:6], future=False), _date(line2[8:14], future=True)
+    surname, _, given_names = line3.partition("<<")
+    name = " ".join(surname.split("<"))
+    if not cin or not birth_date or not expiry_date or not re.fullmatch(r"[A-Z ]+", name or "-"):
+        return None
+    return MRZ(document_number.strip("<"), cin, name, " ".join(given_names.replace("<", " ").split()) or None,
+               birth_date, line2[7] if line2[7] in "MF" else None, expiry_date, line2[15:18],
+               (line1, line2, line3))
+
+
+def find_band(card: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+    """
+    ``(left, top, width, height)`` of the MRZ lines on the rectified ``card``, or
+    None when its bottom does not end with three long, aligned lines.
+    """
+    height, width = card.shape[:2]
+    lines = [line for line in script_router.find_lines(card)
+             if line.width >= MRZConfig.MIN_LINE_WIDTH * width and line.top >= MRZConfig.MIN_TOP * height]
+    group: List[script_router.TextLine] = []
+    for line in reversed(lines):  # bottom up
+        if group and (abs(line.left - group[-1].left) > 0.05 * width
+                      or not 0.6 < line.height / group[-1].height < 1.6
+                      or group[-1].top - (line.top + line.height) > 2 * line.height):
+            break
+        group.append(line)
+        if len(group) == 3:
+            break
+    if len(group) != 3:
+        return None
+    left, top = min(line.left for line in group), group[-1].top
+    right = max(line.left + line.width for line in group)
+    return left, top, right - left, group[0].top + group[0].height - top
+
+
+def read_mrz(image: np.ndarray, ocr: Optional[Callable[..., str]] = None) -> Optional[MRZ]:
+    """
+    Rectify the card in ``image``, read its MRZ and return the verified fields, or
+    None when there is no zone (e.g. the front of the card) or it does not verify.
+    """
+    ocr = ocr or tesseract_pool.image_to_string
+    counters["attempts"] += 1
+    card = card_layout.rectify_card(card_layout.to_gray(image))
+    band = find_band(card)
+    if band is None:
+        counters["no_band"] += 1
+        return None
+
+    left, top, width, height = band
+    line_height = height / 3
+    pad = int(MRZConfig.PADDING * line_height)
+    crop = card[max(0, top - pad):top + height + pad, max(0, left - pad):left + width + pad]
+    scale = MRZConfig.LINE_PITCH / max(1.0, line_height)
+    crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC if scale > 1 else cv2.INTER_AREA)
+    _, binary = cv2.threshold(crop, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    text = ocr(binary, lang=MRZConfig.LANG, psm=MRZConfig.PSM_BLOCK, whitelist=MRZConfig.WHITELIST)
+    lines = [re.sub(r"\s", "", line) for line in text.splitlines()]
+    result = parse_td1([line for line in lines if len(line) >= MRZConfig.LINE_LENGTH // 2])
+    counters["verified" if result else "rejected"] += 1
+    return result
+
+
+def stats() -> Dict[str, int]:
+    return dict(counters)
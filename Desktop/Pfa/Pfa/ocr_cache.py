@@ -0,0 +1,213 @@
+"""
+Content-addressed cache for OCR results.
+
+Results are keyed by a hash of the uploaded image bytes plus a fingerprint of the
+pipeline configuration, so a retried upload of the same photo is answered without
+re-running preprocessing and Tesseract. An in-memory LRU tier is always used; an
+on-disk tier (JSON files under ``OCR_CACHE_DIR``) can be added, bounded by size
+and age. Concurrent requests for the same key (and lane) share a single computation.
+"""
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger("ocr_cache")
+
+
+class CacheConfig:
+    MAX_ENTRIES = int(os.getenv("OCR_CACHE_SIZE", "512"))
+    TTL = float(os.getenv("OCR_CACHE_TTL", "3600"))
+    DISK_DIR = os.getenv("OCR_CACHE_DIR")  # unset: no disk tier
+    DISK_MAX_BYTES = int(os.getenv("OCR_CACHE_DISK_MAX_BYTES", str(100 * 1024 * 1024)))
+    DISK_TTL = float(os.getenv("OCR_CACHE_DISK_TTL", "86400"))
+
+
+def make_key(data: bytes, fingerprint: str) -> str:
+    digest = hashlib.sha256(data)
+    digest.update(b"\0" + fingerprint.encode())
+    return digest.hexdigest()
+
+
+class DiskTier:
+    def __init__(self, directory: str, max_bytes: int, ttl: float):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+        self.bytes_used = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                self._remove(path)
+                return None
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, value: Any) -> None:
+        path = self._path(key)
+        payload = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(payload)
+        os.replace(tmp, path)
+        self.bytes_used += len(payload)
+        if self.bytes_used > self.max_bytes:
+            self._prune()
+
+    def _remove(self, path: str) -> None:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            self.bytes_used -= size
+        except OSError:
+            pass
+
+    def _prune(self) -> None:
+        # Drop expired entries, then the oldest ones until under 90% of the budget
+        entries = sorted(
+            (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+            for entry in os.scandir(self.directory) if entry.name.endswith(".json")
+        )
+        now = time.time()
+        self.bytes_used = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            if self.bytes_used <= self.max_bytes * 0.9 and now - mtime <= self.ttl:
+                continue
+            self._remove(path)
+
+
+class _CachedError:
+    """
+    Type and arguments of a cached failure, not the exception itself: raising the
+    same object on every hit would grow its traceback and keep those frames alive.
+    """
+
+    def __init__(self, error: Exception):
+        self.type = type(error)
+        self.args = error.args
+
+    def exception(self) -> Exception:
+        return self.type(*self.args)
+
+
+class OCRCache:
+    """
+    ``cache_errors`` lists exception types that are deterministic for a given image
+    (e.g. "CIN not found"); they are remembered in memory so a retried upload gets
+    the same answer straight away. Other failures are never cached.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None,
+                 disk_dir: Optional[str] = None, cache_errors: Tuple[type, ...] = ()):
+        self.cache_errors = cache_errors
+        self.max_entries = CacheConfig.MAX_ENTRIES if max_entries is None else max_entries
+        self.ttl = CacheConfig.TTL if ttl is None else ttl
+        disk_dir = disk_dir or CacheConfig.DISK_DIR
+        self.disk = DiskTier(disk_dir, CacheConfig.DISK_MAX_BYTES, CacheConfig.DISK_TTL) if disk_dir else None
+        self._memory: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "coalesced_retries": 0,
+                         "evictions": 0}
+
+    def _memory_get(self, key: str) -> Optional[Any]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _memory_put(self, key: str, value: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = (time.monotonic(), value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    async def _compute_and_store(self, key: str, lane: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            if self.disk is not None:
+                value = await asyncio.to_thread(self.disk.get, key)
+                if value is not None:
+                    self.counters["disk_hits"] += 1
+                    self._memory_put(key, value)
+                    return value
+            self.counters["misses"] += 1
+            try:
+                value = await compute()
+            except self.cache_errors as e:
+                self._memory_put(key, _CachedError(e))
+                raise
+            self._memory_put(key, value)
+            if self.disk is not None:
+                try:
+                    await asyncio.to_thread(self.disk.put, key, value)
+                except OSError as e:
+                    logger.warning("Could not write OCR cache entry %s: %s", key, e)
+            return value
+        finally:
+            self._inflight.pop((key, lane), None)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]], lane: str = "",
+                             retry_on: Tuple[type, ...] = ()) -> Any:
+        """
+        Return the cached result for ``key`` or run ``compute`` once to produce it.
+
+        Callers arriving while the same key is being computed in the same ``lane``
+        wait for that computation instead of starting another; lanes keep callers
+        with different admission rules apart. A caller whose joined computation
+        fails with one of ``retry_on`` (a failure specific to the caller that
+        started it, such as its deadline) runs its own instead. Exceptions listed
+        in ``cache_errors`` are cached; all others are not.
+        """
+        while True:
+            value = self._memory_get(key)
+            if value is not None:
+                self.counters["memory_hits"] += 1
+                if isinstance(value, _CachedError):
+                    raise value.exception()
+                return copy.deepcopy(value)
+
+            task = self._inflight.get((key, lane))
+            joined = task is not None
+            if joined:
+                self.counters["coalesced"] += 1
+            else:
+                task = asyncio.ensure_future(self._compute_and_store(key, lane, compute))
+                self._inflight[(key, lane)] = task
+            try:
+                # shield: a client disconnecting must not cancel work others are waiting on
+                return copy.deepcopy(await asyncio.shield(task))
+            except retry_on:
+                if not joined:
+                    raise
+                self.counters["coalesced_retries"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = sum(self.counters[k] for k in ("memory_hits", "disk_hits", "misses", "coalesced"))
+        hits = lookups - self.counters["misses"] - self.counters["coalesced_retries"]
+        return {
+            **self.counters,
+            "hit_ratio": round(hits / lookups, 3) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "in_flight": len(self._inflight),
+            "disk_bytes": self.disk.bytes_used if self.disk is not None else None,
+        }
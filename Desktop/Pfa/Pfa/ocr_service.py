@@ -1,18 +1,50 @@
 import pytesseract
-from fastapi import FastAPI, File, UploadFile
+from fastapi import FastAPI, File, Header, UploadFile, WebSocket
 from fastapi.responses import JSONResponse
 import cv2
 import numpy as np
-from PIL import Image
-import re
-from langdetect import detect
+import asyncio
 import logging
-from typing import Tuple, Optional
+import time
+from collections import Counter
+from typing import Dict, List, Tuple, Optional
 import os
 
+import card_layout
+import field_extraction
+import frame_stream
+import image_decode
+import log_pipeline
+import metrics
+import mrz
+import preprocess_pipeline
+import script_router
+import tesseract_pool
+import word_reocr
+from admission import AdmissionConfig, AdmissionController, Overloaded
+from batch import BatchItem, read_batch, stream_batch
+from cpu_executor import run_stage, stage_executor
+from ocr_cache import OCRCache, make_key
+from readiness import Readiness, add_ready_route
+
 # Configurationer
 class Config:
     TESSERACT_CMD = r"C:\\Program Files\\Tesseract-OCR\\tesseract.exe"
+    OCR_DPI = 300
+    # "roi": OCR the card's field zones first and fall back to full-page OCR only
+    # when the CIN or birth date cannot be read; "full": always full-page OCR
+    FIELD_MODE = os.getenv("OCR_FIELD_MODE", "roi")
+    # Preprocessing: resolution normalization and quality gates for the costly steps
+    MAX_IMAGE_SIDE = int(os.getenv("OCR_MAX_IMAGE_SIDE", "2000"))
+    MIN_IMAGE_SIDE = int(os.getenv("OCR_MIN_IMAGE_SIDE", "1000"))
+    NOISE_THRESHOLD = float(os.getenv("OCR_NOISE_THRESHOLD", "4.0"))  # estimated noise sigma
+    CONTRAST_THRESHOLD = float(os.getenv("OCR_CONTRAST_THRESHOLD", "45.0"))  # grey-level std
+    BRIGHTNESS_RANGE = (70, 190)
+    BLUR_THRESHOLD = 100.0  # variance of the Laplacian
+    # OCR cascade: stop escalating once every required field reaches this word confidence
+    CASCADE_MIN_CONFIDENCE = float(os.getenv("OCR_CASCADE_MIN_CONFIDENCE", "75"))
+    # Load the engines and run a dummy card through the pipeline before /ready turns green
+    WARMUP = os.getenv("OCR_WARMUP", "on") == "on"
     ALLOWED_MIME_TYPES = ["image/png", "image/jpeg"]
     MIN_TEXT_LENGTH = 10
     VALID_YEAR_RANGE = (1900, 2024)
@@ -21,42 +53,185 @@ class Config:
         "MARRAKECH", "AGADIR", "TETOUAN", "OUJDA", "KENITRA", "SALE"
     ]
 
-# Initialize FastAPI and logging
+# Initialize FastAPI and logging (JSON records written by a background thread;
+# OCR text only sampled and redacted, see log_pipeline)
 app = FastAPI(title="Moroccan ID Card OCR Service")
-logging.basicConfig(level=logging.INFO)
+metrics.instrument(app, "ocr")
+log_pipeline.setup("ocr")
 logger = logging.getLogger("ocr_service")
 
 # Set Tesseract path
 pytesseract.pytesseract.tesseract_cmd = Config.TESSERACT_CMD
 
+# Results cache keyed by image content plus every setting that changes the output
+PIPELINE_FINGERPRINT = "|".join(str(value) for value in (
+    "v3", mrz.MRZConfig.ENABLED, mrz.MRZConfig.LANG, script_router.RouterConfig.LATIN_LANG, script_router.RouterConfig.ARABIC_LANG,
+    script_router.RouterConfig.ARABIC_LINES, script_router.RouterConfig.ARABIC_MIN_JOINED,
+    Config.OCR_DPI, Config.FIELD_MODE, Config.MAX_IMAGE_SIDE,
+    Config.MIN_IMAGE_SIDE, Config.NOISE_THRESHOLD, Config.CONTRAST_THRESHOLD, Config.BRIGHTNESS_RANGE,
+))
+# ValueError is raised for unreadable fields, which will not change on a retry of the same image
+ocr_cache = OCRCache(cache_errors=(ValueError,))
+
+# Bounds concurrent pipelines and the decoded pixels they hold; sheds the excess with 503
+admission = AdmissionController()
+
+readiness = Readiness("ocr")
+add_ready_route(app, readiness)
+
+@app.on_event("startup")
+async def startup():
+    if Config.WARMUP:
+        # In the background: /health answers while the engines load
+        app.state.warmup = asyncio.ensure_future(warm_up())
+    else:
+        readiness.set_ready()
+
+@app.on_event("shutdown")
+def shutdown():
+    stage_executor.shutdown()
+    tesseract_pool.close_pools()
+    log_pipeline.shutdown()
+
+# Steps after the quality gates: CLAHE and denoising only run when the image needs them
+ENHANCE_STEPS = (
+    preprocess_pipeline.step("clahe", clip=2.0, tiles=(8, 8)),
+    preprocess_pipeline.step("denoise"),
+    preprocess_pipeline.step("threshold", block_size=11, c=2),
+    preprocess_pipeline.step("close", name="morphology", kernel=(2, 2)),
+)
+# Immerkaer's noise estimation mask
+NOISE_KERNEL = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+
+
 class ImageProcessor:
     @staticmethod
-    def enhance_image(image_np: np.ndarray) -> np.ndarray:
+    def load_image(data: bytes) -> np.ndarray:
+        """
+        Decode uploaded image bytes straight to grayscale, at a reduced scale when
+        the image is larger than the preprocessing would keep anyway.
+        """
+        return image_decode.decode_gray(data, target_side=Config.MAX_IMAGE_SIDE)
+
+    @staticmethod
+    def normalize_resolution(gray: np.ndarray,
+                             pipeline: Optional[preprocess_pipeline.Pipeline] = None) -> Tuple[np.ndarray, float]:
+        """
+        Scale the image so its long side falls within [MIN_IMAGE_SIDE, MAX_IMAGE_SIDE],
+        into one of the ``pipeline``'s buffers when given.
+        """
+        long_side = max(gray.shape[:2])
+        if long_side > Config.MAX_IMAGE_SIDE:
+            scale = Config.MAX_IMAGE_SIDE / long_side
+            interpolation = cv2.INTER_AREA
+        elif long_side < Config.MIN_IMAGE_SIDE:
+            scale = Config.MIN_IMAGE_SIDE / long_side
+            interpolation = cv2.INTER_CUBIC
+        else:
+            return gray, 1.0
+        height, width = gray.shape[:2]
+        shape = (int(round(height * scale)), int(round(width * scale)))
+        dst = pipeline.buffer("resize", shape) if pipeline is not None else None
+        return cv2.resize(gray, None, dst, scale, scale, interpolation), scale
+
+    @staticmethod
+    def measure_quality(gray: np.ndarray, pipeline: Optional[preprocess_pipeline.Pipeline] = None) -> Dict[str, float]:
+        """
+        Cheap quality measures: sharpness, brightness, contrast and noise level.
+        The filter responses go into one of the ``pipeline``'s buffers when given.
+        """
+        scratch = pipeline.buffer("quality", gray.shape, np.float32) if pipeline is not None else None
+        # Immerkaer's fast noise variance estimate
+        response = cv2.filter2D(gray, cv2.CV_32F, NOISE_KERNEL, scratch)[1:-1, 1:-1]
+        noise = float(np.abs(response, out=response).mean() * np.sqrt(np.pi / 2) / 6)
+        mean, std = cv2.meanStdDev(gray)
+        # Variance of the Laplacian, without a float64 copy of the image
+        _, sharpness = cv2.meanStdDev(cv2.Laplacian(gray, cv2.CV_32F, scratch))
+        return {
+            "blur": round(float(sharpness[0][0]) ** 2, 1),
+            "brightness": round(float(mean[0][0]), 1),
+            "contrast": round(float(std[0][0]), 1),
+            "noise": round(noise, 2),
+        }
+
+    @staticmethod
+    def enhance_image_with_report(image_np: np.ndarray) -> Tuple[np.ndarray, dict]:
         """
         Enhanced image preprocessing specifically for Moroccan ID cards.
+
+        The image is first brought to a normalized resolution; CLAHE and
+        denoising, the expensive steps, only run when the measured quality
+        calls for them. Returns the processed image and a report of the
+        quality measures, the steps taken and their timings.
         """
-        # Convert to grayscale
-        gray = cv2.cvtColor(image_np, cv2.COLOR_BGR2GRAY)
-        
+        timings = {}
+        steps = []
+
+        def timed(name, fn, *args, **kwargs):
+            start = time.perf_counter()
+            result = fn(*args, **kwargs)
+            timings[name] = round((time.perf_counter() - start) * 1000, 2)
+            return result
+
+        # Operators and intermediate images are reused across this worker's calls
+        pipeline = preprocess_pipeline.worker_pipeline("enhance", ENHANCE_STEPS)
+
+        # Convert to grayscale (a no-op for images from load_image)
+        gray = timed("grayscale", pipeline.gray, image_np)
+
+        gray, scale = timed("normalize", ImageProcessor.normalize_resolution, gray, pipeline)
+        if scale != 1.0:
+            steps.append("resize")
+
+        quality = timed("quality", ImageProcessor.measure_quality, gray, pipeline)
+        low_contrast = (quality["contrast"] < Config.CONTRAST_THRESHOLD
+                        or not Config.BRIGHTNESS_RANGE[0] <= quality["brightness"] <= Config.BRIGHTNESS_RANGE[1])
+
         # Increase contrast using CLAHE
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        gray = clahe.apply(gray)
-        
+        if low_contrast:
+            steps.append("clahe")
+
         # Denoise the image
-        denoised = cv2.fastNlMeansDenoising(gray)
-        
-        # Apply adaptive thresholding
-        binary = cv2.adaptiveThreshold(
-            denoised, 255, 
-            cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-            cv2.THRESH_BINARY, 11, 2
-        )
-        
-        # Apply morphological operations
-        kernel = np.ones((2,2), np.uint8)
-        processed = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
-        
-        return processed
+        if quality["noise"] > Config.NOISE_THRESHOLD:
+            steps.append("denoise")
+
+        # Then adaptive thresholding and a morphological close, always
+        processed = pipeline.run(gray, only=steps + ["threshold", "morphology"], timings=timings)
+
+        report = {
+            "path": "+".join(steps) or "threshold-only",
+            "scale": round(scale, 3),
+            "blurry": quality["blur"] < Config.BLUR_THRESHOLD,
+            "quality": quality,
+            "timings_ms": timings,
+            "total_ms": round(sum(timings.values()), 2),
+        }
+        return processed, report
+
+    @staticmethod
+    def enhance_image(image_np: np.ndarray) -> np.ndarray:
+        return ImageProcessor.enhance_image_with_report(image_np)[0]
+
+
+class PreprocessStats:
+    """
+    Running totals of the preprocessing paths taken, to see how often the
+    expensive steps are skipped and how much time that saves.
+    """
+    paths: Counter = Counter()
+    total_ms: Dict[str, float] = {}
+
+    @classmethod
+    def record(cls, report: dict) -> None:
+        cls.paths[report["path"]] += 1
+        cls.total_ms[report["path"]] = cls.total_ms.get(report["path"], 0.0) + report["total_ms"]
+
+    @classmethod
+    def summary(cls) -> dict:
+        return {
+            path: {"count": count, "avg_ms": round(cls.total_ms[path] / count, 2)}
+            for path, count in cls.paths.items()
+        }
 
 class TextProcessor:
     @staticmethod
@@ -77,171 +252,255 @@ class TextProcessor:
         
         return "\n".join(cleaned_lines)
 
-    @staticmethod
-    def detect_language_safe(text: str) -> str:
-        """
-        Safer language detection with error handling.
-        """
-        if not text or len(text.strip()) < 3:
-            return "unknown"
-        try:
-            return detect(text)
-        except:
-            return "unknown"
-
-class DataExtractor:
-    @staticmethod
-    def extract_moroccan_cin(text: str) -> Optional[str]:
-        """
-        Extract CIN from text with enhanced pattern matching.
-        """
-        patterns = [
-            r'[A-Z]{1,2}\d{5,6}',  # Standard format
-            r'CIN\s*[A-Z]{1,2}\d{5,6}',  # With CIN prefix
-            r'[A-Z]{1,2}\s*\d{5,6}',  # With space between letters and numbers
-        ]
-        
-        for pattern in patterns:
-            matches = re.finditer(pattern, text, re.IGNORECASE)
-            for match in matches:
-                cin = match.group(0).replace(" ", "").upper()
-                if re.match(r'^[A-Z]{1,2}\d{5,6}$', cin):
-                    return cin
-        
-        return None
+async def process_image(data: bytes) -> dict:
+    """
+    Run the full pipeline on one image: decode, enhance, OCR and field extraction.
+    """
+    # CPU-heavy stages run on the stage executor
+    image_np = await run_stage("decode", ImageProcessor.load_image, data)
 
-    @staticmethod
-    def extract_name_components(text: str) -> Tuple[Optional[str], Optional[str]]:
-        """
-        Extract name components with improved handling of Arabic and French text.
-        """
-        lines = [line.strip() for line in text.split('\n') if line.strip()]
-        name = first_name = None
+    # Newer cards: the machine-readable zone on the back is read alone and verified by
+    # its check digits; when it validates, neither the field zones nor full-page OCR run
+    if mrz.MRZConfig.ENABLED:
+        zone = await run_stage("mrz", mrz.read_mrz, image_np)
+        if zone is not None:
+            logger.info("Fields extracted", extra=log_pipeline.fields(path="mrz"))
+            return {
+                "cin": zone.cin,
+                "name": zone.name,
+                "first_name": zone.first_name,
+                "birth_date": zone.birth_date,
+                "city": None,
+                "raw_text": zone.text(),
+                "text_source": "mrz",
+                "processed_text": None,
+                "ocr_passes": ["mrz"]
+            }
 
-        for line in lines:
-            # Skip lines with digits or that are too short
-            if re.search(r'\d', line) or len(line) < 2:
-                continue
+    if Config.FIELD_MODE == "roi":
+        fields, field_text = await run_stage("roi", card_layout.read_fields, image_np)
+        if fields["cin"] and fields["birth_date"]:
+            logger.info("Fields extracted", extra=log_pipeline.fields(path="roi"))
+            return {
+                "cin": fields["cin"],
+                "name": fields["name"],
+                "first_name": fields["first_name"],
+                "birth_date": fields["birth_date"],
+                "city": fields["city"],
+                "raw_text": field_text,
+                "text_source": "roi",
+                "processed_text": None
+            }
+        logger.info("Field zones incomplete, falling back to full-page OCR")
 
-            # Clean the line
-            cleaned_line = re.sub(r'[^\w\s\u0600-\u06FF]', '', line)
-            words = cleaned_line.split()
+    processed_image, preprocessing = await run_stage(
+        "preprocess", ImageProcessor.enhance_image_with_report, image_np
+    )
+    PreprocessStats.record(preprocessing)
+    for step, ms in preprocessing["timings_ms"].items():
+        metrics.observe_stage("ocr", f"enhance_{step}", ms / 1000)
+    logger.info("Preprocessed", extra=log_pipeline.fields(
+        preprocess_path=preprocessing["path"], preprocess_ms=preprocessing["total_ms"], quality=preprocessing["quality"]))
 
-            # Check for valid name line
-            if len(words) >= 2 and all(word.isalpha() for word in words):
-                if not first_name:
-                    first_name = words[0]
-                    name = " ".join(words[1:])
-                    break
+    # Extract text using pooled Tesseract engines (falls back to pytesseract), one
+    # single-language model per text line (see script_router), escalating through the cascade only while fields are missing or uncertain
+    result = await OCRCascade.run({"processed": processed_image, "raw": image_np})
+    texts = result["texts"]
+    combined_text = "\n".join(texts.values())
+    logger.info("OCR done", extra=log_pipeline.fields(
+        passes=list(texts), confidence=result["confidence"], text=log_pipeline.sample_text(combined_text)))
 
-        return name, first_name
+    cin, name, first_name, birth_date = result["cin"], result["name"], result["first_name"], result["birth_date"]
 
-    @staticmethod
-    def extract_birth_date(text: str) -> Optional[str]:
-        """
-        Extract birth date with comprehensive pattern matching.
-        """
-        # Process text line by line
-        lines = text.split('\n')
-        
-        date_patterns = [
-            r'(?<!\d)(\d{1,2})[.\s-](\d{1,2})[.\s-](\d{4})(?!\d)',
-            r'né\s?le\s*:?\s*(\d{1,2})[.\s-](\d{1,2})[.\s-](\d{4})',
-            r'nele\s*:?\s*(\d{1,2})[.\s-](\d{1,2})[.\s-](\d{4})',
-            r'(?:تاريخ الازدياد|تاريخ الميلاد)\s*:?\s*(\d{1,2})[.\s-](\d{1,2})[.\s-](\d{4})',
-            r'(?<!\d)(\d{2})[.\s-](\d{2})[.\s-](\d{4})(?!\d)',
-        ]
-        
-        def is_valid_date(day: str, month: str, year: str) -> bool:
-            try:
-                day, month, year = map(int, (day, month, year))
-                return (Config.VALID_YEAR_RANGE[0] <= year <= Config.VALID_YEAR_RANGE[1] and 
-                       1 <= month <= 12 and 
-                       1 <= day <= 31)
-            except:
-                return False
-        
-        # Check each line for dates
-        for line in lines:
-            line = ' '.join(line.split()).lower()
-            
-            for pattern in date_patterns:
-                matches = re.finditer(pattern, line)
-                for match in matches:
-                    if len(match.groups()) == 3:
-                        day, month, year = match.groups()
-                        day = day.zfill(2)
-                        month = month.zfill(2)
-                        
-                        if is_valid_date(day, month, year):
-                            return f"{day}/{month}/{year}"
-        
-        # Fallback: look for standalone numbers
-        for line in lines:
-            numbers = re.findall(r'\d+', line)
-            if len(numbers) >= 3:
-                for i in range(len(numbers)-2):
-                    day, month, year = numbers[i:i+3]
-                    if len(year) == 4 and is_valid_date(day, month, year):
-                        return f"{day.zfill(2)}/{month.zfill(2)}/{year}"
-        
-        return None
+    # Validate critical fields
+    if not cin:
+        logger.warning("CIN not found", extra=log_pipeline.fields(text=log_pipeline.sample_text(combined_text)))
+        raise ValueError("Unable to extract CIN from the image. Please ensure the ID card is clearly visible.")
 
-@app.post("/ocr/")
-async def extract_text(file: UploadFile = File(...)):
+    if not birth_date:
+        logger.warning("Birth date not found", extra=log_pipeline.fields(text=log_pipeline.sample_text(combined_text)))
+        raise ValueError("Unable to extract birth date from the image. Please ensure the ID card is clearly visible.")
+
+    logger.info("Fields extracted", extra=log_pipeline.fields(path="full_page", passes=list(texts)))
+
+    return {
+        "cin": cin,
+        "name": name,
+        "first_name": first_name,
+        "birth_date": birth_date,
+        "city": None,
+        "raw_text": texts.get("raw"),
+        "text_source": field_extraction.FULL_PAGE,
+        "processed_text": texts.get("processed"),
+        "field_confidence": result["confidence"],
+        "ocr_passes": list(texts),
+        "preprocessing": preprocessing
+    }
+
+async def warm_up():
     """
-    Process ID card image and extract relevant information.
+    Load the engines of every language the pipeline uses, then run a dummy card
+    through each stage (field zones, MRZ, enhancement and the full-page cascade),
+    so the first real request pays neither for the models nor for thread start-up.
     """
+    langs = {card_layout.LayoutConfig.LANG, word_reocr.ReocrConfig.LANG, script_router.RouterConfig.LATIN_LANG}
+    if script_router.RouterConfig.ARABIC_LINES == "ocr":
+        langs.add(script_router.RouterConfig.ARABIC_LANG)
+    if mrz.MRZConfig.ENABLED:
+        langs.add(mrz.MRZConfig.LANG)
     try:
-        # Validate file type
-        if file.content_type not in Config.ALLOWED_MIME_TYPES:
-            return JSONResponse(
-                content={"error": "Invalid file type. Please upload a PNG or JPEG image."},
-                status_code=400
-            )
+        with readiness.step("engines"):
+            for lang in sorted(langs):
+                await run_stage("warmup", tesseract_pool.warm_up, lang)
+        with readiness.step("pipeline"):
+            card = card_layout.sample_card()
+            try:
+                await process_image(cv2.imencode(".png", card)[1].tobytes())
+            except ValueError:
+                pass  # the dummy card's fields need not be readable
+            # The dummy card is read from its field zones: run the full-page path too
+            processed, _ = await run_stage("preprocess", ImageProcessor.enhance_image_with_report, card)
+            await OCRCascade.run({"processed": processed, "raw": card})
+    except Exception as e:
+        readiness.fail(e)
+        return
+    readiness.set_ready()
 
-        # Read and process image
-        image = Image.open(file.file)
-        image_np = np.array(image)
-        processed_image = ImageProcessor.enhance_image(image_np)
+async def cached_process_image(data: bytes, timeout: Optional[float] = None, bulk: bool = False) -> dict:
+    """
+    Serve a previously computed result for identical image bytes, otherwise run
+    the pipeline once even if the same image arrives several times concurrently.
+    """
+    # Batch items never wait behind an interactive request's deadline, nor the
+    # reverse; an Overloaded only applies to the deadline of the request that got it
+    return await ocr_cache.get_or_compute(make_key(data, PIPELINE_FINGERPRINT),
+                                          lambda: admitted_process_image(data, timeout, bulk),
+                                          lane="bulk" if bulk else "interactive", retry_on=(Overloaded,))
 
-        # Extract text using Tesseract
-        custom_config = r'--oem 3 --psm 3 -l fra+ara+eng --dpi 300'
-        raw_text = pytesseract.image_to_string(image_np, config=custom_config)
-        processed_text = pytesseract.image_to_string(processed_image, config=custom_config)
+async def admitted_process_image(data: bytes, timeout: Optional[float] = None, bulk: bool = False) -> dict:
+    """
+    Run the pipeline once admission control grants a slot and the image's decoded
+    pixels. ``timeout`` is the client's timeout in seconds; raises ``Overloaded``
+    when the image cannot start processing in time (never for ``bulk`` work, which
+    waits behind interactive requests).
+    """
+    pixels = image_decode.decoded_pixels(data, target_side=Config.MAX_IMAGE_SIDE)
+    start = time.perf_counter()
+    async with admission.admit(pixels, timeout, bulk):
+        metrics.observe_stage("ocr", "admission", time.perf_counter() - start)
+        return await process_image(data)
 
-        # Clean and combine texts
-        combined_text = TextProcessor.clean_text(f"{raw_text}\n{processed_text}")
-        logger.info("Combined extracted text: %s", combined_text)
+class OCRCascade:
+    """
+    Staged full-page OCR: run the cheapest pass first and only escalate to the
+    next, more expensive one while a required field is missing or was read with
+    low word confidence. Fields are fused across passes by keeping, for each
+    field, the value read with the highest confidence.
+    """
+    # (pass name, image it reads, sparse), cheapest first; each pass reads the Latin
+    # text lines with the Latin model only, Arabic lines are routed away
+    PASSES = [
+        ("processed", "processed", False),  # binarized, resolution-normalized image
+        ("raw", "raw", False),  # decoded grey image, downscaled to MAX_IMAGE_SIDE when larger, not binarized
+        ("raw_sparse", "raw", True),  # whole-page sparse-text segmentation for badly laid out photos
+    ]
+    REQUIRED_FIELDS = ("cin", "names", "birth_date")
 
-        # Extract information
-        cin = DataExtractor.extract_moroccan_cin(combined_text)
-        name, first_name = DataExtractor.extract_name_components(combined_text)
-        birth_date = DataExtractor.extract_birth_date(combined_text)
+    stages_reached: Counter = Counter()
+    resolved_by: Counter = Counter()
 
-        # Validate critical fields
-        if not cin:
-            logger.warning("CIN not found in text: %s", combined_text)
-            raise ValueError("Unable to extract CIN from the image. Please ensure the ID card is clearly visible.")
+    extractor = field_extraction.FieldExtractor(Config.VALID_YEAR_RANGE)
 
-        if not birth_date:
-            logger.warning("Birth date not found in text: %s", combined_text)
-            raise ValueError("Unable to extract birth date from the image. Please ensure the ID card is clearly visible.")
+    @classmethod
+    def extract_fields(cls, text: str) -> Dict[str, object]:
+        fields = cls.extractor.extract_values(text)
+        return {
+            "cin": fields["cin"],
+            "names": (fields["name"], fields["first_name"]),
+            "birth_date": fields["birth_date"],
+        }
 
-        # Log successful extraction
-        logger.info(f"Successfully extracted - CIN: {cin}, Birth Date: {birth_date}")
+    @staticmethod
+    def field_confidence(field: str, value, words) -> float:
+        if field == "names":
+            value = " ".join(part for part in reversed(value) if part)
+        return float(tesseract_pool.value_confidence(value, words))
+
+    @classmethod
+    async def run(cls, images: Dict[str, np.ndarray]) -> dict:
+        best = {field: (None, 0.0) for field in cls.REQUIRED_FIELDS}
+        texts = {}
+        for pass_name, image_key, sparse in cls.PASSES:
+            cls.stages_reached[pass_name] += 1
+            # Text lines are found on the raw grey image: binarization noise merges them
+            words = await run_stage("ocr", script_router.read_page, images[image_key],
+                                    dpi=Config.OCR_DPI, sparse=sparse, layout=images["raw"])
+            # Re-read only the uncertain CIN/date-like words before considering a costlier pass
+            words = await run_stage("reocr", word_reocr.refine_words, images[image_key], words)
+            text = TextProcessor.clean_text(tesseract_pool.words_to_text(words))
+            texts[pass_name] = text
+
+            with metrics.timed("ocr", "extract"):
+                extracted = cls.extract_fields(text)
+            for field, value in extracted.items():
+                if not value or value == (None, None):
+                    continue
+                confidence = cls.field_confidence(field, value, words)
+                if best[field][0] is None or confidence > best[field][1]:
+                    best[field] = (value, confidence)
 
+            if all(best[field][1] >= Config.CASCADE_MIN_CONFIDENCE for field in cls.REQUIRED_FIELDS):
+                cls.resolved_by[pass_name] += 1
+                break
+        else:
+            cls.resolved_by["unresolved"] += 1
+
+        name, first_name = best["names"][0] or (None, None)
         return {
-            "cin": cin,
+            "cin": best["cin"][0],
             "name": name,
             "first_name": first_name,
-            "birth_date": birth_date,
-            "raw_text": raw_text,
-            "processed_text": processed_text
+            "birth_date": best["birth_date"][0],
+            "confidence": {field: round(conf, 1) for field, (_, conf) in best.items()},
+            "texts": texts,
+        }
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {
+            "threshold": Config.CASCADE_MIN_CONFIDENCE,
+            "stages_reached": dict(cls.stages_reached),
+            "resolved_by": dict(cls.resolved_by),
         }
 
+@app.post("/ocr/")
+async def extract_text(file: UploadFile = File(...),
+                       timeout: Optional[float] = Header(None, alias=AdmissionConfig.TIMEOUT_HEADER)):
+    """
+    Process ID card image and extract relevant information.
+
+    An optional ``X-Request-Timeout`` header gives the client's timeout in seconds;
+    when the image cannot be processed within it the answer is an immediate 503
+    with Retry-After.
+    """
+    try:
+        # Validate file type
+        if file.content_type not in Config.ALLOWED_MIME_TYPES:
+            return JSONResponse(
+                content={"error": "Invalid file type. Please upload a PNG or JPEG image."},
+                status_code=400
+            )
+
+        return await cached_process_image(await image_decode.read_upload(file), timeout)
+
+    except image_decode.ImageTooLarge as e:
+        return JSONResponse(content={"error": "Image too large", "message": str(e)}, status_code=413)
+    except Overloaded as e:
+        return JSONResponse(content={"error": "Service overloaded", "message": str(e)}, status_code=503,
+                            headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
-        logger.error("OCR processing error: %s", str(e), exc_info=True)
+        # Unreadable cards are expected (already logged): a traceback only for real errors
+        logger.error("OCR processing error: %s", e, exc_info=not isinstance(e, ValueError))
         return JSONResponse(
             content={
                 "error": "Processing error",
@@ -251,6 +510,110 @@ async def extract_text(file: UploadFile = File(...)):
             status_code=500
         )
 
+@app.post("/ocr/batch")
+async def extract_text_batch(files: List[UploadFile] = File(...)):
+    """
+    Process many ID card images (individual files and/or zip archives) and stream
+    one NDJSON result line per card as soon as it is done.
+    """
+    try:
+        items = await read_batch(files)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+
+    async def process_item(item: BatchItem) -> dict:
+        if item.content_type not in Config.ALLOWED_MIME_TYPES:
+            raise ValueError("Invalid file type. Please upload a PNG or JPEG image.")
+        # Bulk lane of admission control: batch items wait behind live traffic
+        # instead of failing one by one when it fills the wait queue
+        return await cached_process_image(item.data, bulk=True)
+
+    return stream_batch(items, process_item)
+
+@app.websocket("/ocr/stream")
+async def extract_text_stream(websocket: WebSocket):
+    """
+    Stream of camera frames: only the sharpest frames showing the card are OCRed,
+    and each field is voted on across them (see frame_stream). The last message is
+    the voted result.
+    """
+    await websocket.accept()
+    result = await frame_stream.run_session(websocket, cached_process_image)
+    if result is not None:
+        await websocket.send_json(result)
+        await websocket.close()
+
+@app.get("/health")
+def health():
+    return {"status": "ok"}
+
+@app.get("/executor/stats")
+def executor_stats():
+    """
+    Queue depth and wait/run times per CPU stage, for sizing OCR_EXECUTOR_WORKERS.
+    """
+    return stage_executor.stats()
+
+@app.get("/preprocess/stats")
+def preprocess_stats():
+    """
+    How often each preprocessing path was taken and its average duration, and
+    the pipelines' buffer allocations (they should stop growing once warm).
+    """
+    return {**PreprocessStats.summary(), "pipeline": preprocess_pipeline.stats()}
+
+@app.get("/cache/stats")
+def cache_stats():
+    """
+    Hit/miss counters of the OCR results cache.
+    """
+    return ocr_cache.stats()
+
+@app.get("/admission/stats")
+def admission_stats():
+    """
+    In-flight pipelines, wait queue, reserved pixels and rejections of admission control.
+    """
+    return admission.stats()
+
+@app.get("/mrz/stats")
+def mrz_stats():
+    """
+    MRZ reads: attempts, photos without a zone, zones rejected by their check digits
+    and verified zones.
+    """
+    return mrz.stats()
+
+@app.get("/router/stats")
+def router_stats():
+    """
+    Pages and text lines seen by the script router: Latin lines read, Arabic lines
+    skipped or read, lines rerouted after a low-confidence Latin read.
+    """
+    return script_router.stats()
+
+@app.get("/stream/stats")
+def stream_stats():
+    """
+    Camera-frame streams: frames received, without a card, too blurred or glared,
+    OCRed, and sessions ending stable or incomplete.
+    """
+    return frame_stream.stats()
+
+@app.get("/logging/stats")
+def logging_stats():
+    """
+    Log records queued and dropped (queue full), queue depth, and OCR texts sampled.
+    """
+    return log_pipeline.stats()
+
+@app.get("/cascade/stats")
+def cascade_stats():
+    """
+    How often each OCR pass was reached and which pass resolved the fields.
+    """
+    return OCRCascade.stats()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8003)
\ No newline at end of file
@@ -0,0 +1,171 @@
+"""
+Reusable OpenCV preprocessing pipelines: operators built once, intermediate
+images written into buffers kept by the worker.
+
+Preprocessing one card used to create a CLAHE object and a morphology kernel,
+and to allocate a new full-size image at every step (grayscale, denoising, CLAHE,
+threshold, morphology), on every call. A ``Pipeline`` is built from a chain of
+steps; each step's operator is built once, steps that cannot change the image
+(a morphology with a 1x1 kernel) are dropped, and the steps write alternately
+into two buffers of the worker. Buffers grow by ``BUCKET_PIXELS`` steps, so images
+of similar sizes reuse them; only the final image is a new array (the OCR reads it
+after the worker may have moved on to the next card), unless ``out`` is given.
+
+Buffers are not thread-safe: use ``worker_pipeline``, which keeps one pipeline
+per thread (and so per worker process).
+
+    pipeline = worker_pipeline("page", (step("denoise"), step("clahe"), step("threshold")))
+    binary = pipeline.run(image)
+"""
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Collection, Dict, NamedTuple, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+
+class PipelineConfig:
+    BUCKET_PIXELS = 256 * 1024  # buffer sizes are rounded up to a multiple of this
+
+
+class Step(NamedTuple):
+    name: str  # key in ``only`` and in the timings
+    op: str  # one of OPERATORS
+    options: Dict[str, Any]
+
+
+def step(op: str, name: Optional[str] = None, **options: Any) -> Step:
+    return Step(name or op, op, options)
+
+
+def _denoise(h: float = 3.0, template_window: int = 7, search_window: int = 21) -> Callable:
+    return lambda src, dst: cv2.fastNlMeansDenoising(src, dst, h, template_window, search_window)
+
+
+def _clahe(clip: float = 2.0, tiles: Tuple[int, int] = (8, 8)) -> Callable:
+    clahe = cv2.createCLAHE(clipLimit=clip, tileGridSize=tiles)
+    return lambda src, dst: clahe.apply(src, dst)
+
+
+def _threshold(block_size: int = 11, c: float = 2) -> Callable:
+    return lambda src, dst: cv2.adaptiveThreshold(src, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
+                                                  block_size, c, dst)
+
+
+def _morphology(operation: int) -> Callable:
+    def build(kernel: Tuple[int, int] = (3, 3), iterations: int = 1) -> Optional[Callable]:
+        if tuple(kernel) == (1, 1) or iterations == 0:
+            return None  # the image is unchanged
+        structuring = np.ones(kernel, np.uint8)
+        return lambda src, dst: cv2.morphologyEx(src, operation, structuring, dst, iterations=iterations)
+    return build
+
+
+# Operator factories: options -> fn(src, dst) writing into dst, or None for a no-op
+OPERATORS: Dict[str, Callable[..., Optional[Callable]]] = {
+    "denoise": _denoise,
+    "clahe": _clahe,
+    "threshold": _threshold,
+    "dilate": _morphology(cv2.MORPH_DILATE),
+    "erode": _morphology(cv2.MORPH_ERODE),
+    "close": _morphology(cv2.MORPH_CLOSE),
+    "open": _morphology(cv2.MORPH_OPEN),
+}
+
+counters: Counter = Counter()
+
+
+class Pipeline:
+    def __init__(self, steps: Sequence[Step]):
+        """
+        Raises ``ValueError`` for an unknown operator, bad options or a repeated step name.
+        """
+        self.steps = []
+        self.dropped = []
+        self._buffers: Dict[Tuple[str, str], np.ndarray] = {}
+        names = set()
+        for s in steps:
+            if s.op not in OPERATORS:
+                raise ValueError(f"Unknown preprocessing operator: {s.op}")
+            if s.name in names:
+                raise ValueError(f"Repeated preprocessing step: {s.name}")
+            names.add(s.name)
+            try:
+                fn = OPERATORS[s.op](**s.options)
+            except TypeError as e:
+                raise ValueError(f"Bad options for preprocessing step {s.name}: {e}")
+            if fn is None:
+                self.dropped.append(s.name)
+                counters["dropped_steps"] += 1
+            else:
+                self.steps.append((s.name, fn))
+
+    def buffer(self, name: str, shape: Tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+        """
+        Contiguous ``shape`` array backed by the pipeline's buffer ``name``, valid
+        until the next call with the same name.
+        """
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape))
+        flat = self._buffers.get((name, dtype.str))
+        if flat is None or flat.size < size:
+            buckets = -(-size // PipelineConfig.BUCKET_PIXELS)
+            flat = self._buffers[(name, dtype.str)] = np.empty(buckets * PipelineConfig.BUCKET_PIXELS, dtype)
+            counters["buffer_allocations"] += 1
+            counters["buffer_bytes"] += flat.nbytes
+        return flat[:size].reshape(shape)
+
+    def gray(self, image: np.ndarray) -> np.ndarray:
+        """
+        ``image`` in grayscale: itself when it already is, else converted into a buffer.
+        """
+        if image.ndim == 2:
+            return image
+        code = cv2.COLOR_RGBA2GRAY if image.shape[2] == 4 else cv2.COLOR_RGB2GRAY
+        return cv2.cvtColor(image, code, self.buffer("gray", image.shape[:2]))
+
+    def run(self, image: np.ndarray, out: Optional[np.ndarray] = None, only: Optional[Collection[str]] = None,
+            timings: Optional[Dict[str, float]] = None) -> np.ndarray:
+        """
+        Run the steps (those named in ``only``, in the pipeline's order) on ``image``.
+        The result is written into ``out`` when given (same shape, uint8), else
+        into a new array. ``timings`` receives the milliseconds spent per step.
+        """
+        counters["runs"] += 1
+        src = self.gray(image)
+        steps = [(name, fn) for name, fn in self.steps if only is None or name in only]
+        if out is None:
+            out = np.empty(src.shape, np.uint8)
+        if not steps:
+            np.copyto(out, src)
+            return out
+        for index, (name, fn) in enumerate(steps):
+            dst = out if index == len(steps) - 1 else self.buffer("ab"[index % 2], src.shape)
+            start = time.perf_counter()
+            src = fn(src, dst)
+            if timings is not None:
+                timings[name] = round((time.perf_counter() - start) * 1000, 2)
+        return src
+
+
+_local = threading.local()
+
+
+def worker_pipeline(name: str, steps: Sequence[Step]) -> Pipeline:
+    """
+    The calling thread's pipeline ``name``, built from ``steps`` on first use.
+    """
+    pipelines = getattr(_local, "pipelines", None)
+    if pipelines is None:
+        pipelines = _local.pipelines = {}
+    pipeline = pipelines.get(name)
+    if pipeline is None:
+        pipeline = pipelines[name] = Pipeline(steps)
+        counters["pipelines"] += 1
+    return pipeline
+
+
+def stats() -> Dict[str, int]:
+    return dict(counters)
@@ -1,8 +1,38 @@
 # register.py
+import asyncio
+from typing import Optional
+
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
+import log_pipeline
+import metrics
+from field_extraction import normalize_cin
+from readiness import Readiness, add_ready_route
+from registration_store import Registration, RegistrationStore
+
 app = FastAPI()
+metrics.instrument(app, "register")
+log_pipeline.setup("register")
+
+# SQLite store (WAL, group commit), opened at startup
+store: Optional[RegistrationStore] = None
+
+readiness = Readiness("register")
+add_ready_route(app, readiness)
+
+@app.on_event("startup")
+def startup():
+    global store
+    with readiness.step("store"):
+        store = RegistrationStore()
+    readiness.set_ready()
+
+@app.on_event("shutdown")
+def shutdown():
+    store.close()
+    log_pipeline.shutdown()
 
 # Define the data model for registration
 class RegistrationRequest(BaseModel):
@@ -13,9 +43,34 @@ class RegistrationRequest(BaseModel):
 
 # Handle the registration POST request
 @app.post("/register/")
-def register_identity(data: RegistrationRequest):
-    # Here you can process the data or save it to a database
+async def register_identity(data: RegistrationRequest):
+    cin = normalize_cin(data.cin)
+    if cin is None:
+        return JSONResponse(content={"error": "Invalid CIN format"}, status_code=400)
+
+    # Idempotent on the CIN: replaying the same registration changes nothing
+    registration = Registration(cin, data.first_name.strip(), data.last_name.strip(), data.birth_date.strip())
+    with metrics.timed("register", "upsert"):
+        status = await store.upsert(registration)
+    message = "Identity already registered" if status == "unchanged" else "Identity registered successfully"
     return {
-        "message": "Identity registered successfully",
-        "data": data
+        "message": message,
+        "status": status,
+        "data": registration._asdict()
     }
+
+@app.get("/register/search")
+async def search_identities(last_name: str, first_name: Optional[str] = None, birth_date: Optional[str] = None):
+    return await asyncio.to_thread(store.find, last_name, first_name, birth_date)
+
+@app.get("/register/stats")
+def register_stats():
+    """Group commit counters: commits, writes per outcome and average batch size"""
+    return store.stats()
+
+@app.get("/register/{cin}")
+async def get_identity(cin: str):
+    record = await asyncio.to_thread(store.get, normalize_cin(cin) or cin)
+    if record is None:
+        return JSONResponse(content={"error": "CIN not registered"}, status_code=404)
+    return record
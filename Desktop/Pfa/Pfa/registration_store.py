@@ -0,0 +1,232 @@
+"""
+Durable SQLite store for registered identities.
+
+The database runs in WAL mode. All writes go through one writer thread that
+batches the registrations arriving close together into a single transaction
+(group commit): under load, many requests share one fsync instead of paying
+one each. Registrations are upserts keyed on the CIN, so replaying the same
+payload is a no-op. Lookups by CIN and by name and birth date use indexes and
+run on per-thread read connections, which WAL lets proceed alongside the writer.
+"""
+import asyncio
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger("registration_store")
+
+
+class StoreConfig:
+    DB_PATH = os.getenv("REGISTER_DB_PATH", "registrations.db")
+    MAX_BATCH = int(os.getenv("REGISTER_GROUP_COMMIT_MAX_BATCH", "256"))
+    # Extra wait for more writes before committing. 0: a batch is whatever queued up
+    # during the previous commit, which already batches under load without adding latency
+    MAX_DELAY = float(os.getenv("REGISTER_GROUP_COMMIT_MAX_DELAY_MS", "0")) / 1000
+    SYNCHRONOUS = os.getenv("REGISTER_DB_SYNCHRONOUS", "FULL")  # FULL: fsync on every commit
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS registrations (
+    cin TEXT PRIMARY KEY,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    birth_date TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS registrations_name_birth_date
+    ON registrations (last_name, first_name, birth_date);
+"""
+
+
+class Registration(NamedTuple):
+    cin: str
+    first_name: str
+    last_name: str
+    birth_date: str
+
+
+class _Write(NamedTuple):
+    registration: Registration
+    loop: asyncio.AbstractEventLoop
+    future: asyncio.Future
+
+
+_STOP = object()
+
+
+def _set_result(future: asyncio.Future, result: Any) -> None:
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future: asyncio.Future, error: Exception) -> None:
+    if not future.done():
+        future.set_exception(error)
+
+
+class RegistrationStore:
+    def __init__(self, path: Optional[str] = None, max_batch: Optional[int] = None,
+                 max_delay: Optional[float] = None, synchronous: Optional[str] = None):
+        self.path = path or StoreConfig.DB_PATH
+        self.max_batch = max_batch or StoreConfig.MAX_BATCH
+        self.max_delay = StoreConfig.MAX_DELAY if max_delay is None else max_delay
+        self.synchronous = synchronous or StoreConfig.SYNCHRONOUS
+        self._queue: "queue.Queue" = queue.Queue()
+        self._local = threading.local()
+        self.counters = {"commits": 0, "writes": 0, "created": 0, "updated": 0, "unchanged": 0, "failed": 0}
+
+        db = self._connect()
+        try:
+            db.execute("PRAGMA journal_mode=WAL")  # persistent: set once for the database file
+            db.executescript(SCHEMA)
+        finally:
+            db.close()
+        self._writer = threading.Thread(target=self._write_loop, name="registration-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+        db.execute(f"PRAGMA synchronous={self.synchronous}")
+        db.row_factory = sqlite3.Row
+        return db
+
+    # Writes
+
+    async def upsert(self, registration: Registration) -> str:
+        """
+        Insert or update the registration for its CIN once it is committed.
+
+        Returns ``created``, ``updated`` or ``unchanged`` (same payload replayed).
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put(_Write(registration, loop, future))
+        return await future
+
+    def _next_batch(self) -> Optional[List[_Write]]:
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                # Whatever is already queued joins the batch; wait up to max_delay for more
+                remaining = deadline - time.monotonic()
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    @staticmethod
+    def _apply(db: sqlite3.Connection, registration: Registration, now: float) -> str:
+        row = db.execute("SELECT first_name, last_name, birth_date FROM registrations WHERE cin = ?",
+                         (registration.cin,)).fetchone()
+        if row is None:
+            db.execute("INSERT INTO registrations VALUES (?, ?, ?, ?, ?, ?)", (*registration, now, now))
+            return "created"
+        if tuple(row) == registration[1:]:
+            return "unchanged"
+        db.execute("UPDATE registrations SET first_name = ?, last_name = ?, birth_date = ?, updated_at = ? "
+                   "WHERE cin = ?", (*registration[1:], now, registration.cin))
+        return "updated"
+
+    def _write_loop(self) -> None:
+        db = self._connect()
+        try:
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    return
+                self._commit(db, batch)
+        finally:
+            db.close()
+
+    def _commit(self, db: sqlite3.Connection, batch: List[_Write]) -> None:
+        results = []
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            for write in batch:
+                # A savepoint per write: one bad record does not fail the others
+                db.execute("SAVEPOINT write")
+                try:
+                    results.append(self._apply(db, write.registration, now))
+                    db.execute("RELEASE write")
+                except Exception as e:
+                    db.execute("ROLLBACK TO write")
+                    db.execute("RELEASE write")
+                    results.append(e)
+            db.execute("COMMIT")
+        except Exception as e:
+            # Any error fails this batch only: the writer thread must outlive it, or
+            # every later upsert would wait forever
+            logger.error("Group commit of %d registrations failed: %s", len(batch), e)
+            try:
+                if db.in_transaction:
+                    db.execute("ROLLBACK")
+            except sqlite3.Error as rollback_error:
+                logger.error("Rollback of the failed group commit failed: %s", rollback_error)
+            results = [e] * len(batch)
+        else:
+            self.counters["commits"] += 1
+
+        for write, result in zip(batch, results):
+            self.counters["writes"] += 1
+            if isinstance(result, Exception):
+                self.counters["failed"] += 1
+                deliver = _set_exception
+            else:
+                self.counters[result] += 1
+                deliver = _set_result
+            try:
+                write.loop.call_soon_threadsafe(deliver, write.future, result)
+            except RuntimeError:
+                pass  # the caller's event loop is closed: nobody is waiting for this result
+
+    # Reads
+
+    def _reader(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = self._connect()
+        return db
+
+    def get(self, cin: str) -> Optional[Dict[str, Any]]:
+        row = self._reader().execute("SELECT * FROM registrations WHERE cin = ?", (cin,)).fetchone()
+        return dict(row) if row else None
+
+    def find(self, last_name: str, first_name: Optional[str] = None,
+             birth_date: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Registrations by last name, optionally narrowed by first name and birth date
+        (prefix columns of the name/birth date index).
+        """
+        query, params = "SELECT * FROM registrations WHERE last_name = ?", [last_name]
+        for column, value in (("first_name", first_name), ("birth_date", birth_date)):
+            if value is not None:
+                query += f" AND {column} = ?"
+                params.append(value)
+        rows = self._reader().execute(query + " LIMIT ?", (*params, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        commits = self.counters["commits"]
+        return {
+            **self.counters,
+            "pending": self._queue.qsize(),
+            "avg_batch": round(self.counters["writes"] / commits, 2) if commits else 0.0,
+        }
+
+    def close(self) -> None:
+        self._queue.put(_STOP)
+        self._writer.join()
@@ -0,0 +1,264 @@
+"""
+Pool of long-lived, in-process Tesseract engines.
+
+``pytesseract`` starts a new ``tesseract`` process for every call, writes the image
+to a temporary file and reloads the traineddata from disk each time. When the
+optional ``tesserocr`` binding is installed, this module keeps a fixed number of
+``PyTessBaseAPI`` instances per language set with their models already loaded,
+and feeds them numpy buffers directly. Without ``tesserocr`` (or with
+``OCR_ENGINE=pytesseract``) every call falls back to ``pytesseract``.
+"""
+import logging
+import os
+import queue
+import re
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+import pytesseract
+
+try:
+    import tesserocr
+except ImportError:  # optional dependency
+    tesserocr = None
+
+logger = logging.getLogger("tesseract_pool")
+
+
+class EngineConfig:
+    ENGINE = os.getenv("OCR_ENGINE", "auto")  # auto | tesserocr | pytesseract
+    POOL_SIZE = int(os.getenv("OCR_ENGINE_POOL_SIZE", str(os.cpu_count() or 1)))
+    TESSDATA_PATH = os.getenv("TESSDATA_PREFIX")
+    ACQUIRE_TIMEOUT = float(os.getenv("OCR_ENGINE_ACQUIRE_TIMEOUT", "60"))
+
+
+class OCRWord(NamedTuple):
+    text: str
+    conf: float  # 0-100
+    left: int
+    top: int
+    width: int
+    height: int
+    line: int  # line number within the page, in reading order
+
+
+def pooled_engine_available() -> bool:
+    if EngineConfig.ENGINE == "pytesseract":
+        return False
+    if tesserocr is None:
+        if EngineConfig.ENGINE == "tesserocr":
+            raise RuntimeError("OCR_ENGINE=tesserocr but the tesserocr package is not installed")
+        return False
+    return True
+
+
+class TesseractPool:
+    """
+    Fixed-size pool of ``tesserocr.PyTessBaseAPI`` engines sharing one language set.
+
+    Engines are created on demand up to ``size`` and then reused; a caller that
+    finds every engine busy waits for one to be released.
+    """
+
+    def __init__(self, lang: str, size: Optional[int] = None):
+        self.lang = lang
+        self.size = size or EngineConfig.POOL_SIZE
+        self._idle: "queue.LifoQueue" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._engines = []
+
+    def _new_engine(self):
+        kwargs = {"lang": self.lang}
+        if EngineConfig.TESSDATA_PATH:
+            kwargs["path"] = EngineConfig.TESSDATA_PATH
+        engine = tesserocr.PyTessBaseAPI(**kwargs)
+        self._engines.append(engine)
+        logger.info("Loaded Tesseract engine %d/%d for '%s'", len(self._engines), self.size, self.lang)
+        return engine
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self._new_engine()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get(timeout=EngineConfig.ACQUIRE_TIMEOUT)
+
+    def preload(self, count: Optional[int] = None) -> None:
+        """
+        Load ``count`` engines (default: the whole pool) ahead of the first request.
+        """
+        engines = [self._acquire() for _ in range(min(count or self.size, self.size))]
+        for engine in engines:
+            self._idle.put(engine)
+
+    @contextmanager
+    def _engine_for(self, image: np.ndarray, psm: int, dpi: Optional[int], whitelist: Optional[str]):
+        image = np.ascontiguousarray(image)
+        if image.dtype != np.uint8:
+            raise ValueError(f"Expected a uint8 image, got {image.dtype}")
+        height, width = image.shape[:2]
+        channels = 1 if image.ndim == 2 else image.shape[2]
+
+        engine = self._acquire()
+        try:
+            engine.SetPageSegMode(psm)
+            engine.SetVariable("user_defined_dpi", str(dpi) if dpi else "0")
+            engine.SetVariable("tessedit_char_whitelist", whitelist or "")
+            engine.SetImageBytes(image.tobytes(), width, height, channels, width * channels)
+            yield engine
+        finally:
+            engine.Clear()
+            self._idle.put(engine)
+
+    def image_to_string(self, image: np.ndarray, psm: int = 3, dpi: Optional[int] = None,
+                        whitelist: Optional[str] = None) -> str:
+        with self._engine_for(image, psm, dpi, whitelist) as engine:
+            return engine.GetUTF8Text()
+
+    def image_to_data(self, image: np.ndarray, psm: int = 3, dpi: Optional[int] = None,
+                      whitelist: Optional[str] = None) -> List[OCRWord]:
+        level = tesserocr.RIL.WORD
+        words = []
+        line = -1
+        with self._engine_for(image, psm, dpi, whitelist) as engine:
+            engine.Recognize()
+            for item in tesserocr.iterate_level(engine.GetIterator(), level):
+                if item.IsAtBeginningOf(tesserocr.RIL.TEXTLINE):
+                    line += 1
+                text = (item.GetUTF8Text(level) or "").strip()
+                if not text:
+                    continue
+                x1, y1, x2, y2 = item.BoundingBox(level)
+                words.append(OCRWord(text, item.Confidence(level), x1, y1, x2 - x1, y2 - y1, max(line, 0)))
+        return words
+
+    def close(self) -> None:
+        for engine in self._engines:
+            engine.End()
+        self._engines.clear()
+
+
+_pools: Dict[str, TesseractPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(lang: str) -> TesseractPool:
+    with _pools_lock:
+        pool = _pools.get(lang)
+        if pool is None:
+            pool = _pools[lang] = TesseractPool(lang)
+        return pool
+
+
+def build_config(lang: str, psm: int = 3, dpi: Optional[int] = None, whitelist: Optional[str] = None) -> str:
+    """
+    Command-line config equivalent to the pooled settings, for the pytesseract path.
+    """
+    config = f"--oem 3 --psm {psm} -l {lang}"
+    if dpi:
+        config += f" --dpi {dpi}"
+    if whitelist:
+        config += f" -c tessedit_char_whitelist={whitelist}"
+    return config
+
+
+def warm_up(lang: str) -> None:
+    """
+    Load every pooled engine for ``lang`` and run one OCR call, so the first request
+    does not pay for reading the traineddata from disk.
+    """
+    if pooled_engine_available():
+        get_pool(lang).preload()
+    image_to_string(np.full((32, 96), 255, np.uint8), lang=lang, psm=7)
+
+
+def image_to_string(image: np.ndarray, lang: str, psm: int = 3, dpi: Optional[int] = None,
+                    whitelist: Optional[str] = None) -> str:
+    """
+    OCR ``image`` with a pooled engine when available, otherwise with pytesseract.
+    """
+    if pooled_engine_available():
+        return get_pool(lang).image_to_string(image, psm=psm, dpi=dpi, whitelist=whitelist)
+    return pytesseract.image_to_string(image, config=build_config(lang, psm, dpi, whitelist))
+
+
+def image_to_data(image: np.ndarray, lang: str, psm: int = 3, dpi: Optional[int] = None,
+                  whitelist: Optional[str] = None) -> List[OCRWord]:
+    """
+    OCR ``image`` and return its words with confidences and bounding boxes.
+    """
+    if pooled_engine_available():
+        return get_pool(lang).image_to_data(image, psm=psm, dpi=dpi, whitelist=whitelist)
+    data = pytesseract.image_to_data(image, config=build_config(lang, psm, dpi, whitelist),
+                                     output_type=pytesseract.Output.DICT)
+    words, lines = [], {}
+    for i, text in enumerate(data["text"]):
+        conf = float(data["conf"][i])
+        if conf < 0 or not text.strip():
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        line = lines.setdefault(key, len(lines))
+        words.append(OCRWord(text.strip(), conf, data["left"][i], data["top"][i],
+                             data["width"][i], data["height"][i], line))
+    return words
+
+
+def words_to_text(words: List[OCRWord]) -> str:
+    """
+    Rebuild plain text from words, one output line per OCR line.
+    """
+    lines: Dict[int, List[str]] = {}
+    for word in words:
+        lines.setdefault(word.line, []).append(word.text)
+    return "\n".join(" ".join(lines[line]) for line in sorted(lines))
+
+
+def _alnum(text: str) -> str:
+    return re.sub(r"[^0-9A-Z]", "", text.upper())
+
+
+def value_confidence(value: Optional[str], words: List[OCRWord]) -> float:
+    """
+    Confidence of an extracted value: every alphanumeric token of the value must be
+    traced to the recognized word containing it (or to the words it was split
+    into); the value scores as its least confident word.
+    Returns 0 when the value is missing or a token cannot be traced to a word.
+    """
+    if not value:
+        return 0.0
+    tokens = [t for t in (_alnum(part) for part in re.split(r"[\s./-]+", value)) if t]
+    normalized = [(_alnum(word.text), word.conf) for word in words]
+    confidences = []
+    for token in tokens:
+        containing = [conf for text, conf in normalized if token in text]
+        if containing:
+            confidences.append(max(containing))
+            continue
+        parts = [conf for text, conf in normalized if len(text) >= 2 and text in token]
+        if not parts:
+            return 0.0
+        confidences.append(min(parts))
+    return min(confidences) if confidences else 0.0
+
+
+def close_pools() -> None:
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
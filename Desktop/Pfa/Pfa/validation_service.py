@@ -1,15 +1,106 @@
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-import re
+from typing import List
+import asyncio
+import os
+
+from cin_index import CINIndex, IndexConfig
+import log_pipeline
+import metrics
+from readiness import Readiness, add_ready_route
+from field_extraction import normalize_cin
 
 app = FastAPI()
+metrics.instrument(app, "validation")
+log_pipeline.setup("validation")
+# Prêt une fois l'index chargé au démarrage
+readiness = Readiness("validation")
+add_ready_route(app, readiness)
+
+# Nombre maximal de CIN par appel à /validate/batch
+MAX_BATCH_SIZE = int(os.getenv("VALIDATION_MAX_BATCH_SIZE", "100000"))
+
+# Index des CIN déjà enregistrés ou bloqués (remplacé en bloc lors d'un rechargement)
+cin_index = CINIndex.load(None)
 
 class ValidationRequest(BaseModel):
     cin: str
 
+class BatchValidationRequest(BaseModel):
+    cins: List[str]
+
+async def reload_index() -> CINIndex:
+    """Reconstruire l'index depuis le fichier hors de la boucle d'événements, puis l'échanger"""
+    global cin_index
+    cin_index = await asyncio.to_thread(CINIndex.load, IndexConfig.FILE)
+    return cin_index
+
+async def watch_index_file():
+    """Recharger l'index quand le fichier est modifié"""
+    while True:
+        await asyncio.sleep(IndexConfig.RELOAD_INTERVAL)
+        if cin_index.is_stale():
+            try:
+                await reload_index()
+            except (OSError, ValueError):
+                pass  # fichier en cours d'écriture : on garde l'index actuel
+
+@app.on_event("startup")
+async def startup():
+    with readiness.step("index"):
+        await reload_index()
+    readiness.set_ready()
+    if IndexConfig.FILE and IndexConfig.RELOAD_INTERVAL > 0:
+        asyncio.ensure_future(watch_index_file())
+
+def validation_result(cin: str, status) -> dict:
+    if status == "blocked":
+        return {"valid": False, "cin": cin, "status": status, "message": "Blocked CIN"}
+    return {"valid": True, "cin": cin, "status": status}
+
 @app.post("/validate/")
 def validate(data: ValidationRequest):
-    pattern = r"^[A-Z]{3} \d{6}$"  # Exemple de format CIN
-    if re.match(pattern, data.cin):
-        return {"valid": True}
-    return {"valid": False, "message": "Invalid CIN format"}
+    # Règle commune aux extracteurs OCR : 1 ou 2 lettres puis 5 ou 6 chiffres
+    cin = normalize_cin(data.cin)
+    if cin is None:
+        return {"valid": False, "message": "Invalid CIN format"}
+    return validation_result(cin, cin_index.status(cin))
+
+@app.post("/validate/batch")
+def validate_batch(data: BatchValidationRequest):
+    """
+    Validation d'un lot de CIN : format, puis recherche dans l'index en une seule passe
+    vectorisée. Les résultats sont dans l'ordre de la requête.
+    """
+    if len(data.cins) > MAX_BATCH_SIZE:
+        return JSONResponse(content={"error": f"Batch exceeds {MAX_BATCH_SIZE} CINs"}, status_code=413)
+
+    normalized = [normalize_cin(value) for value in data.cins]
+    well_formed = [cin for cin in normalized if cin is not None]
+    statuses = iter(cin_index.status_many(well_formed))
+
+    results = []
+    for cin in normalized:
+        if cin is None:
+            results.append({"valid": False, "message": "Invalid CIN format"})
+        else:
+            results.append(validation_result(cin, next(statuses)))
+    valid = sum(result["valid"] for result in results)
+    return {
+        "results": results,
+        "summary": {"total": len(results), "valid": valid, "invalid": len(results) - valid},
+    }
+
+@app.post("/index/reload")
+async def index_reload():
+    """Rechargement à chaud de l'index des CIN"""
+    try:
+        index = await reload_index()
+    except (OSError, ValueError) as e:
+        return JSONResponse(content={"error": f"Index reload failed: {str(e)}"}, status_code=500)
+    return index.stats()
+
+@app.get("/index/stats")
+def index_stats():
+    return cin_index.stats()
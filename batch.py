@@ -0,0 +1,129 @@
+"""
+Helpers for the batch endpoints: collecting the uploaded images (individual files or
+zip archives) and streaming one NDJSON line per image as soon as it is processed.
+"""
+import asyncio
+import io
+import json
+import mimetypes
+import os
+import zipfile
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from fastapi import UploadFile
+from fastapi.responses import StreamingResponse
+
+
+class BatchConfig:
+    MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+    MAX_ITEM_BYTES = int(os.getenv("BATCH_MAX_ITEM_BYTES", str(20 * 1024 * 1024)))
+    MAX_TOTAL_BYTES = int(os.getenv("BATCH_MAX_TOTAL_BYTES", str(256 * 1024 * 1024)))  # uncompressed
+    CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", str(2 * (os.cpu_count() or 1))))
+    ZIP_TYPES = ("application/zip", "application/x-zip-compressed")
+
+
+class BatchItem(NamedTuple):
+    index: int
+    filename: str
+    content_type: Optional[str]
+    data: bytes
+
+
+def _is_zip(upload: UploadFile) -> bool:
+    return upload.content_type in BatchConfig.ZIP_TYPES or (upload.filename or "").lower().endswith(".zip")
+
+
+def _check_size(count: int, total_bytes: int) -> None:
+    if count > BatchConfig.MAX_ITEMS:
+        raise ValueError(f"Batch exceeds {BatchConfig.MAX_ITEMS} images")
+    if total_bytes > BatchConfig.MAX_TOTAL_BYTES:
+        raise ValueError(f"Batch exceeds {BatchConfig.MAX_TOTAL_BYTES} bytes")
+
+
+def _zip_items(data: bytes, start: int, total_bytes: int) -> List[BatchItem]:
+    """
+    Entries are checked against the batch limits from their declared sizes before
+    being decompressed (``archive.read`` stops at the declared size).
+    """
+    items = []
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or info.filename.startswith("__MACOSX/"):
+                continue
+            if info.file_size > BatchConfig.MAX_ITEM_BYTES:
+                raise ValueError(f"{info.filename} exceeds {BatchConfig.MAX_ITEM_BYTES} bytes")
+            total_bytes += info.file_size
+            _check_size(start + len(items) + 1, total_bytes)
+            content_type, _ = mimetypes.guess_type(info.filename)
+            items.append(BatchItem(start + len(items), info.filename, content_type, archive.read(info)))
+    return items
+
+
+async def read_batch(files: List[UploadFile]) -> List[BatchItem]:
+    """
+    Read every upload into memory, expanding zip archives into one item per entry.
+
+    The bytes are read before the streaming response starts because the uploads
+    are not guaranteed to stay open while the response is being sent.
+    Raises ``ValueError`` when the batch is too large (images, or uncompressed
+    bytes) or an archive is unreadable.
+    """
+    items: List[BatchItem] = []
+    total_bytes = 0
+    for upload in files:
+        data = await upload.read()
+        filename = upload.filename or f"item-{len(items)}"
+        if _is_zip(upload):
+            try:
+                entries = _zip_items(data, len(items), total_bytes)
+            except zipfile.BadZipFile:
+                raise ValueError(f"{filename} is not a valid zip archive")
+            items.extend(entries)
+            total_bytes += sum(len(entry.data) for entry in entries)
+        else:
+            items.append(BatchItem(len(items), filename, upload.content_type, data))
+            total_bytes += len(data)
+            _check_size(len(items), total_bytes)
+    return items
+
+
+def ndjson_line(record: Dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def stream_batch(items: List[BatchItem], worker: Callable[[BatchItem], Awaitable[Dict[str, Any]]],
+                 concurrency: Optional[int] = None) -> StreamingResponse:
+    """
+    Run ``worker`` on every item and stream the results as NDJSON in completion order.
+
+    Each line carries the item ``index`` and ``filename`` with either ``status: ok``
+    and the worker's ``result``, or ``status: error`` with the exception message,
+    so one bad card does not fail the whole batch. A final ``summary`` line gives
+    the totals.
+    """
+    semaphore = asyncio.Semaphore(concurrency or BatchConfig.CONCURRENCY)
+
+    async def run(item: BatchItem) -> Dict[str, Any]:
+        record = {"index": item.index, "filename": item.filename}
+        async with semaphore:
+            try:
+                record.update(status="ok", result=await worker(item))
+            except Exception as e:
+                record.update(status="error", error=str(e), type=type(e).__name__)
+        return record
+
+    async def generate():
+        tasks = [asyncio.ensure_future(run(item)) for item in items]
+        failed = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                record = await next_done
+                failed += record["status"] == "error"
+                yield ndjson_line(record)
+        finally:
+            # Client went away: stop the remaining work
+            for task in tasks:
+                task.cancel()
+        yield ndjson_line({"summary": {"total": len(items), "ok": len(items) - failed, "failed": failed}})
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
@@ -0,0 +1,5 @@
+"""
+Benchmarks and load tests for the ID card services.
+
+Run from the repository root, e.g. ``python -m benchmarks.gateway_load``.
+"""
@@ -0,0 +1,162 @@
+"""
+Gateway routing across several OCR instances: random versus least-loaded, with and without hedging.
+
+Several OCR stubs run as their own processes (``python -m benchmarks.stubs ocr``):
+two fast ones, a slower one, one with a slow tail and one port where nothing
+listens (a dead node). The gateway (http mode, with the OCR pool set to all of
+them) is served locally and loaded with concurrent uploads, once per strategy:
+- random: each request to a random available backend (``pick`` replaced)
+- least-loaded: the backend pool as shipped, no hedging
+- hedged: least-loaded, plus a second request after the p95 latency
+
+Reported per strategy: throughput, p50/p99, errors, and per backend the share of
+requests, failures and whether it ended ejected. ``--health-interval 0`` turns
+the active health checks off, so the dead node is only avoided by ejection.
+
+    python -m benchmarks.backend_routing --requests 400 --concurrency 16
+"""
+import argparse
+import asyncio
+import logging
+import random
+import statistics
+import subprocess
+import sys
+import time
+from typing import List
+
+import httpx
+
+import main
+from backend_pool import PoolConfig
+from benchmarks.gateway_load import FAKE_IMAGE
+from benchmarks.stubs import ServerThread, make_validation_stub
+
+# (name, stub arguments); None: nothing listens on the port
+BACKENDS = [
+    ("fast-1", ["--latency", "0.1"]),
+    ("fast-2", ["--latency", "0.1"]),
+    ("slow", ["--latency", "0.3"]),
+    ("tail", ["--latency", "0.1", "--slow-rate", "0.1", "--slow-latency", "1.5"]),
+    ("dead", None),
+]
+
+
+def start_stubs(base_port: int) -> List[subprocess.Popen]:
+    processes = []
+    for offset, (_, stub_args) in enumerate(BACKENDS):
+        if stub_args is not None:
+            processes.append(subprocess.Popen(
+                [sys.executable, "-m", "benchmarks.stubs", "ocr", "--port", str(base_port + offset), *stub_args]))
+    deadline = time.monotonic() + 30
+    for offset, (name, stub_args) in enumerate(BACKENDS):
+        while stub_args is not None:
+            try:
+                if httpx.get(f"http://127.0.0.1:{base_port + offset}/ready", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"OCR stub {name} failed to start")
+            time.sleep(0.1)
+    return processes
+
+
+def random_pick(pool):
+    def pick(exclude=()):
+        now = time.monotonic()
+        candidates = [b for b in pool.backends if b not in exclude] or pool.backends
+        return random.choice([b for b in candidates if b.available(now)] or candidates)
+    return pick
+
+
+async def load(url: str, concurrency: int, total: int) -> dict:
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(timeout=60, limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(url, files={"file": ("id_card.jpg", FAKE_IMAGE, "image/jpeg")})
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "throughput": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "errors": errors,
+    }
+
+
+def run(strategy: str, gateway_url: str, urls: List[str], args) -> None:
+    pool = main.ocr_backends
+    pool.set_urls(urls)
+    pool.latencies.clear()
+    pool.counters.clear()
+    pool.hedge_after = "p95" if strategy == "hedged" else ""
+    if strategy == "random":
+        pool.pick = random_pick(pool)
+    else:
+        pool.__dict__.pop("pick", None)
+    # Let a round of health checks see the new backends
+    time.sleep(min(PoolConfig.HEALTH_INTERVAL, 1.0) + 0.2 if PoolConfig.HEALTH_INTERVAL > 0 else 0)
+
+    if strategy == "hedged":
+        # Warm-up: the p95 threshold needs latencies first
+        asyncio.run(load(f"{gateway_url}/process/", args.concurrency, PoolConfig.HEDGE_MIN_SAMPLES * 2))
+    result = asyncio.run(load(f"{gateway_url}/process/", args.concurrency, args.requests))
+    stats = pool.stats()
+    total = sum(backend["requests"] for backend in stats["backends"]) or 1
+    shares = ", ".join(f"{name} {backend['requests'] / total:.0%}"
+                       + (f" ({backend['failures']} failed{', ejected' if backend['ejected_for_s'] else ''})"
+                          if backend["failures"] else "")
+                       for (name, _), backend in zip(BACKENDS, stats["backends"]))
+    print(f"{strategy:>12}: {result['throughput']:6.1f} req/s, p50 {result['p50_ms']:6.0f} ms, "
+          f"p99 {result['p99_ms']:6.0f} ms, {result['errors']} errors, "
+          f"{stats.get('retries', 0)} retries, {stats.get('hedges', 0)} hedges "
+          f"({stats.get('hedge_wins', 0)} won)\n{'':>14}{shares}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--strategies", default="random,least-loaded,hedged")
+    parser.add_argument("--health-interval", type=float, default=PoolConfig.HEALTH_INTERVAL,
+                        help="seconds between health checks, 0 for none")
+    parser.add_argument("--base-port", type=int, default=18300)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # one line per request otherwise
+    PoolConfig.HEALTH_INTERVAL = args.health_interval
+    port = args.base_port
+    urls = [f"http://127.0.0.1:{port + 10 + offset}" for offset in range(len(BACKENDS))]
+    processes = start_stubs(port + 10)
+    try:
+        with ServerThread(make_validation_stub(), port + 2) as validation:
+            main.validation_backends.set_urls([validation.url])
+            main.ocr_backends.set_urls(urls)
+            with ServerThread(main.app, port) as gateway:
+                for strategy in args.strategies.split(","):
+                    run(strategy, gateway.url, urls, args)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+if __name__ == "__main__":
+    main_cli()
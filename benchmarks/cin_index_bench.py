@@ -0,0 +1,69 @@
+"""
+Build time, memory and lookup cost of the CIN index at growing sizes, next to a
+Python set of CIN strings.
+
+Lookup cost should stay flat as the index grows (constant-time membership).
+
+    python -m benchmarks.cin_index_bench [--sizes 10000,1000000,5000000] [--batch 10000]
+"""
+import argparse
+import random
+import string
+import sys
+import time
+
+import numpy as np
+
+from cin_index import CINSet, pack_cin
+
+
+def random_cins(count: int, seed: int):
+    rng = random.Random(seed)
+    letters, digits = string.ascii_uppercase, string.digits
+    return [
+        "".join(rng.choices(letters, k=rng.randint(1, 2))) + "".join(rng.choices(digits, k=rng.randint(5, 6)))
+        for _ in range(count)
+    ]
+
+
+def set_bytes(values: set) -> int:
+    return sys.getsizeof(values) + sum(sys.getsizeof(value) for value in values)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="10000,1000000,5000000")
+    parser.add_argument("--batch", type=int, default=10000)
+    args = parser.parse_args()
+
+    queries = random_cins(args.batch, seed=1)
+    query_keys = np.array([pack_cin(cin) for cin in queries], dtype=np.uint32)
+    for size in map(int, args.sizes.split(",")):
+        cins = random_cins(size, seed=0)
+
+        start = time.perf_counter()
+        index = CINSet(pack_cin(cin) for cin in cins)
+        build_s = time.perf_counter() - start
+        strings = set(cins)
+
+        start = time.perf_counter()
+        found = index.contains_many(query_keys)
+        batch_ns = (time.perf_counter() - start) / len(queries) * 1e9
+
+        start = time.perf_counter()
+        for key in query_keys[:1000].tolist():
+            key in index
+        single_ns = (time.perf_counter() - start) / 1000 * 1e9
+
+        start = time.perf_counter()
+        expected = [cin in strings for cin in queries]
+        set_ns = (time.perf_counter() - start) / len(queries) * 1e9
+        assert found.tolist() == expected
+
+        print(f"{size:>9} CINs ({len(index)} unique): build {build_s:.2f} s, "
+              f"{index.nbytes / len(index):.1f} B/entry (set of str: {set_bytes(strings) / len(strings):.1f}), "
+              f"batch lookup {batch_ns:.0f} ns/CIN, single {single_ns:.0f} ns, set {set_ns:.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Cold start of each service: import time, time until it is live and ready, and the
+latency of its first and second requests.
+
+Each service is started in a fresh interpreter with uvicorn, as a new replica
+would be. Reported per service:
+- import: median time to import the service module (separate runs), and which
+  heavy libraries that import pulls in
+- live: process start until the first HTTP answer (``/metrics``)
+- ready: process start until ``/ready`` answers 200 (OCR: after its warm-up)
+- first / second: latency of the first real request once ready, and of the next
+
+The OCR service is measured with ``OCR_WARMUP=on`` and ``off``: without warm-up it
+is ready at once and its first request pays for the models instead. The gateway
+calls OCR and validation stand-ins. ``--stub-ocr`` answers every Tesseract call at
+once, to measure the rest of the start-up where Tesseract is not installed.
+
+    python -m benchmarks.cold_start [--runs 5] [--stub-ocr]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, Optional
+
+import httpx
+
+from benchmarks.synthetic_cards import generate
+
+HEAVY_MODULES = ("numpy", "cv2", "PIL", "pytesseract", "tesserocr", "langdetect", "httpx")
+PORT = 8220
+STUB_PORTS = {"ocr": 8221, "validation": 8222}
+SERVICES = {
+    # module, environment, first request
+    "ocr (warm-up)": ("ocr_service", {"OCR_WARMUP": "on"}, "ocr"),
+    "ocr (no warm-up)": ("ocr_service", {"OCR_WARMUP": "off"}, "ocr"),
+    "validation": ("validation_service", {}, "validation"),
+    "gateway": ("main", {"GATEWAY_MODE": "http"}, "gateway"),
+}
+
+
+def import_time(module: str, env: Dict[str, str], runs: int) -> dict:
+    code = (f"import sys, time; start = time.perf_counter(); import {module}; "
+            f"print(time.perf_counter() - start); print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    durations, loaded = [], ""
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", code], env={**os.environ, **env},
+                                check=True, capture_output=True, text=True).stdout.split("\n")
+        durations.append(float(output[0]))
+        loaded = output[1]
+    return {"import_ms": round(statistics.median(durations) * 1000), "loads": loaded or "-"}
+
+
+def request(client: httpx.Client, kind: str, card: bytes) -> httpx.Response:
+    if kind == "ocr":
+        return client.post("/ocr/", files={"file": ("card.jpg", card, "image/jpeg")})
+    if kind == "validation":
+        return client.post("/validate/", json={"cin": "AB123456"})
+    return client.post("/process/", files={"file": ("card.jpg", card, "image/jpeg")})
+
+
+def wait_for(client: httpx.Client, path: str, deadline: float, status: Optional[int] = None) -> Optional[float]:
+    while time.perf_counter() < deadline:
+        try:
+            response = client.get(path)
+            if status is None or response.status_code == status:
+                return time.perf_counter()
+            if response.status_code == 503 and response.json().get("status") == "failed":
+                return None
+        except httpx.TransportError:
+            pass
+        time.sleep(0.01)
+    return None
+
+
+def start_service(name: str, args) -> dict:
+    module, env, kind = SERVICES[name]
+    command = [sys.executable, "-m", "benchmarks.cold_start", "--child", "--module", module, "--kind", kind]
+    if args.stub_ocr:
+        command.append("--stub-ocr")
+    # Two different cards, so the second request is not answered from the results cache
+    cards = [data for _, data in generate(2, "light")]
+    start = time.perf_counter()
+    process = subprocess.Popen(command, env={**os.environ, **env}, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{PORT}", timeout=120) as client:
+            deadline = start + args.timeout
+            live = wait_for(client, "/metrics", deadline)
+            ready = wait_for(client, "/ready", deadline, status=200) if live else None
+            result = {"live_ms": round((live - start) * 1000) if live else None,
+                      "ready_ms": round((ready - start) * 1000) if ready else None}
+            if ready is None:
+                result["error"] = client.get("/ready").json().get("error") if live else "not live"
+                return result
+            for label, card in zip(("first_ms", "second_ms"), cards):
+                began = time.perf_counter()
+                response = request(client, kind, card)
+                result[label] = round((time.perf_counter() - began) * 1000)
+                result["status"] = response.status_code
+            return result
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def child(args) -> None:
+    import uvicorn
+    if args.stub_ocr:
+        import tesseract_pool
+        tesseract_pool.image_to_string = lambda image, lang, psm=3, dpi=None, whitelist=None: ""
+        tesseract_pool.image_to_data = lambda image, lang, psm=3, dpi=None, whitelist=None: []
+    module = __import__(args.module)
+    servers = []
+    if args.kind == "gateway":
+        from benchmarks.stubs import ServerThread, make_ocr_stub, make_validation_stub
+        module.ocr_backends.set_urls([f"http://127.0.0.1:{STUB_PORTS['ocr']}"])
+        module.validation_backends.set_urls([f"http://127.0.0.1:{STUB_PORTS['validation']}"])
+        servers = [ServerThread(make_ocr_stub(0.0), STUB_PORTS["ocr"]),
+                   ServerThread(make_validation_stub(0.0), STUB_PORTS["validation"])]
+        for server in servers:
+            server.__enter__()
+    uvicorn.run(module.app, host="127.0.0.1", port=PORT, log_level="warning")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="imports timed per service")
+    parser.add_argument("--services", default=",".join(SERVICES))
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds to wait for a service to be ready")
+    parser.add_argument("--stub-ocr", action="store_true", help="answer every Tesseract call at once")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--module", help=argparse.SUPPRESS)
+    parser.add_argument("--kind", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    results: Dict[str, dict] = {}
+    for name in args.services.split(","):
+        module, env, _ = SERVICES[name]
+        result = results[name] = {**import_time(module, env, args.runs), **start_service(name, args)}
+        if args.json:
+            continue
+        timings = ", ".join(f"{label} {result[key]} ms" for key, label in
+                            (("live_ms", "live"), ("ready_ms", "ready"), ("first_ms", "first"), ("second_ms", "second"))
+                            if result.get(key) is not None)
+        print(f"{name:>16}: import {result['import_ms']} ms ({result['loads']}), {timings}"
+              + (f", not ready: {result['error']}" if result.get("error") else ""))
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
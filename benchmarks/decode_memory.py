@@ -0,0 +1,110 @@
+"""
+Peak memory and time of decoding one upload: PIL to a full-resolution array plus
+a grayscale conversion (the previous path) versus ``image_decode.decode_gray``.
+
+Each measurement runs in a fresh interpreter whose peak RSS is reset just before
+decoding; the reported figure is the peak (``VmHWM``) minus the RSS at that point.
+Linux only: it relies on ``/proc/self/clear_refs`` and ``/proc/self/status``.
+
+    python -m benchmarks.decode_memory [--sizes 1000x630,4000x2520] [--target-side 2000]
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+import card_layout
+import image_decode
+
+SIZES = "1000x630,2000x1260,4000x2520,6000x3780"
+
+
+def legacy_decode(data: bytes, target_side: int) -> np.ndarray:
+    return card_layout.to_gray(np.array(Image.open(io.BytesIO(data))))
+
+
+def gray_decode(data: bytes, target_side: int) -> np.ndarray:
+    return image_decode.decode_gray(data, target_side=target_side,
+                                    max_bytes=2 ** 31, max_pixels=10 ** 9)
+
+
+DECODERS = {"legacy": legacy_decode, "decode_gray": gray_decode}
+
+
+def sample_bytes(width: int, height: int, fmt: str) -> bytes:
+    # Noisy content so the encoded size is realistic for a photo
+    rng = np.random.default_rng(0)
+    small = rng.integers(0, 255, (height // 8, width // 8, 3), dtype=np.uint8)
+    image = Image.fromarray(small).resize((width, height), Image.Resampling.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **({"quality": 90} if fmt == "JPEG" else {}))
+    return buffer.getvalue()
+
+
+def proc_status_kb(field: str) -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    raise KeyError(field)
+
+
+def child(path: str, decoder: str, target_side: int) -> None:
+    with open(path, "rb") as f:
+        data = f.read()
+    # Reset the high-water mark so the import-time peak is not counted
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    before_kb = proc_status_kb("VmRSS")
+    start = time.perf_counter()
+    image = DECODERS[decoder](data, target_side)
+    elapsed = time.perf_counter() - start
+    peak_kb = proc_status_kb("VmHWM")
+    print(json.dumps({"ms": elapsed * 1000, "peak_mb": (peak_kb - before_kb) / 1024, "shape": image.shape}))
+
+
+def measure(path: str, decoder: str, target_side: int) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.decode_memory", "--child", path, decoder, str(target_side)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default=SIZES, help="comma-separated WIDTHxHEIGHT list")
+    parser.add_argument("--formats", default="JPEG,PNG")
+    parser.add_argument("--target-side", type=int, default=image_decode.DecodeConfig.TARGET_SIDE)
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        path, decoder, target_side = args.child
+        child(path, decoder, int(target_side))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes.split(","):
+            width, height = map(int, size.split("x"))
+            for fmt in args.formats.split(","):
+                path = os.path.join(tmp, f"{size}.{fmt.lower()}")
+                with open(path, "wb") as f:
+                    f.write(sample_bytes(width, height, fmt))
+                results = {name: measure(path, name, args.target_side) for name in DECODERS}
+                legacy, new = results["legacy"], results["decode_gray"]
+                print(f"{size} {fmt} ({os.path.getsize(path) / 1e6:.1f} MB): "
+                      f"legacy {legacy['ms']:.0f} ms / +{legacy['peak_mb']:.0f} MB peak, "
+                      f"decode_gray {new['ms']:.0f} ms / +{new['peak_mb']:.0f} MB peak "
+                      f"-> {tuple(new['shape'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+End-to-end benchmark of ``/ocr/`` (``extract_text``) and ``/process/``
+(``process_id_card``) on a synthetic card corpus.
+
+Each target is driven in-process (ASGI transport, no sockets; the gateway runs in
+monolith mode) and over HTTP (uvicorn on local ports; the gateway calls the OCR
+and validation services as separate servers, as in production). Every
+(target, transport) pair runs in its own interpreter so its peak memory is its
+own: the figure is the peak RSS (``VmHWM``) above the RSS once the services and
+corpus are loaded (Linux only).
+
+Reported per pair: throughput, latency percentiles, peak memory, HTTP errors and
+per-field accuracy against the card labels. ``--save`` writes the report as JSON;
+``--compare`` prints the change against a report saved earlier.
+
+``--stub-ocr`` replaces the OCR pipeline with a fixed answer after
+``--ocr-latency`` seconds to measure the serving overhead alone (accuracy is then
+meaningless); otherwise Tesseract must be installed.
+
+    python -m benchmarks.end_to_end --cards 50 --degradation medium --concurrency 4 \\
+        [--side back] [--corpus corpus] [--save baseline.json] [--compare baseline.json]
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.decode_memory import proc_status_kb
+from benchmarks.synthetic_cards import DEGRADATIONS, CardSpec, generate, load_corpus
+
+PORTS = {"gateway": 8210, "ocr": 8211, "validation": 8212}
+TARGETS = {
+    # endpoint, fields it returns
+    "ocr": ("/ocr/", ("cin", "name", "first_name", "birth_date", "city")),
+    "gateway": ("/process/", ("cin", "name", "first_name")),
+}
+TRANSPORTS = ("inprocess", "http")
+
+
+def normalize(field: str, value) -> Optional[str]:
+    if not value:
+        return None
+    value = " ".join(str(value).upper().split())
+    return re.sub(r"[.\-]", "/", value) if field == "birth_date" else value
+
+
+def percentile(values: List[float], q: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * q))] if values else float("nan")
+
+
+async def drive(client: httpx.AsyncClient, path: str, fields: Tuple[str, ...],
+                cards: List[Tuple[CardSpec, bytes]], concurrency: int) -> dict:
+    latencies, errors = [], 0
+    correct = dict.fromkeys(fields, 0)
+    all_correct = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(spec: CardSpec, data: bytes):
+        nonlocal errors, all_correct
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(path, files={"file": ("card.jpg", data, "image/jpeg")})
+            latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            errors += 1
+            return
+        result, expected = response.json(), spec.expected()
+        matches = [normalize(f, result.get(f)) == normalize(f, expected[f]) for f in fields]
+        for field, match in zip(fields, matches):
+            correct[field] += match
+        all_correct += all(matches)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(spec, data) for spec, data in cards))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "cards": len(cards),
+        "errors": errors,
+        "throughput_per_s": round(len(cards) / elapsed, 2),
+        "latency_ms": {name: round(percentile(latencies, q), 1)
+                       for name, q in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0))},
+        "accuracy": {**{field: round(count / len(cards), 3) for field, count in correct.items()},
+                     "all_fields": round(all_correct / len(cards), 3)},
+    }
+
+
+_rss_at_reset = 0
+
+
+def reset_peak() -> None:
+    # Services and corpus are loaded: only what the requests add is counted
+    global _rss_at_reset
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    _rss_at_reset = proc_status_kb("VmRSS")
+
+
+def child(args) -> None:
+    # Read at import by main: in-process means everything in this interpreter
+    os.environ["GATEWAY_MODE"] = "monolith" if args.transport == "inprocess" else "http"
+    # Steady state only: cold start and warm-up are measured by benchmarks.cold_start
+    os.environ.setdefault("OCR_WARMUP", "off")
+    import main
+    import ocr_service
+    import validation_service
+    from admission import AdmissionController
+    from benchmarks.stubs import STUB_RESULT, ServerThread
+    from ocr_cache import OCRCache
+
+    ocr_service.ocr_cache = OCRCache(max_entries=0)  # measure the pipeline, not the cache
+    # Closed loop: every client may wait its turn instead of being shed
+    ocr_service.admission = AdmissionController(max_waiting=args.concurrency)
+    if args.stub_ocr:
+        async def process_image(data: bytes) -> dict:
+            await asyncio.sleep(args.ocr_latency)
+            return dict(STUB_RESULT)
+        ocr_service.process_image = process_image
+
+    cards = load_corpus(args.corpus) if args.corpus else \
+        list(generate(args.cards, args.degradation, args.seed, args.side))
+    path, fields = TARGETS[args.target]
+    app = main.app if args.target == "gateway" else ocr_service.app
+
+    async def run_inprocess() -> dict:
+        # The ASGI transport does not send lifespan events
+        if args.target == "gateway":
+            await main.startup()
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+                reset_peak()
+                return await drive(client, path, fields, cards, args.concurrency)
+        finally:
+            if args.target == "gateway":
+                await main.shutdown()
+
+    async def run_http(url: str) -> dict:
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=url, timeout=600, limits=limits) as client:
+            reset_peak()
+            return await drive(client, path, fields, cards, args.concurrency)
+
+    if args.transport == "inprocess":
+        result = asyncio.run(run_inprocess())
+    else:
+        main.ocr_backends.set_urls([f"http://127.0.0.1:{PORTS['ocr']}"])
+        main.validation_backends.set_urls([f"http://127.0.0.1:{PORTS['validation']}"])
+        servers = [ServerThread(ocr_service.app, PORTS["ocr"])]
+        if args.target == "gateway":
+            servers += [ServerThread(validation_service.app, PORTS["validation"]),
+                        ServerThread(main.app, PORTS["gateway"])]
+        for server in servers:
+            server.__enter__()
+        try:
+            result = asyncio.run(run_http(servers[-1].url))
+        finally:
+            for server in reversed(servers):
+                server.__exit__(None, None, None)
+
+    result["peak_memory_mb"] = round((proc_status_kb("VmHWM") - _rss_at_reset) / 1024, 1)
+    print(json.dumps(result))
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {"git_commit": commit or None, "python": platform.python_version(), "platform": platform.platform(),
+            "cpu_count": os.cpu_count(), "date": datetime.datetime.now().isoformat(timespec="seconds")}
+
+
+def print_result(key: str, result: dict, baseline: Optional[dict]) -> None:
+    def change(path: Tuple[str, ...], value: float) -> str:
+        old = baseline
+        for part in path:
+            old = old.get(part) if isinstance(old, dict) else None
+        if not isinstance(old, (int, float)) or not old:
+            return ""
+        return f" ({(value - old) / old:+.0%})"
+
+    latency, accuracy = result["latency_ms"], result["accuracy"]
+    print(f"{key:>18}: {result['throughput_per_s']:.2f} cards/s{change(('throughput_per_s',), result['throughput_per_s'])}, "
+          f"p50 {latency['p50']:.0f} ms{change(('latency_ms', 'p50'), latency['p50'])}, "
+          f"p99 {latency['p99']:.0f} ms{change(('latency_ms', 'p99'), latency['p99'])}, "
+          f"peak +{result['peak_memory_mb']:.0f} MB{change(('peak_memory_mb',), result['peak_memory_mb'])}, "
+          f"{result['errors']} errors")
+    print(" " * 20 + "accuracy " + ", ".join(
+        f"{field} {value:.0%}{change(('accuracy', field), value)}" for field, value in accuracy.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cards", type=int, default=50)
+    parser.add_argument("--degradation", choices=sorted(DEGRADATIONS), default="medium")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--side", choices=("front", "back"), default="front",
+                        help="back: cards read through their machine-readable zone")
+    parser.add_argument("--corpus", help="directory written by benchmarks.synthetic_cards (instead of generating)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--targets", default="ocr,gateway")
+    parser.add_argument("--transports", default=",".join(TRANSPORTS))
+    parser.add_argument("--stub-ocr", action="store_true", help="fixed OCR answer: serving overhead only")
+    parser.add_argument("--ocr-latency", type=float, default=0.0, help="delay of the --stub-ocr answer, seconds")
+    parser.add_argument("--save", help="write the report to this JSON file")
+    parser.add_argument("--compare", help="report saved by an earlier --save run")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--target", help=argparse.SUPPRESS)
+    parser.add_argument("--transport", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    config = {name: getattr(args, name) for name in
+              ("cards", "degradation", "seed", "side", "corpus", "concurrency", "stub_ocr", "ocr_latency")}
+    results: Dict[str, dict] = {}
+    for target in args.targets.split(","):
+        for transport in args.transports.split(","):
+            command = [sys.executable, "-m", "benchmarks.end_to_end", "--child",
+                       "--target", target, "--transport", transport,
+                       "--cards", str(args.cards), "--degradation", args.degradation, "--seed", str(args.seed),
+                       "--side", args.side,
+                       "--concurrency", str(args.concurrency), "--ocr-latency", str(args.ocr_latency)]
+            if args.corpus:
+                command += ["--corpus", args.corpus]
+            if args.stub_ocr:
+                command.append("--stub-ocr")
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+            key = f"{target}/{transport}"
+            results[key] = json.loads(output.strip().splitlines()[-1])
+            print_result(key, results[key], (baseline or {}).get("results", {}).get(key))
+
+    if baseline is not None and baseline.get("config") != config:
+        print("note: the baseline was run with different settings:", baseline.get("config"))
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"environment": environment(), "config": config, "results": results}, f, indent=2)
+        print(f"report saved to {args.save}")
+
+
+if __name__ == "__main__":
+    main()
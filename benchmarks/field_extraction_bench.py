@@ -0,0 +1,129 @@
+"""
+Shared field extraction engine versus the previous ``DataExtractor`` heuristics.
+
+Every text of the corpus (one JSON object with a ``text`` key per line) plus
+``--fuzz`` random OCR-like texts is run through both; any difference in the
+extracted fields is printed and makes the run fail. Timings are the median over
+``--runs`` passes on the whole set.
+
+The gateways' fallback (``complete_fields``) is also checked: a field missing
+from a field-zone or MRZ response must stay missing, since their raw text is
+labelled lines that the extractor would read as names.
+
+    python -m benchmarks.field_extraction_bench --runs 20 [--corpus more.jsonl ...]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+import field_extraction
+from benchmarks.legacy_extraction import DataExtractor
+
+CORPUS = os.path.join(os.path.dirname(__file__), "ocr_corpus.jsonl")
+
+FUZZ_TOKENS = ["ROYAUME", "DU", "MAROC", "CARTE", "NATIONALE", "Né", "le", "Née", "nele", "à", "SARA",
+               "ALAMI", "AB", "123456", "K", "98765", "12.03.1990", "1.1.1900", "31 12 2024", "29-02-2004",
+               "تاريخ الازدياد", "المملكة", "CIN", "|", "=", ":", "0", "19", "2001", "١٢٣٤٥٦", "\t"]
+
+
+def load_corpus(paths):
+    texts = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            texts.extend(json.loads(line)["text"] for line in f if line.strip())
+    return texts
+
+
+def fuzz_texts(count: int, seed: int):
+    rng = random.Random(seed)
+    return [
+        "\n".join(" ".join(rng.choice(FUZZ_TOKENS) for _ in range(rng.randint(0, 4)))
+                  for _ in range(rng.randint(1, 10)))
+        for _ in range(count)
+    ]
+
+
+def legacy(text: str) -> dict:
+    name, first_name = DataExtractor.extract_name_components(text)
+    return {
+        "cin": DataExtractor.extract_moroccan_cin(text),
+        "name": name,
+        "first_name": first_name,
+        "birth_date": DataExtractor.extract_birth_date(text),
+    }
+
+
+def time_runs(fn, texts, runs: int) -> float:
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        for text in texts:
+            fn(text)
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations) / len(texts) * 1e6
+
+
+# OCR service responses with fields missing, and the fields the gateway must end up with
+FALLBACK_CASES = [
+    ({"cin": "AB123456", "name": "ALAMI", "first_name": None, "text_source": "roi",
+      "raw_text": "first_name: \nname: ALAMI\nbirth_date: 12.03.1990\ncity: RABAT\ncin: AB123456"},
+     {"cin": "AB123456", "name": "ALAMI", "first_name": None}),
+    ({"cin": "AB123456", "name": None, "first_name": None, "text_source": "roi",
+      "raw_text": "first_name: \nname: \nbirth_date: 12.03.1990\ncity: RABAT\ncin: AB123456"},
+     {"cin": "AB123456", "name": None, "first_name": None}),
+    ({"cin": "AB123456", "name": None, "first_name": None, "text_source": "mrz",
+      "raw_text": "IDMARAB123456<<<<<<<<<<<<<<<<\n9003125F3001012MAR<<<<<<<<<<<4\nALAMI<<SARA<<<<<<<<<<<<<<<<<<<"},
+     {"cin": "AB123456", "name": None, "first_name": None}),
+    ({"cin": None, "name": None, "first_name": None, "text_source": "full",
+      "raw_text": "ROYAUME DU MAROC\nSARA\nALAMI\nNée le 12.03.1990\nAB123456"},
+     field_extraction.extract_fields("ROYAUME DU MAROC\nSARA\nALAMI\nNée le 12.03.1990\nAB123456")),
+]
+
+
+def check_fallback() -> int:
+    failures = 0
+    for response, expected in FALLBACK_CASES:
+        actual = field_extraction.complete_fields(response, ("cin", "name", "first_name"))
+        expected = {field: expected[field] for field in actual}
+        if actual != expected:
+            failures += 1
+            print(f"fallback on a {response['text_source']} response: expected {expected}, got {actual}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--corpus", action="append", help="extra JSONL corpus (repeatable)")
+    parser.add_argument("--fuzz", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    corpus = load_corpus([CORPUS] + (args.corpus or []))
+    texts = corpus + fuzz_texts(args.fuzz, args.seed)
+    engine = field_extraction.FieldExtractor(field_extraction.VALID_YEAR_RANGE)
+
+    mismatches = 0
+    for text in texts:
+        expected, actual = legacy(text), engine.extract_values(text)
+        if expected != actual:
+            mismatches += 1
+            print(f"mismatch on {text!r}:\n  legacy {expected}\n  engine {actual}")
+    print(f"{len(corpus)} corpus + {args.fuzz} fuzz texts, {mismatches} mismatches")
+    fallback_failures = check_fallback()
+    print(f"{len(FALLBACK_CASES)} gateway fallback cases, {fallback_failures} failures")
+
+    for name, subset in (("corpus", corpus), ("corpus+fuzz", texts)):
+        legacy_us = time_runs(legacy, subset, args.runs)
+        engine_us = time_runs(engine.extract_values, subset, args.runs)
+        print(f"{name}: legacy {legacy_us:.1f} us/text, engine {engine_us:.1f} us/text "
+              f"({legacy_us / engine_us:.1f}x)")
+    sys.exit(1 if mismatches or fallback_failures else 0)
+
+
+if __name__ == "__main__":
+    main()
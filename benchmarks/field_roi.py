@@ -0,0 +1,73 @@
+"""
+Full-page OCR versus card detection + field-zone OCR.
+
+Without ``--image`` a card is rendered with the field values placed in the zones of
+``card_layout.FIELDS`` and pasted, slightly rotated, on a larger background photo.
+
+    python -m benchmarks.field_roi --runs 5 [--image card.jpg ...]
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+import card_layout
+import tesseract_pool
+
+SAMPLE = {"first_name": "SARA", "name": "ALAMI", "birth_date": "12.03.1990",
+          "city": "CASABLANCA", "cin": "AB123456"}
+
+
+def render_sample() -> np.ndarray:
+    width, height = card_layout.LayoutConfig.CARD_SIZE
+    card = Image.new("L", (width, height), 235)
+    draw = ImageDraw.Draw(card)
+    try:
+        font = ImageFont.truetype("DejaVuSans-Bold.ttf", 40)
+    except OSError:
+        font = ImageFont.load_default()
+    draw.text((40, 30), "ROYAUME DU MAROC", fill=20, font=font)
+    draw.rectangle((30, 130, 280, 480), fill=150)  # portrait
+    for field, value in SAMPLE.items():
+        x0, y0, _, _ = card_layout.FIELDS[field].box
+        draw.text((int(x0 * width) + 8, int(y0 * height) + 6), value, fill=10, font=font)
+    photo = Image.new("L", (1800, 1300), 90)
+    photo.paste(card.rotate(4, expand=True, fillcolor=90), (350, 280))
+    return np.array(photo)
+
+
+def full_page(image: np.ndarray) -> str:
+    return tesseract_pool.image_to_string(card_layout.to_gray(image), lang="fra+ara", psm=3)
+
+
+def time_runs(fn, image, runs: int):
+    durations, result = [], None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn(image)
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--image", action="append", help="ID card photo (repeatable)")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    images = [(path, np.array(Image.open(path))) for path in args.image] if args.image else [("sample", render_sample())]
+    for name, image in images:
+        full_ms, text = time_runs(full_page, image, args.runs)
+        roi_ms, (fields, _) = time_runs(card_layout.read_fields, image, args.runs)
+        print(f"{name}: full-page {full_ms:.0f} ms, field zones {roi_ms:.0f} ms ({full_ms / roi_ms:.1f}x)")
+        print(f"  fields: {fields}")
+        if name == "sample":
+            expected = dict(SAMPLE, birth_date="12/03/1990")
+            correct = sum(fields.get(k) == v for k, v in expected.items())
+            print(f"  correct fields: {correct}/{len(expected)}; full-page text has CIN: {SAMPLE['cin'] in text}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Camera-frame streaming versus still uploads, on simulated handheld camera bursts.
+
+Each card is "filmed": a burst of frames, each photographed again with its own
+shake (blur), tilt and glare, as a phone held over the card would capture them.
+- stills: the user uploads a full-resolution photo and takes another one while
+  the answer lacks the CIN or the birth date (up to ``--max-shots``)
+- stream: downscaled frames are fed at ``--fps`` to a ``frame_stream.FrameSession``,
+  which scores them, OCRs the best ones and votes until the fields are stable
+
+Reported per mode: OCR runs, bytes sent and seconds until the answer per card,
+the answer's accuracy against the card labels, and (stream) the frame-scoring
+cost. ``--stub-ocr`` simulates the reads instead of running Tesseract: after
+``--ocr-latency`` seconds, each field is read right with a probability falling
+with the frame's shake blur, otherwise with one character changed.
+
+    python -m benchmarks.frame_stream --cards 10 --frames 30 --fps 5 [--stub-ocr]
+"""
+import argparse
+import asyncio
+import io
+import random
+import statistics
+import time
+from typing import Callable, Dict, List, NamedTuple
+
+from PIL import Image, ImageFilter
+
+import frame_stream
+from benchmarks.end_to_end import normalize
+from benchmarks.synthetic_cards import CardSpec, Degradation, photograph, random_spec, render_card
+
+FIELDS = ("cin", "name", "birth_date")
+# Handheld capture: every frame gets a fresh tilt and glare draw, and a shake blur
+# of up to MAX_SHAKE pixels (applied here, so the simulated OCR knows it)
+HANDHELD = Degradation(rotation=4.0, blur=0.0, glare=0.3, noise=5.0, jpeg_quality=(85, 90))
+MAX_SHAKE = 3.0
+
+
+class Frame(NamedTuple):
+    still: bytes  # full-resolution photo
+    streamed: bytes  # downscaled preview frame
+    shake: float  # blur radius, pixels
+
+
+def _jpeg(image: Image.Image, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def film(spec: CardSpec, frames: int, rng: random.Random, width: int) -> List[Frame]:
+    card = render_card(spec)
+    burst = []
+    for _ in range(frames):
+        shake = rng.uniform(0, MAX_SHAKE)
+        image = Image.open(io.BytesIO(photograph(card, rng, HANDHELD))).filter(ImageFilter.GaussianBlur(shake))
+        still = _jpeg(image, 85)
+        image.thumbnail((width, width))
+        burst.append(Frame(still, _jpeg(image, 70), shake))
+    return burst
+
+
+def simulated_ocr(frames: Dict[bytes, tuple], rng: random.Random, latency: float) -> Callable:
+    """
+    OCR stand-in: each field right with a probability of 1 - shake / MAX_SHAKE,
+    else one character off. ``frames`` maps frame bytes to their card and shake.
+    """
+    async def ocr(data: bytes) -> dict:
+        spec, shake = frames[data]
+        await asyncio.sleep(latency)
+        result = {}
+        for field, value in spec.expected().items():
+            if rng.random() > shake / MAX_SHAKE:
+                result[field] = value
+            else:
+                position = rng.randrange(len(value))
+                result[field] = value[:position] + rng.choice("0123456789ABCDEFGH") + value[position + 1:]
+        return result
+    return ocr
+
+
+def accuracy(result: dict, spec: CardSpec) -> bool:
+    expected = spec.expected()
+    return all(normalize(field, result.get(field)) == normalize(field, expected[field]) for field in FIELDS)
+
+
+async def run_stills(burst: List[Frame], ocr: Callable, max_shots: int) -> dict:
+    start, sent, result = time.perf_counter(), 0, {}
+    for shot, frame in enumerate(burst[:max_shots], 1):
+        sent += len(frame.still)
+        try:
+            result = await ocr(frame.still)
+        except ValueError:
+            result = {}
+        if result.get("cin") and result.get("birth_date"):
+            break
+    return {"ocr_runs": shot, "bytes": sent, "seconds": time.perf_counter() - start, "result": result}
+
+
+async def run_stream(burst: List[Frame], ocr: Callable, fps: float) -> dict:
+    async def ignore(message: dict) -> None:
+        pass
+
+    start, sent = time.perf_counter(), 0
+    session = frame_stream.FrameSession(ocr, ignore)
+    for frame in burst:
+        if session.worker.done():
+            break
+        began = time.perf_counter()
+        sent += len(frame.streamed)
+        await session.add_frame(frame.streamed)
+        await asyncio.sleep(max(0.0, 1 / fps - (time.perf_counter() - began)))
+    result = await session.finish()
+    return {"ocr_runs": result["ocr_frames"], "frames": result["frames"], "bytes": sent,
+            "seconds": time.perf_counter() - start, "stable": result["status"] == "stable", "result": result["fields"]}
+
+
+def report(name: str, runs: List[dict], specs: List[CardSpec]) -> None:
+    correct = sum(accuracy(run["result"], spec) for run, spec in zip(runs, specs))
+    line = (f"{name:>7}: {statistics.mean(run['ocr_runs'] for run in runs):.1f} OCR runs/card, "
+            f"{statistics.mean(run['bytes'] for run in runs) / 1024:.0f} KB sent/card, "
+            f"{statistics.median(run['seconds'] for run in runs):.1f} s to answer, "
+            f"cin+name+birth date right on {correct}/{len(runs)} cards")
+    if "stable" in runs[0]:
+        line += (f", stable on {sum(run['stable'] for run in runs)}/{len(runs)}, "
+                 f"{statistics.mean(run['frames'] for run in runs):.1f} frames sent/card")
+    print(line)
+
+
+async def main_async(args) -> None:
+    rng = random.Random(args.seed)
+    specs = [random_spec(rng) for _ in range(args.cards)]
+    bursts = [film(spec, args.frames, rng, args.frame_width) for spec in specs]
+
+    ocr: Callable
+    if args.stub_ocr:
+        frames = {data: (spec, frame.shake) for spec, burst in zip(specs, bursts)
+                  for frame in burst for data in (frame.still, frame.streamed)}
+        ocr = simulated_ocr(frames, random.Random(args.seed), args.ocr_latency)
+    else:
+        import ocr_service
+        ocr = ocr_service.process_image
+
+    start = time.perf_counter()
+    scores = [frame_stream.score_frame(frame.streamed) for burst in bursts for frame in burst]
+    score_ms = (time.perf_counter() - start) / len(scores) * 1000
+    print(f"scoring: {score_ms:.1f} ms/frame, {sum(score.usable for score in scores) / len(scores):.0%} of frames usable "
+          f"(card found, sharpness >= {frame_stream.StreamConfig.MIN_SHARPNESS:.0f}, "
+          f"glare <= {frame_stream.StreamConfig.MAX_GLARE:.0%})")
+
+    report("stills", [await run_stills(burst, ocr, args.max_shots) for burst in bursts], specs)
+    report("stream", [await run_stream(burst, ocr, args.fps) for burst in bursts], specs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cards", type=int, default=10)
+    parser.add_argument("--frames", type=int, default=30, help="frames filmed per card")
+    parser.add_argument("--fps", type=float, default=5.0, help="frames sent per second by the stream")
+    parser.add_argument("--frame-width", type=int, default=1280, help="long side of the streamed frames")
+    parser.add_argument("--max-shots", type=int, default=3, help="stills taken before giving up")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stub-ocr", action="store_true", help="simulate the OCR reads (no Tesseract)")
+    parser.add_argument("--ocr-latency", type=float, default=1.0, help="seconds per simulated OCR run")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
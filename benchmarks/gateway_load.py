@@ -0,0 +1,74 @@
+"""
+Load test for the ``/process/`` gateway against local OCR and validation stubs.
+
+The OCR stub answers after a fixed delay, so a non-blocking gateway should see its
+throughput grow roughly linearly with the number of concurrent uploads.
+
+    python -m benchmarks.gateway_load --ocr-latency 0.1 --requests-per-level 64
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+import main
+from benchmarks.stubs import ServerThread, make_ocr_stub, make_validation_stub
+
+FAKE_IMAGE = b"\xff\xd8\xff\xe0" + b"\x00" * 50_000
+
+
+async def run_level(url: str, concurrency: int, total: int) -> dict:
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(timeout=60, limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(url, files={"file": ("id_card.jpg", FAKE_IMAGE, "image/jpeg")})
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200 or not response.json().get("valid"):
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "throughput": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--ocr-latency", type=float, default=0.1)
+    parser.add_argument("--requests-per-level", type=int, default=64)
+    parser.add_argument("--levels", default="1,2,4,8,16,32")
+    parser.add_argument("--base-port", type=int, default=18000)
+    args = parser.parse_args()
+
+    port = args.base_port
+    with ServerThread(make_ocr_stub(args.ocr_latency), port + 3) as ocr, \
+            ServerThread(make_validation_stub(), port + 2) as validation:
+        main.ocr_backends.set_urls([ocr.url])
+        main.validation_backends.set_urls([validation.url])
+        with ServerThread(main.app, port) as gateway:
+            print(f"{'conc':>5} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+            for level in (int(x) for x in args.levels.split(",")):
+                total = max(args.requests_per_level, level)
+                r = asyncio.run(run_level(f"{gateway.url}/process/", level, total))
+                print(f"{r['concurrency']:>5} {r['throughput']:>8.1f} {r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main_cli()
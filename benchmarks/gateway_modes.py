@@ -0,0 +1,116 @@
+"""
+End-to-end latency of ``/process/`` in HTTP mode (gateway, OCR and validation as
+three servers) versus monolith mode (one server, direct calls).
+
+Unless ``--real-ocr`` is given, the OCR pipeline is replaced in both modes by a
+stand-in that waits ``--ocr-latency`` seconds, so the difference measured is the
+cost of the HTTP hops: multipart re-upload, JSON encoding and socket round trips.
+Each mode runs in its own interpreter since ``GATEWAY_MODE`` is read at import.
+
+    python -m benchmarks.gateway_modes --requests 200 [--ocr-latency 0] [--real-ocr]
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+from PIL import Image
+
+from benchmarks.field_roi import render_sample
+from benchmarks.stubs import STUB_RESULT, ServerThread
+
+PORTS = {"gateway": 8190, "ocr": 8191, "validation": 8192}
+
+
+def sample_png() -> bytes:
+    buffer = io.BytesIO()
+    Image.fromarray(render_sample()).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def child(requests: int, ocr_latency: float, real_ocr: bool) -> None:
+    import asyncio
+
+    import ocr_service
+    from ocr_cache import OCRCache
+
+    ocr_service.ocr_cache = OCRCache(max_entries=0)  # every request runs the pipeline
+    if not real_ocr:
+        async def process_image(data: bytes) -> dict:
+            await asyncio.sleep(ocr_latency)
+            return dict(STUB_RESULT)
+        ocr_service.process_image = process_image
+
+    import main
+    import validation_service
+
+    servers = [ServerThread(main.app, PORTS["gateway"])]
+    if main.GATEWAY_MODE == "http":
+        main.ocr_backends.set_urls([f"http://127.0.0.1:{PORTS['ocr']}"])
+        main.validation_backends.set_urls([f"http://127.0.0.1:{PORTS['validation']}"])
+        servers += [ServerThread(ocr_service.app, PORTS["ocr"]),
+                    ServerThread(validation_service.app, PORTS["validation"])]
+
+    image = sample_png()
+    latencies = []
+    for server in servers:
+        server.__enter__()
+    try:
+        with httpx.Client(timeout=60) as client:
+            url = f"{servers[0].url}/process/"
+            for i in range(requests + 5):
+                start = time.perf_counter()
+                response = client.post(url, files={"file": ("card.png", image, "image/png")})
+                elapsed = time.perf_counter() - start
+                response.raise_for_status()
+                if i >= 5:  # warm-up
+                    latencies.append(elapsed * 1000)
+    finally:
+        for server in reversed(servers):
+            server.__exit__(None, None, None)
+
+    latencies.sort()
+    print(json.dumps({
+        "mean": statistics.mean(latencies),
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[int(len(latencies) * 0.95)],
+        "result": response.json(),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--ocr-latency", type=float, default=0.0)
+    parser.add_argument("--real-ocr", action="store_true", help="run the real pipeline (needs Tesseract)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.requests, args.ocr_latency, args.real_ocr)
+        return
+
+    results = {}
+    for mode in ("http", "monolith"):
+        command = [sys.executable, "-m", "benchmarks.gateway_modes", "--child",
+                   "--requests", str(args.requests), "--ocr-latency", str(args.ocr_latency)]
+        if args.real_ocr:
+            command.append("--real-ocr")
+        output = subprocess.run(command, check=True, capture_output=True, text=True,
+                                env={**os.environ, "GATEWAY_MODE": mode}).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+        result = results[mode]
+        print(f"{mode:>8}: mean {result['mean']:.1f} ms, p50 {result['p50']:.1f} ms, p95 {result['p95']:.1f} ms")
+    if results["http"]["result"] != results["monolith"]["result"]:
+        print("responses differ:", results["http"]["result"], results["monolith"]["result"])
+    saved = results["http"]["p50"] - results["monolith"]["p50"]
+    print(f"monolith saves {saved:.1f} ms per card at p50")
+
+
+if __name__ == "__main__":
+    main()
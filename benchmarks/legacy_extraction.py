@@ -0,0 +1,110 @@
+"""
+Reference copy of the field extraction heuristics as they were before the shared
+engine in ``field_extraction``. Kept verbatim so the benchmark can check that the
+engine returns identical results on the corpus.
+"""
+import re
+from typing import Optional, Tuple
+
+
+class Config:
+    VALID_YEAR_RANGE = (1900, 2024)
+
+
+class DataExtractor:
+    @staticmethod
+    def extract_moroccan_cin(text: str) -> Optional[str]:
+        """
+        Extract CIN from text with enhanced pattern matching.
+        """
+        patterns = [
+            r'[A-Z]{1,2}\d{5,6}',  # Standard format
+            r'CIN\s*[A-Z]{1,2}\d{5,6}',  # With CIN prefix
+            r'[A-Z]{1,2}\s*\d{5,6}',  # With space between letters and numbers
+        ]
+        
+        for pattern in patterns:
+            matches = re.finditer(pattern, text, re.IGNORECASE)
+            for match in matches:
+                cin = match.group(0).replace(" ", "").upper()
+                if re.match(r'^[A-Z]{1,2}\d{5,6}$', cin):
+                    return cin
+        
+        return None
+
+    @staticmethod
+    def extract_name_components(text: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Extract name components with improved handling of Arabic and French text.
+        """
+        lines = [line.strip() for line in text.split('\n') if line.strip()]
+        name = first_name = None
+
+        for line in lines:
+            # Skip lines with digits or that are too short
+            if re.search(r'\d', line) or len(line) < 2:
+                continue
+
+            # Clean the line
+            cleaned_line = re.sub(r'[^\w\s\u0600-\u06FF]', '', line)
+            words = cleaned_line.split()
+
+            # Check for valid name line
+            if len(words) >= 2 and all(word.isalpha() for word in words):
+                if not first_name:
+                    first_name = words[0]
+                    name = " ".join(words[1:])
+                    break
+
+        return name, first_name
+
+    @staticmethod
+    def extract_birth_date(text: str) -> Optional[str]:
+        """
+        Extract birth date with comprehensive pattern matching.
+        """
+        # Process text line by line
+        lines = text.split('\n')
+        
+        date_patterns = [
+            r'(?<!\d)(\d{1,2})[.\s-](\d{1,2})[.\s-](\d{4})(?!\d)',
+            r'né\s?le\s*:?\s*(\d{1,2})[.\s-](\d{1,2})[.\s-](\d{4})',
+            r'nele\s*:?\s*(\d{1,2})[.\s-](\d{1,2})[.\s-](\d{4})',
+            r'(?:تاريخ الازدياد|تاريخ الميلاد)\s*:?\s*(\d{1,2})[.\s-](\d{1,2})[.\s-](\d{4})',
+            r'(?<!\d)(\d{2})[.\s-](\d{2})[.\s-](\d{4})(?!\d)',
+        ]
+        
+        def is_valid_date(day: str, month: str, year: str) -> bool:
+            try:
+                day, month, year = map(int, (day, month, year))
+                return (Config.VALID_YEAR_RANGE[0] <= year <= Config.VALID_YEAR_RANGE[1] and 
+                       1 <= month <= 12 and 
+                       1 <= day <= 31)
+            except:
+                return False
+        
+        # Check each line for dates
+        for line in lines:
+            line = ' '.join(line.split()).lower()
+            
+            for pattern in date_patterns:
+                matches = re.finditer(pattern, line)
+                for match in matches:
+                    if len(match.groups()) == 3:
+                        day, month, year = match.groups()
+                        day = day.zfill(2)
+                        month = month.zfill(2)
+                        
+                        if is_valid_date(day, month, year):
+                            return f"{day}/{month}/{year}"
+        
+        # Fallback: look for standalone numbers
+        for line in lines:
+            numbers = re.findall(r'\d+', line)
+            if len(numbers) >= 3:
+                for i in range(len(numbers)-2):
+                    day, month, year = numbers[i:i+3]
+                    if len(year) == 4 and is_valid_date(day, month, year):
+                        return f"{day.zfill(2)}/{month.zfill(2)}/{year}"
+        
+        return None
@@ -0,0 +1,124 @@
+"""
+Time the request thread spends in logging: synchronous handler versus the queued pipeline.
+
+The OCR service used to log each card's full OCR text at INFO through
+``logging.basicConfig``, plus the text again and a traceback on every failure.
+For each configuration the same per-request records are logged (one OCR record,
+and a failure record with traceback for ``--failure-rate`` of the requests), and
+the caller-side time per request is reported, with the bytes written.
+- sync: StreamHandler to a file, full text and traceback formatted and written
+  by the caller (the old behaviour)
+- queued: ``log_pipeline`` handler and background writer, text sampled at
+  ``LOG_TEXT_SAMPLE_RATE`` and redacted, JSON records
+
+``--sink-delay`` adds a delay per write, as a slow disk or a blocked pipe would.
+
+    python -m benchmarks.logging_overhead --requests 5000 [--sink-delay 0.0005]
+"""
+import argparse
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import statistics
+import tempfile
+import time
+
+import log_pipeline
+from benchmarks.synthetic_cards import random_spec
+
+TEXT_TEMPLATE = ("ROYAUME DU MAROC\nCARTE NATIONALE D'IDENTITE\n{first_name}\n{name}\nNé le {birth_date}\n"
+                 "à {city}\n{cin}\nValable jusqu'au 01.01.2030\n") * 3
+
+
+class SlowFileHandler(logging.FileHandler):
+    def __init__(self, path: str, delay: float):
+        super().__init__(path, encoding="utf-8")
+        self.delay = delay
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self.delay:
+            time.sleep(self.delay)
+        super().emit(record)
+
+
+def sync_request(logger: logging.Logger, text: str, fail: bool) -> None:
+    logger.info("OCR passes %s, field confidence %s, extracted text: %s", ["raw"], {"cin": 91.0}, text)
+    if fail:
+        logger.warning("CIN not found in text: %s", text)
+        try:
+            raise ValueError("Unable to extract CIN from the image.")
+        except ValueError as e:
+            logger.error("OCR processing error: %s", str(e), exc_info=True)
+
+
+def queued_request(logger: logging.Logger, text: str, fail: bool) -> None:
+    logger.info("OCR done", extra=log_pipeline.fields(
+        passes=["raw"], confidence={"cin": 91.0}, text=log_pipeline.sample_text(text)))
+    if fail:
+        logger.warning("CIN not found", extra=log_pipeline.fields(text=log_pipeline.sample_text(text)))
+        try:
+            raise ValueError("Unable to extract CIN from the image.")
+        except ValueError as e:
+            logger.error("OCR processing error: %s", e, exc_info=not isinstance(e, ValueError))
+
+
+def run(name: str, args, texts, failures) -> None:
+    path = tempfile.mktemp(suffix=".log")
+    output = SlowFileHandler(path, args.sink_delay)
+    logger = logging.getLogger(f"bench.{name}")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    listener = None
+    if name == "sync":
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        logger.handlers = [output]
+        request = sync_request
+    else:
+        output.setFormatter(log_pipeline.JSONFormatter("ocr"))
+        records: queue.Queue = queue.Queue(log_pipeline.LogConfig.QUEUE_SIZE)
+        logger.handlers = [log_pipeline._QueueHandler(records)]
+        listener = logging.handlers.QueueListener(records, output)
+        listener.start()
+        request = queued_request
+
+    durations = []
+    dropped = log_pipeline.counters["dropped"]
+    for text, fail in zip(texts, failures):
+        start = time.perf_counter()
+        request(logger, text, fail)
+        durations.append(time.perf_counter() - start)
+    drain_start = time.perf_counter()
+    if listener:
+        listener.stop()
+    drain = time.perf_counter() - drain_start
+    output.close()
+    size = os.path.getsize(path)
+    os.remove(path)
+    durations.sort()
+    print(f"{name:>7}: {statistics.mean(durations) * 1e6:.0f} us/request on the caller "
+          f"(p99 {durations[int(len(durations) * 0.99)] * 1e6:.0f} us), {size / len(texts):.0f} bytes/request written"
+          + (f", {log_pipeline.counters['dropped'] - dropped} records dropped, writer drained in {drain:.2f} s"
+             if listener else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--failure-rate", type=float, default=0.2)
+    parser.add_argument("--sink-delay", type=float, default=0.0, help="seconds per write")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    texts = [TEXT_TEMPLATE.format(**random_spec(rng)._asdict()) for _ in range(args.requests)]
+    failures = [rng.random() < args.failure_rate for _ in range(args.requests)]
+    print(f"text sample rate {log_pipeline.LogConfig.TEXT_SAMPLE_RATE:.0%}, "
+          f"{sum(failures)} failures in {args.requests} requests")
+    for name in ("sync", "queued"):
+        run(name, args, texts, failures)
+
+
+if __name__ == "__main__":
+    main()
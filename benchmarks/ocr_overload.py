@@ -0,0 +1,113 @@
+"""
+Latency of ``/ocr/`` under overload, with and without admission control.
+
+Requests arrive at a fixed rate (open loop) ``--overload`` times faster than the
+service can process them, each with a client timeout of ``--timeout`` seconds sent
+in ``X-Request-Timeout``. The OCR pipeline is replaced by a stand-in holding one
+of ``--workers`` executor threads for ``--service-time`` seconds, so requests
+queue for the CPU exactly as the real stages do. Without admission control the
+queue grows for the whole run and latency climbs until clients time out; with it,
+the excess is answered with an immediate 503 and the admitted requests keep the
+latency of an unloaded service.
+
+    python -m benchmarks.ocr_overload --workers 2 --service-time 0.1 --overload 2 --duration 10
+"""
+import argparse
+import asyncio
+import io
+import os
+import time
+
+import httpx
+from PIL import Image
+
+PORT = 8193
+
+
+def sample_pngs(count: int) -> list:
+    # Distinct bytes per request: identical uploads would share one pipeline run
+    images = []
+    for i in range(count):
+        image = Image.new("L", (1600, 1000), 200)
+        image.putpixel((i % 1600, i // 1600), 0)
+        buffer = io.BytesIO()
+        image.save(buffer, "PNG")
+        images.append(buffer.getvalue())
+    return images
+
+
+def percentile(values, q: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * q))] if values else float("nan")
+
+
+async def drive(url: str, images: list, rate: float, timeout: float) -> dict:
+    outcomes = {"ok": [], "rejected": [], "timed_out": 0, "failed": 0}
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        async def one(image: bytes):
+            start = time.perf_counter()
+            try:
+                response = await client.post(url, files={"file": ("card.png", image, "image/png")},
+                                             headers={"X-Request-Timeout": str(timeout)})
+            except httpx.TimeoutException:
+                outcomes["timed_out"] += 1
+                return
+            elapsed = (time.perf_counter() - start) * 1000
+            if response.status_code == 200:
+                outcomes["ok"].append(elapsed)
+            elif response.status_code == 503:
+                outcomes["rejected"].append(elapsed)
+            else:
+                outcomes["failed"] += 1
+
+        tasks = []
+        start = time.perf_counter()
+        for i, image in enumerate(images):
+            await asyncio.sleep(max(0.0, start + i / rate - time.perf_counter()))
+            tasks.append(asyncio.ensure_future(one(image)))
+        await asyncio.gather(*tasks)
+    return outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--service-time", type=float, default=0.1)
+    parser.add_argument("--overload", type=float, default=2.0, help="arrival rate / service capacity")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--timeout", type=float, default=2.0, help="client timeout, seconds")
+    args = parser.parse_args()
+
+    os.environ["OCR_EXECUTOR_WORKERS"] = str(args.workers)  # read when cpu_executor is imported
+
+    import ocr_service
+    from admission import AdmissionController
+    from benchmarks.stubs import STUB_RESULT, ServerThread
+    from cpu_executor import run_stage
+    from ocr_cache import OCRCache
+
+    async def process_image(data: bytes) -> dict:
+        await run_stage("ocr", time.sleep, args.service_time)
+        return dict(STUB_RESULT)
+
+    ocr_service.process_image = process_image
+
+    rate = args.overload * args.workers / args.service_time
+    images = sample_pngs(int(rate * args.duration))
+    print(f"{rate:.0f} requests/s for {args.duration:.0f} s against a capacity of "
+          f"{args.workers / args.service_time:.0f}/s, client timeout {args.timeout} s")
+    for label, max_in_flight in (("no admission", 0), ("admission", args.workers)):
+        ocr_service.ocr_cache = OCRCache(max_entries=0)  # every request runs the pipeline
+        ocr_service.admission = AdmissionController(max_in_flight=max_in_flight, max_waiting=2 * args.workers)
+        ocr_service.admission.service_time = args.service_time
+        with ServerThread(ocr_service.app, PORT) as server:
+            outcomes = asyncio.run(drive(f"{server.url}/ocr/", images, rate, args.timeout))
+        ok = sorted(outcomes["ok"])
+        rejected = sorted(outcomes["rejected"])
+        print(f"{label:>12}: {len(ok)} ok (p50 {percentile(ok, 0.5):.0f} ms, p99 {percentile(ok, 0.99):.0f} ms), "
+              f"{len(rejected)} rejected (p99 {percentile(rejected, 0.99):.0f} ms), "
+              f"{outcomes['timed_out']} timed out, {outcomes['failed']} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Allocations and time per megapixel of the preprocessing chains: the previous functions versus ``preprocess_pipeline``.
+
+The previous functions (copied below) created their CLAHE object and morphology
+kernel on every call and a new full-size array at every step. Two chains are
+measured on synthetic card photos decoded to grayscale at each ``--sizes``:
+- page: the OCR service's full-page preprocessing (denoise, CLAHE, threshold,
+  1x1 dilation), previous ``preprocess_image`` versus ``ocr_service.preprocess_image``
+  and the same pipeline writing into a caller buffer (``out=``)
+- enhance: the Desktop service's ``enhance_image`` steps when both gates fire
+  (CLAHE, denoise, threshold, 2x2 close), previous code versus a pipeline of the same
+  steps, and its most common path, when neither gate fires (threshold and close only)
+
+Memory is the peak of NumPy allocations during one warm call (``tracemalloc``),
+the result included; scratch memory OpenCV allocates internally is not seen.
+Results are checked to be identical to the previous functions'.
+
+    python -m benchmarks.preprocess_buffers [--sizes 1000x630,2000x1260] [--repeat 5]
+"""
+import argparse
+import random
+import statistics
+import time
+import tracemalloc
+from typing import Callable
+
+import cv2
+import numpy as np
+
+import image_decode
+import ocr_service
+import preprocess_pipeline
+from benchmarks.synthetic_cards import DEGRADATIONS, photograph, random_spec, render_card
+
+# Same steps as Desktop/Pfa/Pfa/ocr_service.ENHANCE_STEPS
+ENHANCE_STEPS = (
+    preprocess_pipeline.step("clahe", clip=2.0, tiles=(8, 8)),
+    preprocess_pipeline.step("denoise"),
+    preprocess_pipeline.step("threshold", block_size=11, c=2),
+    preprocess_pipeline.step("close", name="morphology", kernel=(2, 2)),
+)
+
+
+def previous_preprocess_image(image: np.ndarray) -> np.ndarray:
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    denoised = cv2.fastNlMeansDenoising(gray)
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    enhanced = clahe.apply(denoised)
+    binary = cv2.adaptiveThreshold(enhanced, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+    kernel = np.ones((1, 1), np.uint8)
+    return cv2.dilate(binary, kernel, iterations=1)
+
+
+def previous_enhance(gray: np.ndarray) -> np.ndarray:
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    gray = clahe.apply(gray)
+    gray = cv2.fastNlMeansDenoising(gray)
+    binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+    kernel = np.ones((2, 2), np.uint8)
+    return cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+
+
+def previous_threshold_only(gray: np.ndarray) -> np.ndarray:
+    binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+    kernel = np.ones((2, 2), np.uint8)
+    return cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+
+
+def measure(fn: Callable[[np.ndarray], np.ndarray], gray: np.ndarray, repeat: int) -> dict:
+    result = fn(gray)  # warm-up: pipelines build their operators and buffers
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(gray)
+        durations.append(time.perf_counter() - start)
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    fn(gray)
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    return {"result": result, "seconds": statistics.median(durations), "peak": peak}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000x630,2000x1260")
+    parser.add_argument("--repeat", type=int, default=5, help="timed calls per measurement (median)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    photo = image_decode.decode_gray(photograph(render_card(random_spec(rng)), rng, DEGRADATIONS["medium"]))
+    page = preprocess_pipeline.worker_pipeline("page", ocr_service.PREPROCESS_STEPS)
+    enhance = preprocess_pipeline.worker_pipeline("enhance", ENHANCE_STEPS)
+    print(f"page pipeline steps: {[name for name, _ in page.steps]}, dropped as no-ops: {page.dropped}")
+
+    for size in args.sizes.split(","):
+        width, height = (int(x) for x in size.split("x"))
+        gray = cv2.resize(photo, (width, height), interpolation=cv2.INTER_AREA)
+        megapixels = width * height / 1e6
+        out = np.empty_like(gray)
+        runs = {
+            "page, previous": (previous_preprocess_image, previous_preprocess_image),
+            "page, pipeline": (ocr_service.preprocess_image, previous_preprocess_image),
+            "page, pipeline out=": (lambda image: page.run(image, out=out), previous_preprocess_image),
+            "enhance, previous": (previous_enhance, previous_enhance),
+            "enhance, pipeline": (enhance.run, previous_enhance),
+            "threshold-only, previous": (previous_threshold_only, previous_threshold_only),
+            "threshold-only, pipeline": (lambda image: enhance.run(image, only=("threshold", "morphology")),
+                                         previous_threshold_only),
+        }
+        print(f"{size} ({megapixels:.2f} MP, {gray.nbytes / 1e6:.2f} MB per image):")
+        for name, (fn, reference) in runs.items():
+            r = measure(fn, gray, args.repeat)
+            same = np.array_equal(r["result"], reference(gray))
+            print(f"  {name:>24}: {r['seconds'] / megapixels * 1000:7.1f} ms/MP, "
+                  f"peak {r['peak'] / 1e6:6.2f} MB ({r['peak'] / gray.nbytes:.1f} images) allocated per call"
+                  f"{'' if same else ', RESULT DIFFERS'}")
+    print(f"pipeline counters: {preprocess_pipeline.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Registration write throughput of ``RegistrationStore`` at several concurrency
+levels, with group commit and with one commit (one fsync) per registration.
+
+Each level writes to a fresh database in ``--dir`` (use a directory on the disk
+the service would run on: tmpfs makes fsync free).
+
+    python -m benchmarks.register_throughput --levels 1,8,64,256 --writes 2000
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from registration_store import Registration, RegistrationStore
+
+
+async def run_level(path: str, concurrency: int, writes: int, group_commit: bool) -> dict:
+    store = RegistrationStore(path, max_batch=None if group_commit else 1, max_delay=None if group_commit else 0)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            await store.upsert(Registration(f"AB{i:06d}", "SARA", "ALAMI", "12/03/1990"))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(writes)))
+    elapsed = time.perf_counter() - start
+    stats = store.stats()
+    store.close()
+    return {"per_s": writes / elapsed, "commits": stats["commits"], "avg_batch": stats["avg_batch"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--levels", default="1,8,64,256")
+    parser.add_argument("--writes", type=int, default=2000)
+    parser.add_argument("--dir", default=None, help="directory for the test databases (default: system temp)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        for concurrency in map(int, args.levels.split(",")):
+            line = [f"concurrency {concurrency:>4}:"]
+            for group_commit in (False, True):
+                path = os.path.join(tmp, f"{concurrency}-{group_commit}.db")
+                result = asyncio.run(run_level(path, concurrency, args.writes, group_commit))
+                label = "group commit" if group_commit else "commit per write"
+                line.append(f"{label} {result['per_s']:.0f}/s ({result['commits']} commits, "
+                            f"avg batch {result['avg_batch']})")
+            print(" ".join(line))
+
+
+if __name__ == "__main__":
+    main()
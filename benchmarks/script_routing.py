@@ -0,0 +1,123 @@
+"""
+Multi-language full-page OCR versus the script router, on synthetic cards.
+
+Full-page configurations read the (binarized) page with one combined model
+(``fra+ara`` as the OCR service did, ``fra+ara+eng`` as the Desktop service did).
+The router finds the text lines, reads the Latin ones with ``fra`` alone in one
+stacked strip and skips the Arabic ones. Reported per configuration: OCR time per
+card and the fields extracted from its text against the card labels.
+
+The routing itself needs no Tesseract and is always reported: layout time, lines
+and Arabic lines per card, and the share of the page left to OCR. Language
+identification of a line's text by ``langdetect`` (when installed) is timed
+against the Unicode-range ``script_of``.
+
+    python -m benchmarks.script_routing --cards 20 --degradation medium [--corpus corpus]
+"""
+import argparse
+import statistics
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+import field_extraction
+import image_decode
+import ocr_service
+import script_router
+import tesseract_pool
+from benchmarks.end_to_end import normalize
+from benchmarks.synthetic_cards import ARABIC_HEADER, ARABIC_TITLE, DEGRADATIONS, generate, load_corpus
+
+FIELDS = ("cin", "name", "first_name", "birth_date")
+CONFIGS: Dict[str, Callable[[np.ndarray, np.ndarray], List[tesseract_pool.OCRWord]]] = {
+    "fra+ara psm3": lambda page, gray: tesseract_pool.image_to_data(page, lang="fra+ara", psm=3),
+    "fra+ara+eng psm3": lambda page, gray: tesseract_pool.image_to_data(page, lang="fra+ara+eng", psm=3),
+    "routed": lambda page, gray: script_router.read_page(page, layout=gray),
+}
+SAMPLE_LINES = ["ROYAUME DU MAROC", "CARTE NATIONALE D'IDENTITE", "Né le 12.03.1990", "à CASABLANCA",
+                ARABIC_HEADER, ARABIC_TITLE]
+
+
+def tesseract_available() -> bool:
+    try:
+        tesseract_pool.image_to_data(np.full((32, 32), 255, np.uint8), lang="fra", psm=6)
+        return True
+    except Exception:
+        return False
+
+
+def routing_report(pages: List[tuple]) -> None:
+    layout_ms, lines, arabic, ocr_share = [], [], [], []
+    for page, gray in pages:
+        start = time.perf_counter()
+        found = script_router.find_lines(gray)
+        layout_ms.append((time.perf_counter() - start) * 1000)
+        latin = [line for line in found if line.joined < script_router.RouterConfig.ARABIC_MIN_JOINED]
+        lines.append(len(found))
+        arabic.append(len(found) - len(latin))
+        ocr_share.append(sum(line.width * line.height for line in latin) / page.size)
+    print(f"routing: layout {statistics.median(layout_ms):.1f} ms/card, "
+          f"{statistics.mean(lines):.1f} lines/card of which {statistics.mean(arabic):.1f} Arabic, "
+          f"Latin lines cover {statistics.mean(ocr_share):.1%} of the page")
+
+
+def language_id_report(runs: int = 200) -> None:
+    def per_line_us(fn) -> float:
+        start = time.perf_counter()
+        for _ in range(runs):
+            for line in SAMPLE_LINES:
+                fn(line)
+        return (time.perf_counter() - start) / (runs * len(SAMPLE_LINES)) * 1e6
+
+    report = f"script_of {per_line_us(script_router.script_of):.1f} us/line"
+    try:
+        from langdetect import DetectorFactory, detect
+        DetectorFactory.seed = 0
+        report = f"langdetect {per_line_us(detect):.0f} us/line, " + report
+    except ImportError:
+        pass
+    print("language id: " + report)
+
+
+def ocr_report(pages: List[tuple], cards: list) -> None:
+    for name, read in CONFIGS.items():
+        durations, correct = [], dict.fromkeys(FIELDS, 0)
+        for (page, gray), (spec, _) in zip(pages, cards):
+            start = time.perf_counter()
+            words = read(page, gray)
+            durations.append((time.perf_counter() - start) * 1000)
+            text = script_router.latin_text(tesseract_pool.words_to_text(words))
+            fields, expected = field_extraction.extract_fields(text), spec.expected()
+            for field in FIELDS:
+                correct[field] += normalize(field, fields.get(field)) == normalize(field, expected[field])
+        print(f"{name:>18}: {statistics.median(durations):.0f} ms/card (p90 "
+              f"{sorted(durations)[int(len(durations) * 0.9)]:.0f}), fields "
+              + ", ".join(f"{field} {count / len(cards):.0%}" for field, count in correct.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cards", type=int, default=20)
+    parser.add_argument("--degradation", choices=sorted(DEGRADATIONS), default="medium")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus", help="directory written by benchmarks.synthetic_cards (instead of generating)")
+    args = parser.parse_args()
+
+    cards = load_corpus(args.corpus) if args.corpus else list(generate(args.cards, args.degradation, args.seed))
+    # As in the OCR service's full-page path: grey decode, then binarization
+    pages = []
+    for _, data in cards:
+        gray = image_decode.decode_gray(data)
+        pages.append((ocr_service.preprocess_image(gray), gray))
+
+    routing_report(pages)
+    language_id_report()
+    if tesseract_available():
+        ocr_report(pages, cards)
+    else:
+        print("Tesseract not found: OCR time and accuracy skipped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Local stand-ins for the OCR and validation services, plus a helper to serve any
+ASGI app on a background thread so benchmarks can drive real HTTP traffic.
+
+A stub can also run as its own process, e.g. several OCR instances behind the
+gateway's backend pool:
+
+    python -m benchmarks.stubs ocr --port 8301 --latency 0.2 [--slow-rate 0.05 --slow-latency 2]
+"""
+import argparse
+import asyncio
+import random
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, File, UploadFile
+from pydantic import BaseModel
+
+STUB_TEXT = "ROYAUME DU MAROC\nSARA\nALAMI\nNée le 12.03.1990\nAB123456"
+# Response of the OCR service for STUB_TEXT
+STUB_RESULT = {"cin": "AB123456", "name": "ALAMI", "first_name": "SARA", "birth_date": "12/03/1990",
+               "city": None, "raw_text": STUB_TEXT, "text_source": "full"}
+
+
+def add_health_routes(app: FastAPI) -> None:
+    @app.get("/health")
+    @app.get("/ready")
+    def ready():
+        return {"status": "ready"}
+
+
+def make_ocr_stub(latency: float = 0.1, slow_rate: float = 0.0, slow_latency: float = 0.0) -> FastAPI:
+    """
+    OCR stub that waits ``latency`` seconds (like a busy OCR host) before answering,
+    or ``slow_latency`` seconds for a ``slow_rate`` share of the requests (the tail).
+    """
+    app = FastAPI()
+    add_health_routes(app)
+
+    @app.post("/ocr/")
+    async def ocr(file: UploadFile = File(...)):
+        await file.read()
+        await asyncio.sleep(slow_latency if random.random() < slow_rate else latency)
+        return dict(STUB_RESULT)
+
+    return app
+
+
+def make_validation_stub(latency: float = 0.005) -> FastAPI:
+    app = FastAPI()
+    add_health_routes(app)
+
+    class ValidationRequest(BaseModel):
+        cin: str
+
+    @app.post("/validate/")
+    async def validate(data: ValidationRequest):
+        await asyncio.sleep(latency)
+        return {"valid": True}
+
+    return app
+
+
+class ServerThread:
+    """
+    Serve an ASGI app with uvicorn on a daemon thread for the duration of a ``with`` block.
+    """
+
+    def __init__(self, app, port: int, host: str = "127.0.0.1"):
+        self.url = f"http://{host}:{port}"
+        self.server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while not self.server.started:
+            if time.monotonic() > deadline or not self.thread.is_alive():
+                raise RuntimeError(f"Server on {self.url} failed to start")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an OCR or validation stub as its own process.")
+    parser.add_argument("service", choices=("ocr", "validation"))
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="share of OCR requests in the slow tail")
+    parser.add_argument("--slow-latency", type=float, default=0.0)
+    args = parser.parse_args()
+    app = (make_ocr_stub(args.latency, args.slow_rate, args.slow_latency) if args.service == "ocr"
+           else make_validation_stub(args.latency))
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""
+Synthetic Moroccan ID cards with known CIN, names, birth date and city, for
+measuring OCR speed and accuracy without real (personal) card photos.
+
+Fields are drawn in the zones of ``card_layout.FIELDS``, with Arabic header and
+label lines on the right as on the real card. The card is then
+"photographed": pasted on a background, rotated, blurred, given a glare spot and
+sensor noise, and saved as JPEG, with a strength set by the degradation level.
+Generation is seeded, so the same arguments always give the same corpus.
+
+    python -m benchmarks.synthetic_cards --count 50 --degradation medium --out corpus
+"""
+import argparse
+import io
+import json
+import os
+import random
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+import card_layout
+
+FIRST_NAMES = ["SARA", "YOUSSEF", "FATIMA", "MOHAMED", "KHADIJA", "HAMZA", "SALMA", "AYOUB",
+               "NADIA", "OMAR", "IMANE", "KARIM", "HIND", "MEHDI", "LAILA", "RACHID"]
+LAST_NAMES = ["ALAMI", "BENNANI", "EL IDRISSI", "TAZI", "BERRADA", "CHRAIBI", "FASSI", "ZIANI",
+              "AMRANI", "OUAZZANI", "LAHLOU", "SEBTI", "BOUZIDI", "HAJJI", "NACIRI", "EL MANSOURI"]
+CITIES = ["TANGER", "ASSILAH", "CASABLANCA", "RABAT", "FES", "MEKNES",
+          "MARRAKECH", "AGADIR", "TETOUAN", "OUJDA", "KENITRA", "SALE"]
+
+# Arabic lines of the card: kingdom, card title, birth date label
+ARABIC_HEADER = "\u0627\u0644\u0645\u0645\u0644\u0643\u0629 \u0627\u0644\u0645\u063a\u0631\u0628\u064a\u0629"
+ARABIC_TITLE = ("\u0627\u0644\u0628\u0637\u0627\u0642\u0629 \u0627\u0644\u0648\u0637\u0646\u064a\u0629 "
+                "\u0644\u0644\u062a\u0639\u0631\u064a\u0641")
+ARABIC_BIRTH_DATE = "\u062a\u0627\u0631\u064a\u062e \u0627\u0644\u0627\u0632\u062f\u064a\u0627\u062f"
+
+# Presentation forms (isolated, final[, initial, medial]) of the letters above: PIL
+# without libraqm does not join Arabic letters itself
+_ARABIC_FORMS = {
+    "\u0627": "\ufe8d\ufe8e", "\u0628": "\ufe8f\ufe90\ufe91\ufe92", "\u0629": "\ufe93\ufe94",
+    "\u062a": "\ufe95\ufe96\ufe97\ufe98", "\u062e": "\ufea5\ufea6\ufea7\ufea8", "\u062f": "\ufea9\ufeaa",
+    "\u0631": "\ufead\ufeae", "\u0632": "\ufeaf\ufeb0", "\u0637": "\ufec1\ufec2\ufec3\ufec4",
+    "\u0639": "\ufec9\ufeca\ufecb\ufecc", "\u063a": "\ufecd\ufece\ufecf\ufed0",
+    "\u0641": "\ufed1\ufed2\ufed3\ufed4", "\u0642": "\ufed5\ufed6\ufed7\ufed8",
+    "\u0643": "\ufed9\ufeda\ufedb\ufedc", "\u0644": "\ufedd\ufede\ufedf\ufee0",
+    "\u0645": "\ufee1\ufee2\ufee3\ufee4", "\u0646": "\ufee5\ufee6\ufee7\ufee8", "\u0648": "\ufeed\ufeee",
+    "\u064a": "\ufef1\ufef2\ufef3\ufef4",
+}
+_LAM_ALEF = "\ufefb\ufefc"
+
+
+class Degradation(NamedTuple):
+    rotation: float  # max degrees, either way
+    blur: float  # max Gaussian radius, pixels
+    glare: float  # probability of a glare spot
+    noise: float  # sensor noise sigma, grey levels
+    jpeg_quality: Tuple[int, int]
+
+
+DEGRADATIONS: Dict[str, Degradation] = {
+    "none": Degradation(0.0, 0.0, 0.0, 0.0, (95, 95)),
+    "light": Degradation(2.0, 0.6, 0.2, 3.0, (80, 92)),
+    "medium": Degradation(5.0, 1.2, 0.5, 6.0, (60, 85)),
+    "heavy": Degradation(10.0, 2.0, 0.8, 10.0, (35, 65)),
+}
+
+
+class CardSpec(NamedTuple):
+    cin: str
+    first_name: str
+    name: str
+    birth_date: str  # as printed: dd.mm.yyyy
+    city: str
+
+    def expected(self) -> Dict[str, str]:
+        """
+        Field values as the services return them.
+        """
+        return {"cin": self.cin, "first_name": self.first_name, "name": self.name,
+                "birth_date": self.birth_date.replace(".", "/"), "city": self.city}
+
+
+def random_spec(rng: random.Random) -> CardSpec:
+    letters = "".join(rng.choice("ABCDEFGHIJKLMNOPRSTUVWXYZ") for _ in range(rng.choice((1, 2, 2))))
+    cin = letters + "".join(rng.choice("0123456789") for _ in range(rng.choice((5, 6, 6))))
+    birth_date = f"{rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.{rng.randint(1950, 2005)}"
+    return CardSpec(cin, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), birth_date, rng.choice(CITIES))
+
+
+def mrz_lines(spec: CardSpec) -> Tuple[str, str, str]:
+    """
+    TD1 machine-readable zone of the card's back, with a document number, sex and
+    expiry date drawn from the CIN so they are the same on every run.
+    """
+    from mrz import check_digit
+
+    rng = random.Random(spec.cin)
+    document_number = "".join(rng.choice("ABCDEFGHJKLMNPRSTUVWXYZ") for _ in range(2)) + \
+        "".join(rng.choice("0123456789") for _ in range(7))
+    day, month, year = spec.birth_date.split(".")
+    birth = year[2:] + month + day
+    expiry = f"{rng.randint(27, 35)}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}"
+    line1 = f"IDMAR{document_number}{check_digit(document_number)}{spec.cin}".ljust(30, "<")
+    line2 = f"{birth}{check_digit(birth)}{rng.choice('MF')}{expiry}{check_digit(expiry)}MAR".ljust(29, "<")
+    line2 += check_digit(line1[5:30] + line2[0:7] + line2[8:15] + line2[18:29])
+    line3 = (spec.name.replace(" ", "<") + "<<" + spec.first_name.replace(" ", "<")).ljust(30, "<")[:30]
+    return line1, line2, line3
+
+
+def shape_arabic(text: str) -> str:
+    """
+    Joined glyphs of ``text`` in visual (left-to-right drawing) order.
+    """
+    glyphs = []
+    i = 0
+    while i < len(text):
+        letter = text[i]
+        forms = _ARABIC_FORMS.get(letter)
+        if forms is None:
+            glyphs.append(letter)
+            i += 1
+            continue
+        previous = _ARABIC_FORMS.get(text[i - 1], "") if i else ""
+        joins_previous = len(previous) == 4  # only dual-joining letters connect to the next one
+        if letter == "\u0644" and text[i + 1:i + 2] == "\u0627":
+            glyphs.append(_LAM_ALEF[joins_previous])
+            i += 2
+            continue
+        joins_next = len(forms) == 4 and text[i + 1:i + 2] in _ARABIC_FORMS
+        glyphs.append(forms[[[0, 2], [1, 3]][joins_previous][joins_next]])
+        i += 1
+    return "".join(reversed(glyphs))
+
+
+def _font(size: int) -> ImageFont.ImageFont:
+    try:
+        return ImageFont.truetype("DejaVuSans-Bold.ttf", size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+def render_card(spec: CardSpec) -> Image.Image:
+    """
+    The card alone, at ``LayoutConfig.CARD_SIZE``, in colour.
+    """
+    width, height = card_layout.LayoutConfig.CARD_SIZE
+    card = Image.new("RGB", (width, height), (226, 236, 228))
+    draw = ImageDraw.Draw(card)
+    small, large = _font(22), _font(40)
+    draw.text((40, 20), "ROYAUME DU MAROC", fill=(30, 30, 30), font=large)
+    draw.text((40, 72), "CARTE NATIONALE D'IDENTITE", fill=(60, 60, 60), font=small)
+    draw.rectangle((30, 130, 280, 480), fill=(150, 150, 150))  # portrait
+
+    # Printed labels sit just left of their field zone, as on the real card
+    labels = {"birth_date": "Né le", "city": "à"}
+    for field, value in spec._asdict().items():
+        x0, y0, _, _ = card_layout.FIELDS[field].box
+        x, y = int(x0 * width) + 8, int(y0 * height) + 6
+        if field in labels:
+            draw.text((x - 12 - draw.textlength(labels[field], font=small), y + 12), labels[field],
+                      fill=(60, 60, 60), font=small)
+        draw.text((x, y), value, fill=(10, 10, 10), font=large)
+    draw.text((int(0.42 * width), int(0.86 * height)), "Valable jusqu'au 01.01.2030", fill=(60, 60, 60), font=small)
+
+    # Arabic text, right-aligned on the right edge
+    for text, y, font in ((ARABIC_HEADER, 20, large), (ARABIC_TITLE, 72, small),
+                          (ARABIC_BIRTH_DATE, int(card_layout.FIELDS["birth_date"].box[1] * height) + 18, small)):
+        glyphs = shape_arabic(text)
+        draw.text((width - 40 - draw.textlength(glyphs, font=font), y), glyphs, fill=(30, 30, 30), font=font)
+    return card
+
+
+def render_back(spec: CardSpec) -> Image.Image:
+    """
+    The back of the card: address lines above the machine-readable zone.
+    """
+    width, height = card_layout.LayoutConfig.CARD_SIZE
+    card = Image.new("RGB", (width, height), (226, 236, 228))
+    draw = ImageDraw.Draw(card)
+    small = _font(22)
+    for i, line in enumerate(("Fils de MOHAMED", "et de FATIMA", f"Adresse 12 RUE {spec.city}")):
+        draw.text((40, 40 + 40 * i), line, fill=(60, 60, 60), font=small)
+    try:
+        mono = ImageFont.truetype("DejaVuSansMono-Bold.ttf", 50)
+    except OSError:
+        mono = ImageFont.load_default()
+    for i, line in enumerate(mrz_lines(spec)):
+        draw.text((30, int(0.64 * height) + 64 * i), line, fill=(10, 10, 10), font=mono)
+    return card
+
+
+def photograph(card: Image.Image, rng: random.Random, degradation: Degradation) -> bytes:
+    """
+    The card as a phone would capture it, JPEG-encoded.
+    """
+    width, height = card.size
+    background = tuple(rng.randint(60, 140) for _ in range(3))
+    photo = Image.new("RGB", (int(width * 1.6), int(height * 1.8)), background)
+    rotated = card.rotate(rng.uniform(-degradation.rotation, degradation.rotation),
+                          resample=Image.Resampling.BICUBIC, expand=True, fillcolor=background)
+    photo.paste(rotated, ((photo.width - rotated.width) // 2 + rng.randint(-40, 40),
+                          (photo.height - rotated.height) // 2 + rng.randint(-40, 40)))
+
+    if degradation.blur:
+        photo = photo.filter(ImageFilter.GaussianBlur(rng.uniform(0, degradation.blur)))
+
+    pixels = np.asarray(photo, dtype=np.float32)
+    if rng.random() < degradation.glare:
+        # Bright elliptical spot, as from a flash or a lamp on the laminate
+        ys, xs = np.ogrid[:photo.height, :photo.width]
+        cx, cy = rng.uniform(0.2, 0.8) * photo.width, rng.uniform(0.2, 0.8) * photo.height
+        radius = rng.uniform(0.08, 0.2) * photo.width
+        spot = np.exp(-(((xs - cx) ** 2 + ((ys - cy) * 1.5) ** 2) / (2 * radius ** 2)))
+        pixels += (spot * rng.uniform(80, 160))[:, :, None]
+    if degradation.noise:
+        pixels += np.random.default_rng(rng.getrandbits(32)).normal(0, degradation.noise, pixels.shape)
+    photo = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+    buffer = io.BytesIO()
+    photo.save(buffer, "JPEG", quality=rng.randint(*degradation.jpeg_quality))
+    return buffer.getvalue()
+
+
+def generate(count: int, degradation: str = "medium", seed: int = 0,
+             side: str = "front") -> Iterator[Tuple[CardSpec, bytes]]:
+    rng = random.Random(seed)
+    render = render_back if side == "back" else render_card
+    for _ in range(count):
+        spec = random_spec(rng)
+        yield spec, photograph(render(spec), rng, DEGRADATIONS[degradation])
+
+
+def save_corpus(directory: str, cards: List[Tuple[CardSpec, bytes]]) -> None:
+    """
+    One JPEG per card plus ``labels.jsonl`` (file name and expected fields).
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "labels.jsonl"), "w", encoding="utf-8") as labels:
+        for i, (spec, data) in enumerate(cards):
+            name = f"card_{i:04d}.jpg"
+            with open(os.path.join(directory, name), "wb") as f:
+                f.write(data)
+            labels.write(json.dumps({"file": name, **spec._asdict()}, ensure_ascii=False) + "\n")
+
+
+def load_corpus(directory: str) -> List[Tuple[CardSpec, bytes]]:
+    cards = []
+    with open(os.path.join(directory, "labels.jsonl"), encoding="utf-8") as labels:
+        for line in labels:
+            record = json.loads(line)
+            with open(os.path.join(directory, record.pop("file")), "rb") as f:
+                cards.append((CardSpec(**record), f.read()))
+    return cards
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=50)
+    parser.add_argument("--degradation", choices=sorted(DEGRADATIONS), default="medium")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--side", choices=("front", "back"), default="front",
+                        help="back: the machine-readable zone instead of the printed fields")
+    parser.add_argument("--out", required=True, help="directory for the images and labels.jsonl")
+    args = parser.parse_args()
+
+    save_corpus(args.out, list(generate(args.count, args.degradation, args.seed, args.side)))
+    print(f"{args.count} cards ({args.degradation}, {args.side}) written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
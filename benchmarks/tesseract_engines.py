@@ -0,0 +1,79 @@
+"""
+Per-request latency and CPU time of pooled in-process Tesseract engines versus the
+pytesseract subprocess path.
+
+CPU time includes child processes, so the cost of each ``tesseract`` fork and its
+traineddata reload is counted for the pytesseract path.
+
+    python -m benchmarks.tesseract_engines --image card.jpg --lang fra+ara --runs 20
+"""
+import argparse
+import resource
+import statistics
+import time
+
+import numpy as np
+import pytesseract
+from PIL import Image, ImageDraw, ImageFont
+
+import tesseract_pool
+
+
+def sample_image() -> np.ndarray:
+    image = Image.new("L", (1000, 630), 255)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default()
+    lines = ["ROYAUME DU MAROC", "CARTE NATIONALE D'IDENTITE", "ALAMI", "SARA",
+             "Née le 12.03.1990", "à CASABLANCA", "AB123456"]
+    for i, line in enumerate(lines):
+        draw.text((60, 60 + i * 70), line, fill=0, font=font)
+    return np.array(image)
+
+
+def cpu_seconds() -> float:
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def measure(fn, image, runs: int) -> dict:
+    fn(image)  # first call loads the models; reported separately from steady state
+    wall, cpu = [], []
+    for _ in range(runs):
+        cpu_start, start = cpu_seconds(), time.perf_counter()
+        fn(image)
+        wall.append(time.perf_counter() - start)
+        cpu.append(cpu_seconds() - cpu_start)
+    return {"p50_ms": statistics.median(wall) * 1000, "max_ms": max(wall) * 1000,
+            "cpu_ms": statistics.mean(cpu) * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--image", help="ID card image (default: a rendered sample)")
+    parser.add_argument("--lang", default="fra+ara")
+    parser.add_argument("--psm", type=int, default=3)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--tesseract-cmd", help="path to the tesseract binary for the pytesseract path")
+    args = parser.parse_args()
+
+    if args.tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = args.tesseract_cmd
+    image = np.array(Image.open(args.image).convert("L")) if args.image else sample_image()
+
+    config = tesseract_pool.build_config(args.lang, args.psm)
+    paths = {"pytesseract": lambda img: pytesseract.image_to_string(img, config=config)}
+    if tesseract_pool.tesserocr is not None:
+        pool = tesseract_pool.TesseractPool(args.lang, size=1)
+        paths["pooled"] = lambda img: pool.image_to_string(img, psm=args.psm)
+    else:
+        print("tesserocr not installed: only the pytesseract path is measured")
+
+    print(f"{'path':<12} {'p50 ms':>8} {'max ms':>8} {'cpu ms':>8}")
+    for name, fn in paths.items():
+        r = measure(fn, image, args.runs)
+        print(f"{name:<12} {r['p50_ms']:>8.1f} {r['max_ms']:>8.1f} {r['cpu_ms']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
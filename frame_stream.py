@@ -0,0 +1,256 @@
+"""
+Camera-frame streaming: OCR only the best frames of a live preview and vote on
+the fields across them.
+
+A client opens a WebSocket and sends downscaled camera frames (binary JPEG/PNG
+messages, or text messages ``{"frame": "<base64>"}`` for clients that cannot
+send binary). Every frame is scored cheaply: the card outline is searched on a
+small copy, the card is warped to a fixed size, and its sharpness (variance of
+the Laplacian) and glare (share of saturated pixels) are measured there, so
+scores do not depend on the frame resolution. Frames without a card, blurred or
+washed out are dropped.
+
+One frame is OCRed at a time; while it runs, only the best usable frame that
+arrives is kept, the others are dropped, so a slow OCR never builds a backlog.
+Each OCR result adds one vote per field, and the session ends as soon as the
+CIN, name and birth date have each been read identically on ``AGREEMENT``
+frames, when the OCR budget is spent, or when the client sends ``"end"``.
+
+Messages sent to the client, as JSON:
+- ``{"type": "frame", "frame": n, "card", "sharpness", "glare", "accepted"}``
+  for every frame (feedback to steady the camera)
+- ``{"type": "ocr", "frame": n, "fields", "stable"}`` after each OCR
+- ``{"type": "result", "status": "stable" | "incomplete", "fields", "votes", ...}``
+  once, last
+"""
+import asyncio
+import base64
+import binascii
+import json
+import os
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+import card_layout
+import image_decode
+from cpu_executor import run_stage
+
+
+class StreamConfig:
+    MAX_FRAMES = int(os.getenv("STREAM_MAX_FRAMES", "90"))  # frames read per session
+    MAX_FRAME_BYTES = 512 * 1024  # a downscaled preview frame, not a full photo
+    SCORE_CARD_SIZE = (320, 202)  # the card is scored at this size, whatever the frame size
+    MIN_SHARPNESS = float(os.getenv("STREAM_MIN_SHARPNESS", "150"))  # Laplacian variance of the scored card
+    MAX_GLARE = 0.05  # share of saturated card pixels
+    MAX_OCR_FRAMES = int(os.getenv("STREAM_MAX_OCR_FRAMES", "6"))
+    AGREEMENT = int(os.getenv("STREAM_AGREEMENT", "2"))  # frames that must read the same value
+    REQUIRED_FIELDS = ("cin", "name", "birth_date")
+    IDLE_TIMEOUT = float(os.getenv("STREAM_IDLE_TIMEOUT", "30"))  # seconds without a frame
+
+
+VOTED_FIELDS = ("cin", "name", "first_name", "birth_date", "city")
+
+
+class FrameScore(NamedTuple):
+    card: bool
+    sharpness: float
+    glare: float
+
+    @property
+    def usable(self) -> bool:
+        return self.card and self.sharpness >= StreamConfig.MIN_SHARPNESS and self.glare <= StreamConfig.MAX_GLARE
+
+    def rank(self) -> float:
+        return self.sharpness * (1 - self.glare)
+
+
+counters: Counter = Counter()
+
+
+def score_frame(data: bytes) -> FrameScore:
+    """
+    Card presence, sharpness and glare of an encoded frame. Raises ``ValueError``
+    when it cannot be decoded (``ImageTooLarge`` above the frame budget).
+    """
+    width, height = StreamConfig.SCORE_CARD_SIZE
+    gray = image_decode.decode_gray(data, target_side=card_layout.LayoutConfig.DETECT_WIDTH,
+                                    max_bytes=StreamConfig.MAX_FRAME_BYTES)
+    corners = card_layout.find_card(gray)
+    if corners is None:
+        return FrameScore(False, 0.0, 0.0)
+    target = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]], dtype=np.float32)
+    card = cv2.warpPerspective(gray, cv2.getPerspectiveTransform(corners, target), (width, height))
+    sharpness = float(cv2.Laplacian(card, cv2.CV_64F).var())
+    glare = float(np.count_nonzero(card >= 250)) / card.size
+    return FrameScore(True, round(sharpness, 1), round(glare, 4))
+
+
+def _normalize(value) -> str:
+    return " ".join(str(value).split()).upper()
+
+
+class FrameSession:
+    """
+    Frame selection and field voting for one stream. ``ocr`` maps encoded image
+    bytes to the OCR service's result dict; ``emit`` sends a message to the client.
+    """
+
+    def __init__(self, ocr: Callable[[bytes], Awaitable[dict]], emit: Callable[[dict], Awaitable[None]]):
+        self.ocr = ocr
+        self.emit = emit
+        self.votes: Dict[str, Counter] = {field: Counter() for field in VOTED_FIELDS}
+        self.frames = 0
+        self.ocr_frames = 0
+        self._pending: Optional[Tuple[FrameScore, int, bytes]] = None
+        self._closing = False
+        self._wake = asyncio.Event()
+        # Ends by itself once the fields are stable or the OCR budget is spent
+        self.worker = asyncio.ensure_future(self._ocr_loop())
+
+    async def add_frame(self, data: bytes) -> None:
+        self.frames += 1
+        index = self.frames
+        counters["frames"] += 1
+        try:
+            score = await run_stage("frame_score", score_frame, data)
+        except ValueError as e:  # includes ImageTooLarge
+            counters["undecodable"] += 1
+            await self.emit({"type": "frame", "frame": index, "accepted": False, "error": str(e)})
+            return
+        accepted = score.usable and (self._pending is None or score.rank() > self._pending[0].rank())
+        if accepted:
+            if self._pending is not None:
+                counters["replaced"] += 1
+            self._pending = (score, index, data)
+            self._wake.set()
+        else:
+            counters["no_card" if not score.card else "not_best" if score.usable else "unusable"] += 1
+        await self.emit({"type": "frame", "frame": index, **score._asdict(), "accepted": accepted})
+
+    def stable_fields(self) -> List[str]:
+        """
+        Fields whose leading value was read on ``AGREEMENT`` frames and more often
+        than any other value.
+        """
+        stable = []
+        for field, counts in self.votes.items():
+            ranked = counts.most_common(2)
+            if ranked and ranked[0][1] >= StreamConfig.AGREEMENT and (len(ranked) == 1 or ranked[0][1] > ranked[1][1]):
+                stable.append(field)
+        return stable
+
+    def complete(self) -> bool:
+        return set(StreamConfig.REQUIRED_FIELDS) <= set(self.stable_fields())
+
+    async def _ocr_loop(self) -> None:
+        while not self.complete() and self.ocr_frames < StreamConfig.MAX_OCR_FRAMES:
+            if self._pending is None:
+                if self._closing:
+                    return
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            _, index, data = self._pending
+            self._pending = None
+            self.ocr_frames += 1
+            counters["ocr_frames"] += 1
+            try:
+                result = await self.ocr(data)
+            except Exception as e:
+                # The next frame may succeed (e.g. no CIN found, or a brief overload)
+                counters["ocr_errors"] += 1
+                await self.emit({"type": "ocr", "frame": index, "error": str(e)})
+                continue
+            fields = {field: _normalize(result[field]) for field in VOTED_FIELDS if result.get(field)}
+            for field, value in fields.items():
+                self.votes[field][value] += 1
+            await self.emit({"type": "ocr", "frame": index, "fields": fields, "stable": self.stable_fields()})
+
+    async def finish(self) -> dict:
+        """
+        Let the OCR of the frame in flight and of the last kept frame complete,
+        then return the final result message.
+        """
+        self._closing = True
+        self._wake.set()
+        await self.worker
+        return self.result()
+
+    def cancel(self) -> None:
+        self.worker.cancel()
+
+    def result(self) -> dict:
+        complete = self.complete()
+        counters["stable" if complete else "incomplete"] += 1
+        return {
+            "type": "result",
+            "status": "stable" if complete else "incomplete",
+            "fields": {field: counts.most_common(1)[0][0] if counts else None for field, counts in self.votes.items()},
+            "stable": self.stable_fields(),
+            "votes": {field: dict(counts) for field, counts in self.votes.items() if counts},
+            "frames": self.frames,
+            "ocr_frames": self.ocr_frames,
+        }
+
+
+def _frame_bytes(message: dict) -> Optional[bytes]:
+    """
+    Frame carried by a WebSocket message, or None for the ``"end"`` message.
+    Raises ``ValueError`` for any other text.
+    """
+    if message.get("bytes") is not None:
+        return message["bytes"]
+    text = message.get("text") or ""
+    if text.strip() == "end":
+        return None
+    try:
+        return base64.b64decode(json.loads(text)["frame"], validate=True)
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        raise ValueError('Expected a binary frame, {"frame": "<base64>"} or "end"')
+
+
+async def run_session(websocket: WebSocket, ocr: Callable[[bytes], Awaitable[dict]]) -> Optional[dict]:
+    """
+    Read frames from an accepted ``websocket`` until the fields are stable, the
+    client sends ``"end"``, the frame budget is spent or the stream goes idle.
+    Returns the result message (not sent, so the caller can complete it), or None
+    when the client disconnected.
+    """
+    counters["sessions"] += 1
+    session = FrameSession(ocr, websocket.send_json)
+    try:
+        while session.frames < StreamConfig.MAX_FRAMES:
+            receive = asyncio.ensure_future(websocket.receive())
+            done, _ = await asyncio.wait({receive, session.worker}, timeout=StreamConfig.IDLE_TIMEOUT,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if receive not in done:
+                # Fields stable (or OCR budget spent), or the client stopped sending
+                receive.cancel()
+                break
+            message = receive.result()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            try:
+                data = _frame_bytes(message)
+            except ValueError as e:
+                await websocket.send_json({"type": "error", "error": str(e)})
+                continue
+            if data is None:
+                break
+            await session.add_frame(data)
+        return await session.finish()
+    except WebSocketDisconnect:
+        counters["disconnected"] += 1
+        session.cancel()
+        return None
+    except BaseException:
+        session.cancel()
+        raise
+
+
+def stats() -> Dict[str, int]:
+    return dict(counters)
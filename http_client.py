@@ -0,0 +1,112 @@
+"""
+Shared async HTTP client used by the gateway to call the OCR and validation services.
+
+One ``httpx.AsyncClient`` is created per process and reused for every request so
+connections stay alive between uploads instead of being re-opened each time.
+"""
+import asyncio
+import logging
+import os
+import random
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger("http_client")
+
+
+class HttpConfig:
+    MAX_CONNECTIONS = int(os.getenv("GATEWAY_MAX_CONNECTIONS", "100"))
+    MAX_CONNECTIONS_PER_HOST = int(os.getenv("GATEWAY_MAX_CONNECTIONS_PER_HOST", "20"))
+    MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("GATEWAY_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    KEEPALIVE_EXPIRY = float(os.getenv("GATEWAY_KEEPALIVE_EXPIRY", "30"))
+    CONNECT_TIMEOUT = float(os.getenv("GATEWAY_CONNECT_TIMEOUT", "5"))
+    READ_TIMEOUT = float(os.getenv("GATEWAY_READ_TIMEOUT", "60"))  # OCR can take several seconds
+    WRITE_TIMEOUT = float(os.getenv("GATEWAY_WRITE_TIMEOUT", "30"))
+    POOL_TIMEOUT = float(os.getenv("GATEWAY_POOL_TIMEOUT", "10"))
+    MAX_RETRIES = int(os.getenv("GATEWAY_MAX_RETRIES", "2"))
+    BACKOFF_BASE = float(os.getenv("GATEWAY_BACKOFF_BASE", "0.2"))
+    BACKOFF_MAX = float(os.getenv("GATEWAY_BACKOFF_MAX", "2"))
+    RETRY_STATUSES = (502, 503, 504)
+
+
+_client: Optional[httpx.AsyncClient] = None
+_host_limits: Dict[str, asyncio.Semaphore] = {}
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Return the process-wide client, creating it on first use.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HttpConfig.MAX_CONNECTIONS,
+                max_keepalive_connections=HttpConfig.MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HttpConfig.KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(
+                connect=HttpConfig.CONNECT_TIMEOUT,
+                read=HttpConfig.READ_TIMEOUT,
+                write=HttpConfig.WRITE_TIMEOUT,
+                pool=HttpConfig.POOL_TIMEOUT,
+            ),
+        )
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    _host_limits.clear()
+
+
+def _host_limit(url: str) -> asyncio.Semaphore:
+    # httpx only caps connections for the whole client, so the per-host cap is
+    # enforced here to keep one slow backend from using up the entire pool.
+    host = urlsplit(url).netloc
+    semaphore = _host_limits.get(host)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(HttpConfig.MAX_CONNECTIONS_PER_HOST)
+        _host_limits[host] = semaphore
+    return semaphore
+
+
+def backoff_delay(attempt: int) -> float:
+    # "Full jitter": a random delay up to the exponential cap, so retries from
+    # concurrent uploads do not hit a recovering service at the same moment.
+    cap = min(HttpConfig.BACKOFF_MAX, HttpConfig.BACKOFF_BASE * (2 ** attempt))
+    return random.uniform(0, cap)
+
+
+async def post_with_retry(url: str, retries: Optional[int] = None, **kwargs) -> httpx.Response:
+    """
+    POST ``url`` through the shared client, retrying connection errors, timeouts
+    and 502/503/504 responses with jittered exponential backoff.
+
+    ``kwargs`` are passed to ``httpx.AsyncClient.post``; file contents must be
+    bytes (not a file object) so they can be sent again on retry.
+    Raises ``httpx.HTTPError`` once the retries are exhausted.
+    """
+    retries = HttpConfig.MAX_RETRIES if retries is None else retries
+    client = get_client()
+    attempt = 0
+    while True:
+        try:
+            async with _host_limit(url):
+                response = await client.post(url, **kwargs)
+            if response.status_code in HttpConfig.RETRY_STATUSES and attempt < retries:
+                logger.warning("POST %s returned %s, retrying", url, response.status_code)
+            else:
+                response.raise_for_status()
+                return response
+        except httpx.TransportError as e:
+            if attempt >= retries:
+                raise
+            logger.warning("POST %s failed (%s), retrying", url, e)
+        await asyncio.sleep(backoff_delay(attempt))
+        attempt += 1
@@ -0,0 +1,316 @@
+"""
+Asynchronous jobs for the gateway: an upload is accepted, queued and answered with
+a job ID straight away, then processed by a fixed pool of workers.
+
+The queue is bounded; when it is full ``submit`` fails at once with the queue depth
+so clients can back off instead of holding a connection until a timeout. Results
+are polled by job ID and, when the client gave a callback URL, POSTed to it. Job
+records live in memory or, to survive a restart, as JSON files on local disk.
+Several gateway worker processes may share the disk store: each job records the
+process that owns it, and a process starting up only fails the unfinished jobs
+of processes that are gone (see ``JobQueue.start``).
+
+The result holds identity data and is POSTed from inside the backend network,
+so callback URLs must be http(s) on a host listed in ``JOB_CALLBACK_HOSTS``
+(none by default: callbacks are refused until hosts are configured).
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import string
+import time
+import uuid
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from http_client import post_with_retry
+
+logger = logging.getLogger("jobs")
+
+
+class JobConfig:
+    QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "64"))
+    WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+    STORE = os.getenv("JOB_STORE", "memory")  # "memory" or "disk"
+    STORE_DIR = os.getenv("JOB_STORE_DIR", "jobs")
+    TTL = float(os.getenv("JOB_TTL", "3600"))  # finished jobs are kept this long
+    CALLBACK_RETRIES = int(os.getenv("JOB_CALLBACK_RETRIES", "3"))
+    # Comma-separated host names callbacks may be sent to
+    CALLBACK_HOSTS = {host.strip().lower() for host in os.getenv("JOB_CALLBACK_HOSTS", "").split(",") if host.strip()}
+
+
+class QueueFull(Exception):
+    def __init__(self, depth: int, capacity: int):
+        super().__init__(f"Job queue full ({depth}/{capacity})")
+        self.depth = depth
+        self.capacity = capacity
+
+
+# This process, as recorded on the jobs it accepts
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _owner_gone(owner: Optional[str]) -> bool:
+    """
+    Whether the process that owned a job has stopped: this process's own jobs
+    (a PID reused after a restart) and those of a dead PID on this host. Jobs of
+    other hosts sharing the directory are left to them.
+    """
+    if not owner:
+        return True  # record written before owners were recorded
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname():
+        return False
+    if not pid.isdigit() or int(pid) == os.getpid():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass  # alive, run by another user
+    return False
+
+
+class InvalidCallback(ValueError):
+    pass
+
+
+def check_callback_url(url: str) -> None:
+    """
+    Raises ``InvalidCallback`` unless ``url`` is http(s) on an allowed host.
+    """
+    try:
+        parts = urlsplit(url)
+        host = (parts.hostname or "").lower()
+        parts.port  # raises ValueError when not a number
+    except ValueError:
+        raise InvalidCallback("Invalid callback URL")
+    if parts.scheme not in ("http", "https") or not host:
+        raise InvalidCallback("Callback URL must be an http or https URL")
+    if "@" in parts.netloc:
+        # user:password@host: parsers disagree on which part is the host
+        raise InvalidCallback("Callback URL must not contain credentials")
+    if host not in JobConfig.CALLBACK_HOSTS:
+        raise InvalidCallback(f"Callback host {host!r} is not allowed")
+
+
+class MemoryJobStore:
+    blocking = False
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+
+    def put(self, job: Dict[str, Any]) -> None:
+        self._jobs[job["id"]] = job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        return dict(job) if job else None
+
+    def all(self) -> List[Dict[str, Any]]:
+        return list(self._jobs.values())
+
+    def delete(self, job_id: str) -> None:
+        self._jobs.pop(job_id, None)
+
+
+class DiskJobStore:
+    """
+    One JSON file per job, replaced atomically on every state change.
+    """
+    blocking = True  # file I/O: called on a thread by JobQueue
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def put(self, job: Dict[str, Any]) -> None:
+        path = self._path(job["id"])
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(f"{path}.tmp", path)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(job_id), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def all(self) -> List[Dict[str, Any]]:
+        jobs = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                job = self.get(entry.name[:-len(".json")])
+                if job is not None:
+                    jobs.append(job)
+        return jobs
+
+    def delete(self, job_id: str) -> None:
+        try:
+            os.remove(self._path(job_id))
+        except OSError:
+            pass
+
+
+def make_store(kind: Optional[str] = None, directory: Optional[str] = None):
+    kind = kind or JobConfig.STORE
+    if kind == "disk":
+        return DiskJobStore(directory or JobConfig.STORE_DIR)
+    if kind == "memory":
+        return MemoryJobStore()
+    raise ValueError(f"Unknown job store {kind!r}")
+
+
+class JobQueue:
+    """
+    ``handler(payload)`` runs for each job on one of ``workers`` tasks; its return
+    value becomes the job ``result``. An exception marks the job ``failed`` with
+    the exception message as ``error``.
+
+    Store calls that touch the disk run on a thread, off the event loop. Finished
+    jobs are indexed by age, so expired records are dropped without scanning the store.
+    """
+
+    def __init__(self, handler: Callable[[Any], Awaitable[Any]], store=None,
+                 workers: Optional[int] = None, maxsize: Optional[int] = None):
+        self.handler = handler
+        self.store = store or make_store()
+        self.workers = workers or JobConfig.WORKERS
+        self.capacity = maxsize or JobConfig.QUEUE_SIZE
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # (finished_at, job ID) of the jobs finished here, oldest first
+        self._finished: Deque[Tuple[float, str]] = deque()
+        self.busy = 0
+        self.counters = {"accepted": 0, "rejected": 0, "done": 0, "failed": 0, "callbacks_failed": 0}
+
+    async def _store(self, method: Callable, *args):
+        if self.store.blocking:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(self.capacity)
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+        # The one full scan: jobs queued or running when their process stopped lost
+        # their payload (the other gateway processes sharing the store are still
+        # running theirs), and finished jobs go into the age index. Interrupted jobs
+        # are failed (finished now) after the others are indexed, oldest first
+        interrupted = []
+        for job in sorted(await self._store(self.store.all), key=lambda job: job["finished_at"] or 0):
+            if job["status"] in ("queued", "running") and _owner_gone(job.get("owner")):
+                interrupted.append(job)
+            elif job["finished_at"] is not None:
+                self._finished.append((job["finished_at"], job["id"]))
+        for job in interrupted:
+            await self._finish(job, "failed", error="Interrupted by a service restart")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, payload: Any, callback_url: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Queue ``payload`` and return the new job record. Raises ``InvalidCallback``
+        or ``QueueFull``.
+        """
+        if callback_url is not None:
+            check_callback_url(callback_url)
+        if self._queue.full():
+            self.counters["rejected"] += 1
+            raise QueueFull(self.depth, self.capacity)
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": "queued",
+            "owner": OWNER,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "callback_url": callback_url,
+            "result": None,
+            "error": None,
+        }
+        # Stored before it is queued, so a worker never overtakes the "queued" record
+        await self._store(self.store.put, job)
+        try:
+            self._queue.put_nowait((dict(job), payload))
+        except asyncio.QueueFull:
+            # Filled up by other submissions while the record was written
+            await self._store(self.store.delete, job["id"])
+            self.counters["rejected"] += 1
+            raise QueueFull(self.depth, self.capacity)
+        self.counters["accepted"] += 1
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        # IDs are uuid4 hex; anything else (e.g. a path) is not looked up
+        if len(job_id) != 32 or not all(c in string.hexdigits for c in job_id):
+            return None
+        return await self._store(self.store.get, job_id)
+
+    async def _finish(self, job: Dict[str, Any], status: str, result: Any = None, error: Optional[str] = None) -> None:
+        job.update(status=status, result=result, error=error, finished_at=time.time())
+        await self._store(self.store.put, job)
+        self._finished.append((job["finished_at"], job["id"]))
+
+    async def _worker(self) -> None:
+        while True:
+            job, payload = await self._queue.get()
+            self.busy += 1
+            job.update(status="running", started_at=time.time())
+            try:
+                await self._store(self.store.put, job)
+                await self._finish(job, "done", result=await self.handler(payload))
+                self.counters["done"] += 1
+            except asyncio.CancelledError:
+                await self._finish(job, "failed", error="Cancelled")
+                raise
+            except Exception as e:
+                await self._finish(job, "failed", error=str(e))
+                self.counters["failed"] += 1
+            finally:
+                self.busy -= 1
+                del payload  # do not hold the image while waiting for the next job
+            if job["callback_url"]:
+                # Sent in the background: a slow client must not hold up a worker
+                asyncio.ensure_future(self._callback(job))
+            await self._prune()
+
+    async def _callback(self, job: Dict[str, Any]) -> None:
+        try:
+            await post_with_retry(job["callback_url"], retries=JobConfig.CALLBACK_RETRIES, json=job)
+        except httpx.HTTPError as e:
+            self.counters["callbacks_failed"] += 1
+            logger.warning("Callback for job %s to %s failed: %s", job["id"], job["callback_url"], e)
+
+    async def _prune(self) -> None:
+        # Only the expired records are visited, oldest first
+        cutoff = time.time() - JobConfig.TTL
+        while self._finished and self._finished[0][0] < cutoff:
+            _, job_id = self._finished.popleft()
+            await self._store(self.store.delete, job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "queue_depth": self.depth,
+            "queue_capacity": self.capacity,
+            "workers": self.workers,
+            "busy_workers": self.busy,
+        }
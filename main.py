@@ -1,39 +1,350 @@
-import requests
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import JSONResponse
-import re 
+import asyncio
+import httpx
+import json
+import os
+from fastapi import FastAPI, File, Form, UploadFile, WebSocket
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import List, Optional
+
+import field_extraction
+import log_pipeline
+import metrics
+from admission import AdmissionConfig, Overloaded
+from batch import ndjson_line, read_batch, stream_batch
+from backend_pool import BackendPool, urls_from_env
+from http_client import HttpConfig, close_client, get_client
+from jobs import InvalidCallback, JobQueue, QueueFull
+from readiness import Readiness, add_ready_route
+
+# Client WebSocket (facultatif) pour relayer le flux caméra au service OCR en mode "http"
+try:
+    import websockets
+except ImportError:
+    websockets = None
 
 app = FastAPI()
+metrics.instrument(app, "gateway")
+# Avant l'import des services du monolithe : c'est la passerelle qui configure le journal
+log_pipeline.setup("gateway")
+
+# Instances des services OCR et de validation (une ou plusieurs, séparées par des virgules) :
+# chaque requête va à l'instance disponible la moins chargée, les instances en échec sont
+# écartées un temps (voir backend_pool)
+ocr_backends = BackendPool("ocr", urls_from_env("OCR_BACKENDS", "http://192.168.11.106:8003"))
+# La validation est rapide : pas de requêtes doublées
+validation_backends = BackendPool("validation", urls_from_env("VALIDATION_BACKENDS", "http://192.168.11.106:8002"),
+                                  hedge_after="")
+
+# "http" : l'OCR et la validation sont des services séparés, appelés en HTTP
+# "monolith" : les trois applications dans un seul processus ; la passerelle appelle
+# directement le pipeline OCR et le validateur, sans sérialisation ni aller-retour réseau
+GATEWAY_MODE = os.getenv("GATEWAY_MODE", "http")
+
+if GATEWAY_MODE == "monolith":
+    import frame_stream
+    import image_decode
+    import ocr_service
+    import validation_service
+
+    # Les services restent joignables sur le même port
+    app.mount("/ocr-service", ocr_service.app)
+    app.mount("/validation-service", validation_service.app)
+
+# En mode monolithe, prête seulement quand l'OCR (préchargement) et la validation le sont
+readiness = Readiness("gateway")
+if GATEWAY_MODE == "monolith":
+    add_ready_route(app, readiness, ocr_service.readiness, validation_service.readiness)
+else:
+    add_ready_route(app, readiness)
 
-# Adresse du service OCR
-OCR_SERVICE_URL = "http://192.168.11.106:8003/ocr/"
-VALIDATION_SERVICE_URL = "http://192.168.11.106:8002/validate/"  # Adresse du service de validation
+@app.on_event("startup")
+async def startup():
+    if GATEWAY_MODE == "monolith":
+        # Les événements des applications montées ne sont pas déclenchés par Starlette
+        await validation_service.startup()
+        await ocr_service.startup()
+    # Client HTTP partagé (connexions keep-alive réutilisées entre les requêtes)
+    get_client()
+    if GATEWAY_MODE != "monolith":
+        # Vérifications de santé actives des instances, en tâche de fond
+        ocr_backends.start()
+        validation_backends.start()
+    await job_queue.start()
+    readiness.set_ready()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await job_queue.stop()
+    if GATEWAY_MODE == "monolith":
+        ocr_service.shutdown()
+    await ocr_backends.stop()
+    await validation_backends.stop()
+    await close_client()
+    log_pipeline.shutdown()
+
+class ProcessingError(Exception):
+    """Échec d'une étape du traitement, avec le code HTTP à renvoyer au client"""
+
+    def __init__(self, message: str, status_code: int = 500):
+        super().__init__(message)
+        self.status_code = status_code
+
+async def process_card(content: bytes, content_type: str) -> dict:
+    """
+    Étapes 1 à 4 pour une image déjà lue. Lève ProcessingError en cas d'échec.
+    """
+    # Étape 1: Envoyer l'image au service OCR
+    if GATEWAY_MODE == "monolith":
+        try:
+            with metrics.timed("gateway", "ocr_call"):
+                ocr_data = await ocr_service.cached_process_image(content)
+        except image_decode.ImageTooLarge as e:
+            raise ProcessingError(str(e), status_code=413)
+        except Overloaded as e:
+            raise ProcessingError(str(e), status_code=503)
+        except Exception as e:
+            raise ProcessingError(f"OCR service failed: {str(e)}")
+        return await validate_ocr_data(ocr_data)
+
+    try:
+        # Le service OCR refuse tout de suite (503) ce qu'il ne pourrait pas traiter
+        # avant l'expiration de notre délai de lecture
+        with metrics.timed("gateway", "ocr_call"):
+            ocr_response = await ocr_backends.post(
+                "/ocr/",
+                files={"file": ("id_card.jpg", content, content_type)},
+                headers={AdmissionConfig.TIMEOUT_HEADER: str(HttpConfig.READ_TIMEOUT), **timing_headers()}
+            )
+        # Détail des étapes du service OCR, si le client a demandé la décomposition des temps
+        metrics.merge_server_timing(ocr_response.headers.get("Server-Timing"), "ocr.")
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 503:
+            raise ProcessingError("OCR service overloaded, retry later.", status_code=503)
+        if e.response.status_code == 413:
+            raise ProcessingError("Image too large for the OCR service.", status_code=413)
+        raise ProcessingError(f"OCR service failed: {str(e)}")
+    except httpx.HTTPError as e:
+        raise ProcessingError(f"OCR service failed: {str(e)}")
+
+    try:
+        ocr_data = ocr_response.json()
+    except ValueError:
+        raise ProcessingError("Failed to parse OCR response.")
+
+    try:
+        return await validate_ocr_data(ocr_data)
+    except httpx.HTTPError as e:
+        raise ProcessingError(f"Validation service failed: {str(e)}")
 
 @app.post("/process/")
 async def process_id_card(file: UploadFile = File(...)):
     # Vérification du type de fichier (JPEG ou PNG)
     if file.content_type not in ["image/jpeg", "image/png"]:
         return JSONResponse(content={"error": "Invalid file format. Please upload a JPEG or PNG image."}, status_code=400)
-    
-    # Étape 1: Envoyer l'image au service OCR
+
+    # Contenu lu une seule fois pour pouvoir le renvoyer en cas de nouvelle tentative
+    content = await file.read()
+    try:
+        return await process_card(content, file.content_type)
+    except ProcessingError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=e.status_code)
+
+async def process_job(payload) -> dict:
+    content, content_type = payload
+    return await process_card(content, content_type)
+
+# File bornée de traitements asynchrones, vidée par un nombre fixe de workers
+# (état des jobs en mémoire ou sur disque selon JOB_STORE)
+job_queue = JobQueue(process_job)
+
+@app.post("/process/jobs", status_code=202)
+async def submit_job(file: UploadFile = File(...), callback_url: Optional[str] = Form(None)):
+    """
+    Dépôt d'une carte à traiter en arrière-plan : l'identifiant du job est renvoyé
+    tout de suite, le résultat s'obtient par GET /process/jobs/{job_id} ou est
+    envoyé en POST à callback_url (http(s) vers un hôte de JOB_CALLBACK_HOSTS, sinon 400).
+    File pleine : refus immédiat (503) avec sa profondeur.
+    """
+    if file.content_type not in ["image/jpeg", "image/png"]:
+        return JSONResponse(content={"error": "Invalid file format. Please upload a JPEG or PNG image."}, status_code=400)
+
+    content = await file.read()
+    try:
+        job = await job_queue.submit((content, file.content_type), callback_url=callback_url)
+    except InvalidCallback as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    except QueueFull as e:
+        return JSONResponse(
+            content={"error": "Job queue full", "queue_depth": e.depth, "queue_capacity": e.capacity},
+            status_code=503,
+            headers={"Retry-After": "1"}
+        )
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "poll_url": f"/process/jobs/{job['id']}",
+        "queue_depth": job_queue.depth,
+        "queue_capacity": job_queue.capacity
+    }
+
+@app.get("/backends/stats")
+def backend_stats():
+    """Instances OCR et de validation : disponibilité, requêtes en cours, échecs, exclusions et requêtes doublées"""
+    return {"ocr": ocr_backends.stats(), "validation": validation_backends.stats()}
+
+@app.get("/process/jobs/stats")
+def job_stats():
+    return job_queue.stats()
+
+@app.get("/process/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await job_queue.get(job_id)
+    if job is None:
+        return JSONResponse(content={"error": "Unknown job"}, status_code=404)
+    return job
+
+@app.post("/process/batch")
+async def process_batch(files: List[UploadFile] = File(...)):
+    """
+    Traitement d'un lot de cartes (images ou archive zip) : le lot est transmis en une
+    seule requête au service OCR, puis chaque résultat est validé et renvoyé en NDJSON
+    dès qu'il arrive
+    """
+    if GATEWAY_MODE == "monolith":
+        try:
+            items = await read_batch(files)
+        except ValueError as e:
+            return JSONResponse(content={"error": str(e)}, status_code=400)
+
+        async def process_item(item):
+            return await validate_ocr_data(await ocr_service.cached_process_image(item.data, bulk=True))
+
+        return stream_batch(items, process_item)
+
+    uploads = [("files", (f.filename, await f.read(), f.content_type)) for f in files]
+    client = get_client()
+    # Le lot reste compté sur son instance jusqu'à la fin de la réponse en flux
+    backend = ocr_backends.pick()
+    start = ocr_backends.acquire(backend)
     try:
-        ocr_response = requests.post(
-            OCR_SERVICE_URL,
-            files={"file": ("id_card.jpg", file.file, file.content_type)}
+        ocr_response = await client.send(
+            client.build_request("POST", backend.url + "/ocr/batch", files=uploads), stream=True
         )
-        ocr_response.raise_for_status()  # Lève une exception si le code HTTP est >= 400
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
+        ocr_backends.release(backend, start, e)
         return JSONResponse(content={"error": f"OCR service failed: {str(e)}"}, status_code=500)
+    if ocr_response.is_error:
+        await ocr_response.aread()
+        await ocr_response.aclose()
+        try:
+            ocr_response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            ocr_backends.release(backend, start, e)
+        return JSONResponse(content={"error": f"OCR service failed: {ocr_response.text}"},
+                            status_code=ocr_response.status_code)
+
+    async def generate():
+        total = failed = 0
+        error = None
+        try:
+            async for line in ocr_response.aiter_lines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if "summary" in record:
+                    continue
+                total += 1
+                if record.get("status") == "ok":
+                    try:
+                        record["result"] = await validate_ocr_data(record["result"])
+                    except httpx.HTTPError as e:
+                        record.update(status="error", error=f"Validation service failed: {str(e)}")
+                failed += record.get("status") != "ok"
+                yield ndjson_line(record)
+        except httpx.HTTPError as e:
+            error = e
+            yield ndjson_line({"error": f"OCR service failed: {str(e)}"})
+        finally:
+            await ocr_response.aclose()
+            ocr_backends.release(backend, start, error)
+        yield ndjson_line({"summary": {"total": total, "ok": total - failed, "failed": failed}})
 
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@app.websocket("/process/stream")
+async def process_stream(websocket: WebSocket):
+    """
+    Flux d'images de la caméra (voir frame_stream) : les messages de suivi du service
+    OCR sont transmis tels quels, puis le résultat voté est validé comme par /process/
+    et renvoyé en dernier message
+    """
+    await websocket.accept()
     try:
-        ocr_data = ocr_response.json()
-        extracted_text = ocr_data.get("text", "")
-    except ValueError:
-        return JSONResponse(content={"error": "Failed to parse OCR response."}, status_code=500)
+        if GATEWAY_MODE == "monolith":
+            result = await frame_stream.run_session(websocket, ocr_service.cached_process_image)
+        else:
+            result = await relay_stream(websocket)
+        if result is None:
+            return  # client déconnecté
+        result.update(await validate_ocr_data(result["fields"]))
+    except ProcessingError as e:
+        await websocket.send_json({"type": "error", "error": str(e)})
+        await websocket.close(code=1011)
+        return
+    except httpx.HTTPError as e:
+        result["validation_error"] = f"Validation service failed: {str(e)}"
+    await websocket.send_json(result)
+    await websocket.close()
+
+async def relay_stream(websocket: WebSocket) -> Optional[dict]:
+    """
+    Relais entre le client et /ocr/stream du service OCR : images vers le service,
+    messages de suivi vers le client. Renvoie le message de résultat du service, ou
+    None si le client s'est déconnecté. Lève ProcessingError si le service est injoignable.
+    """
+    if websockets is None:
+        raise ProcessingError("Streaming needs the 'websockets' package on the gateway.")
+    backend = ocr_backends.pick()
+    try:
+        with ocr_backends.use(backend):
+            async with websockets.connect(backend.url.replace("http", "ws", 1) + "/ocr/stream",
+                                          max_size=None) as upstream:
+                async def forward_frames():
+                    while True:
+                        message = await websocket.receive()
+                        if message["type"] == "websocket.disconnect":
+                            await upstream.close()
+                            return
+                        await upstream.send(message["bytes"] if message.get("bytes") is not None else message["text"])
+
+                forwarding = asyncio.ensure_future(forward_frames())
+                try:
+                    async for message in upstream:
+                        event = json.loads(message)
+                        if event.get("type") == "result":
+                            return event
+                        await websocket.send_json(event)
+                finally:
+                    forwarding.cancel()
+    except (OSError, websockets.WebSocketException) as e:
+        raise ProcessingError(f"OCR service failed: {str(e)}")
+    return None
 
-    # Étape 2: Extraire le CIN, le nom et le prénom
-    cin = extract_cin(extracted_text)
-    name, first_name = extract_name_and_first_name(extracted_text)
+def timing_headers() -> dict:
+    """Demande au service appelé sa décomposition des temps quand le client l'a demandée"""
+    return {metrics.MetricsConfig.TIMINGS_HEADER: "1"} if metrics.timings_requested() else {}
+
+async def validate_ocr_data(ocr_data: dict) -> dict:
+    """
+    Étapes 2 à 4 : champs extraits par le service OCR, validation du CIN et
+    construction du résultat. Lève httpx.HTTPError si la validation échoue.
+    """
+    # Étape 2: Le CIN, le nom et le prénom sont déjà extraits par le service OCR ;
+    # le texte brut ne sert qu'à compléter les champs manquants, et seulement s'il
+    # vient de l'OCR pleine page (pas des lignes "champ: valeur" des zones ni de la MRZ)
+    with metrics.timed("gateway", "extract"):
+        fields = field_extraction.complete_fields(ocr_data, ("cin", "name", "first_name"))
+    cin, name, first_name = fields["cin"], fields["name"], fields["first_name"]
 
     if not cin:
         return {"valid": False, "message": "CIN not found in the text"}
@@ -41,15 +352,15 @@ async def process_id_card(file: UploadFile = File(...)):
         return {"valid": False, "message": "Name or First Name not found in the text"}
 
     # Étape 3: Valider le CIN
-    try:
-        validation_response = requests.post(
-            VALIDATION_SERVICE_URL,
-            json={"cin": cin}
-        )
-        validation_response.raise_for_status()
-        validation_data = validation_response.json()
-    except requests.RequestException as e:
-        return JSONResponse(content={"error": f"Validation service failed: {str(e)}"}, status_code=500)
+    with metrics.timed("gateway", "validation_call"):
+        if GATEWAY_MODE == "monolith":
+            validation_data = validation_service.validate(validation_service.ValidationRequest(cin=cin))
+        else:
+            validation_response = await validation_backends.post(
+                "/validate/",
+                json={"cin": cin}
+            )
+            validation_data = validation_response.json()
 
     # Étape 4: Retourner les résultats
     return {
@@ -59,25 +370,3 @@ async def process_id_card(file: UploadFile = File(...)):
         "first_name": first_name,
         "validation": validation_data
     }
-
-def extract_cin(text: str) -> str:
-    """Extraire le CIN depuis le texte brut."""
-    pattern = r"[A-Z]{3} \d{6}"  # Exemple de format CIN: 3 lettres majuscules suivies de 6 chiffres
-    match = re.search(pattern, text)
-    if match:
-        return match.group(0)
-    return None
-
-def extract_name_and_first_name(text: str) -> tuple:
-    """Extraire le nom et le prénom depuis le texte brut."""
-    # Expressions régulières pour extraire le nom et le prénom
-    name_pattern = r"Nom\s*[:\-]?\s*([A-Za-zÀ-ÿéèôîûç]+)"  # Cherche le nom
-    first_name_pattern = r"Prénom\s*[:\-]?\s*([A-Za-zÀ-ÿéèôîûç]+)"  # Cherche le prénom
-    
-    name_match = re.search(name_pattern, text)
-    first_name_match = re.search(first_name_pattern, text)
-    
-    name = name_match.group(1) if name_match else None
-    first_name = first_name_match.group(1) if first_name_match else None
-    
-    return name, first_name
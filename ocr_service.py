@@ -1,46 +1,129 @@
 import pytesseract
-from fastapi import FastAPI, File, UploadFile
+from fastapi import FastAPI, File, Header, UploadFile, WebSocket
 from fastapi.responses import JSONResponse
+from typing import List, Optional
+import asyncio
 import cv2
 import numpy as np
-from PIL import Image
-import re
+import os
+import time
+
+import card_layout
+import field_extraction
+import frame_stream
+import image_decode
+import log_pipeline
+import metrics
+import mrz
+import preprocess_pipeline
+import script_router
+import tesseract_pool
+import word_reocr
+from admission import AdmissionConfig, AdmissionController, Overloaded
+from batch import read_batch, stream_batch
+from cpu_executor import run_stage, stage_executor
+from ocr_cache import OCRCache, make_key
+from readiness import Readiness, add_ready_route
 
 app = FastAPI()
+metrics.instrument(app, "ocr")
+# Journal JSON écrit par un thread de fond ; texte OCR seulement échantillonné et masqué
+log_pipeline.setup("ocr")
 
 # Configuration de Tesseract
 pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
 
+# "roi" : lecture des zones de la carte d'abord, OCR pleine page seulement si nécessaire
+# "full" : toujours l'OCR pleine page
+OCR_FIELD_MODE = os.getenv("OCR_FIELD_MODE", "roi")
+
+# Cache des résultats, indexé par le contenu de l'image et la configuration du pipeline
+# (changer la configuration change l'empreinte et invalide donc les entrées)
+PIPELINE_FINGERPRINT = "|".join(str(value) for value in (
+    "v3", OCR_FIELD_MODE, mrz.MRZConfig.ENABLED, mrz.MRZConfig.LANG,
+    script_router.RouterConfig.LATIN_LANG, script_router.RouterConfig.ARABIC_LANG,
+    script_router.RouterConfig.ARABIC_LINES, script_router.RouterConfig.ARABIC_MIN_JOINED,
+))
+ocr_cache = OCRCache()
+
+# Contrôle d'admission : nombre de traitements simultanés, file d'attente courte et budget
+# de pixels décodés ; au-delà, rejet immédiat (503 + Retry-After) plutôt qu'une réponse tardive
+admission = AdmissionController()
+
+# Préchargement au démarrage (moteurs Tesseract et une carte factice à travers le
+# pipeline) ; /ready ne passe au vert qu'une fois terminé
+OCR_WARMUP = os.getenv("OCR_WARMUP", "on") == "on"
+readiness = Readiness("ocr")
+add_ready_route(app, readiness)
+
+@app.on_event("startup")
+async def startup():
+    if OCR_WARMUP:
+        # En tâche de fond : /health répond pendant le préchargement
+        app.state.warmup = asyncio.ensure_future(warm_up())
+    else:
+        readiness.set_ready()
+
+@app.on_event("shutdown")
+def shutdown():
+    stage_executor.shutdown()
+    tesseract_pool.close_pools()
+    log_pipeline.shutdown()
+
+@app.get("/health")
+def health():
+    return {"status": "ok"}
+
+@app.get("/executor/stats")
+def executor_stats():
+    """Profondeur de file et temps d'attente par étape (décodage, prétraitement, OCR)"""
+    return stage_executor.stats()
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Compteurs de succès / échecs du cache des résultats OCR"""
+    return ocr_cache.stats()
+
+@app.get("/admission/stats")
+def admission_stats():
+    """Traitements en cours, file d'attente, pixels réservés et rejets du contrôle d'admission"""
+    return admission.stats()
+
+@app.get("/logging/stats")
+def logging_stats():
+    """Enregistrements du journal mis en file, perdus (file pleine), profondeur de file, textes échantillonnés"""
+    return log_pipeline.stats()
+
+@app.get("/mrz/stats")
+def mrz_stats():
+    """Lectures de la zone MRZ : tentatives, zone absente, rejetées (contrôle) et vérifiées"""
+    return mrz.stats()
+
+@app.get("/router/stats")
+def router_stats():
+    """Pages et lignes lues par le routeur d'écriture (latines, arabes ignorées ou lues, reclassées)"""
+    return script_router.stats()
+
+@app.get("/preprocess/stats")
+def preprocess_stats():
+    """Pipelines de prétraitement construits, exécutions, étapes sans effet retirées, tampons alloués"""
+    return preprocess_pipeline.stats()
+
+@app.get("/stream/stats")
+def stream_stats():
+    """Sessions de flux caméra : images reçues, sans carte, floues, lues par OCR, résultats stables"""
+    return frame_stream.stats()
+
 @app.post("/ocr/")
-async def extract_text(file: UploadFile = File(...)):
+async def extract_text(file: UploadFile = File(...),
+                       timeout: Optional[float] = Header(None, alias=AdmissionConfig.TIMEOUT_HEADER)):
     try:
-        # Charger et prétraiter l'image
-        image = Image.open(file.file)
-        image_np = np.array(image)
-
-        # Prétraitement de l'image
-        preprocessed = preprocess_image(image_np)
-
-        # Configuration OCR pour le français et l'arabe
-        custom_config = r'--oem 3 --psm 3 -l fra+ara'  # Ajouter 'ara' pour l'arabe
-        text = pytesseract.image_to_string(preprocessed, config=custom_config)
-
-        # Filtrer uniquement les informations en français
-        filtered_text = filter_french_text(text)
-
-        # Extraire les informations
-        cin = extract_cin(filtered_text)
-        name, first_name = extract_name_and_first_name(filtered_text)
-        birth_date = extract_birth_date(filtered_text)
-
-        # Retourner les informations extraites
-        return {
-            "cin": cin,
-            "name": name,
-            "first_name": first_name,
-            "birth_date": birth_date,
-            "raw_text": filtered_text
-        }
+        return await cached_process_image(await image_decode.read_upload(file), timeout)
+    except image_decode.ImageTooLarge as e:
+        return JSONResponse(content={"error": str(e)}, status_code=413)
+    except Overloaded as e:
+        return JSONResponse(content={"error": str(e)}, status_code=503,
+                            headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         # Retourner une erreur détaillée en cas d'échec
         return JSONResponse(
@@ -48,128 +131,191 @@ async def extract_text(file: UploadFile = File(...)):
             status_code=500
         )
 
-
-def preprocess_image(image):
+@app.post("/ocr/batch")
+async def extract_text_batch(files: List[UploadFile] = File(...)):
     """
-    Prétraitement amélioré de l'image pour une meilleure reconnaissance
+    Traitement d'un lot d'images (fichiers ou archive zip), résultats renvoyés en NDJSON
+    au fur et à mesure, une ligne par carte
     """
     try:
-        # Convertir en niveaux de gris
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-
-        # Débruitage
-        denoised = cv2.fastNlMeansDenoising(gray)
-
-        # Amélioration du contraste avec CLAHE (Contrast Limited Adaptive Histogram Equalization)
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-        enhanced = clahe.apply(denoised)
-
-        # Binarisation adaptative (seuil variable selon les voisins)
-        binary = cv2.adaptiveThreshold(
-            enhanced,
-            255,
-            cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-            cv2.THRESH_BINARY,
-            11,
-            2
-        )
+        items = await read_batch(files)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    # Voie « bulk » du contrôle d'admission : les cartes du lot attendent derrière le trafic
+    # interactif au lieu d'échouer une à une quand il remplit la file
+    return stream_batch(items, lambda item: cached_process_image(item.data, bulk=True))
+
+@app.websocket("/ocr/stream")
+async def extract_text_stream(websocket: WebSocket):
+    """
+    Flux d'images de la caméra : seules les meilleures images sont lues par OCR, et
+    chaque champ est voté d'une image à l'autre (voir frame_stream)
+    """
+    await websocket.accept()
+    result = await frame_stream.run_session(websocket, cached_process_image)
+    if result is not None:
+        await websocket.send_json(result)
+        await websocket.close()
 
-        # Dilatation pour améliorer la lisibilité (mettre en valeur les contours)
-        kernel = np.ones((1, 1), np.uint8)
-        dilated = cv2.dilate(binary, kernel, iterations=1)
 
-        return dilated
-    except cv2.error as e:
-        raise ValueError(f"Erreur OpenCV lors du prétraitement de l'image: {str(e)}")
-    except Exception as e:
-        raise ValueError(f"Erreur inconnue lors du prétraitement de l'image: {str(e)}")
+async def cached_process_image(data: bytes, timeout: Optional[float] = None, bulk: bool = False) -> dict:
+    """
+    Résultat en cache pour une image déjà traitée, sinon exécution du pipeline
+    (une seule exécution pour des requêtes identiques simultanées)
+    """
+    # Un lot n'attend pas derrière le délai d'une requête interactive, ni l'inverse ;
+    # un refus (Overloaded) ne vaut que pour le délai de la requête qui l'a reçu
+    return await ocr_cache.get_or_compute(make_key(data, PIPELINE_FINGERPRINT),
+                                          lambda: admitted_process_image(data, timeout, bulk),
+                                          lane="bulk" if bulk else "interactive", retry_on=(Overloaded,))
 
 
-def filter_french_text(text: str) -> str:
+async def admitted_process_image(data: bytes, timeout: Optional[float] = None, bulk: bool = False) -> dict:
     """
-    Filtrer uniquement les lignes en français
+    Pipeline exécuté une fois admis ; ``timeout`` est le délai d'attente du client en
+    secondes. Lève Overloaded si le traitement ne peut pas commencer à temps (jamais
+    pour le travail ``bulk``, qui attend son tour derrière les requêtes interactives)
     """
-    try:
-        # Pattern pour identifier les caractères arabes (en excluant les lignes avec des caractères arabes)
-        arabic_pattern = r'[\u0600-\u06FF]'
+    pixels = image_decode.decoded_pixels(data)
+    start = time.perf_counter()
+    async with admission.admit(pixels, timeout, bulk):
+        metrics.observe_stage("ocr", "admission", time.perf_counter() - start)
+        return await process_image(data)
 
-        # Garder uniquement les lignes ne contenant pas de caractères arabes
-        filtered_lines = [line for line in text.split('\n') if not re.search(arabic_pattern, line)]
 
-        return '\n'.join(filtered_lines)
-    except Exception as e:
-        raise ValueError(f"Erreur lors du filtrage du texte français: {str(e)}")
+async def process_image(data: bytes) -> dict:
+    """
+    Pipeline complet pour une image : décodage, prétraitement, OCR et extraction
+    """
+    # Les étapes coûteuses en CPU s'exécutent dans le pool pour ne pas bloquer la boucle d'événements
+    image_np = await run_stage("decode", decode_image, data)
+
+    # Cartes récentes : zone MRZ au verso, lue seule et vérifiée par ses chiffres de
+    # contrôle ; si elle est valide, ni les zones du recto ni l'OCR pleine page ne sont lus
+    if mrz.MRZConfig.ENABLED:
+        zone = await run_stage("mrz", mrz.read_mrz, image_np)
+        if zone is not None:
+            return {
+                "cin": zone.cin,
+                "name": zone.name,
+                "first_name": zone.first_name,
+                "birth_date": zone.birth_date,
+                "city": None,
+                "raw_text": zone.text(),
+                "text_source": "mrz"
+            }
+
+    # Lecture ciblée des zones CIN / noms / date / ville sur la carte redressée
+    if OCR_FIELD_MODE == "roi":
+        fields, field_text = await run_stage("roi", card_layout.read_fields, image_np)
+        if fields["cin"] and fields["birth_date"]:
+            return {
+                "cin": fields["cin"],
+                "name": fields["name"],
+                "first_name": fields["first_name"],
+                "birth_date": fields["birth_date"],
+                "city": fields["city"],
+                "raw_text": field_text,
+                "text_source": "roi"
+            }
+
+    # Prétraitement de l'image
+    preprocessed = await run_stage("preprocess", preprocess_image, image_np)
+
+    # OCR par ligne avec un seul modèle par écriture : les lignes latines sont lues avec le
+    # modèle français, les lignes arabes ignorées (lignes trouvées sur l'image en niveaux de gris)
+    words = await run_stage("ocr", script_router.read_page, preprocessed, layout=image_np)
+
+    # Relecture ciblée des mots peu fiables qui ressemblent au CIN ou à une date
+    words = await run_stage("reocr", word_reocr.refine_words, preprocessed, words)
+    text = tesseract_pool.words_to_text(words)
+
+    with metrics.timed("ocr", "extract"):
+        # Filtrer uniquement les informations en français
+        filtered_text = filter_french_text(text)
+
+        # Extraire les informations (moteur commun, une seule passe sur le texte)
+        fields = field_extraction.extract_fields(filtered_text)
+
+    # Retourner les informations extraites
+    return {
+        "cin": fields["cin"],
+        "name": fields["name"],
+        "first_name": fields["first_name"],
+        "birth_date": fields["birth_date"],
+        "city": None,
+        "raw_text": filtered_text,
+        "text_source": field_extraction.FULL_PAGE
+    }
 
 
-def extract_cin(text: str) -> str:
+async def warm_up():
     """
-    Extraction du numéro de CIN avec plusieurs patterns possibles
+    Charger les moteurs de chaque langue utilisée, puis faire passer une carte factice
+    par toutes les étapes (zones, pleine page), pour que la première vraie requête
+    ne paie ni le chargement des modèles ni la création des threads
     """
+    langs = {card_layout.LayoutConfig.LANG, word_reocr.ReocrConfig.LANG, script_router.RouterConfig.LATIN_LANG}
+    if script_router.RouterConfig.ARABIC_LINES == "ocr":
+        langs.add(script_router.RouterConfig.ARABIC_LANG)
+    if mrz.MRZConfig.ENABLED:
+        langs.add(mrz.MRZConfig.LANG)
     try:
-        # Patterns possibles pour le CIN marocain
-        patterns = [
-            r'[A-Z]{1,2}\d{5,6}',  # Format standard
-            r'[A-Z]{1,2} \d{5,6}',  # Format avec espace
-            r'CIN[:\s]+([A-Z]{1,2}\d{5,6})',  # Format avec préfixe CIN
-            r'CARTE NATIONALE[:\s]+([A-Z]{1,2}\d{5,6})'  # Format complet
-        ]
-
-        for pattern in patterns:
-            match = re.search(pattern, text)
-            if match:
-                return match.group(1) if len(match.groups()) > 0 else match.group(0)
-        return None
-    except re.error as e:
-        raise ValueError(f"Erreur lors de l'extraction du CIN: {str(e)}")
+        with readiness.step("engines"):
+            for lang in sorted(langs):
+                await run_stage("warmup", tesseract_pool.warm_up, lang)
+        with readiness.step("pipeline"):
+            card = card_layout.sample_card()
+            await process_image(cv2.imencode(".png", card)[1].tobytes())
+            # La carte factice est lue par zones : chemin pleine page à part
+            preprocessed = await run_stage("preprocess", preprocess_image, card)
+            await run_stage("ocr", script_router.read_page, preprocessed, layout=card)
     except Exception as e:
-        raise ValueError(f"Erreur inconnue lors de l'extraction du CIN: {str(e)}")
+        readiness.fail(e)
+        return
+    readiness.set_ready()
 
 
-def extract_name_and_first_name(text: str) -> tuple:
+def decode_image(data: bytes) -> np.ndarray:
     """
-    Extraction du nom et du prénom en français
+    Décodage de l'image envoyée directement en niveaux de gris, à résolution réduite
+    si elle est surdimensionnée (lève ImageTooLarge au-delà du budget octets / pixels)
     """
-    try:
-        lines = text.split('\n')
-
-        name = None
-        first_name = None
+    return image_decode.decode_gray(data)
 
-        # Patterns pour le nom et le prénom
-        name_pattern = r'Nom[:\s]+([A-ZÀ-Ÿ\s]+)'  # Nom
-        first_name_pattern = r'Prénom[:\s]+([A-ZÀ-Ÿ\s]+)'  # Prénom
 
-        for line in lines:
-            # Recherche du nom
-            match_name = re.search(name_pattern, line)
-            if match_name and not name:
-                name = match_name.group(1).strip()
+# Chaîne de prétraitement pleine page, appliquée après le passage en niveaux de gris
+PREPROCESS_STEPS = (
+    # Débruitage
+    preprocess_pipeline.step("denoise"),
+    # Amélioration du contraste avec CLAHE (Contrast Limited Adaptive Histogram Equalization)
+    preprocess_pipeline.step("clahe", clip=2.0, tiles=(8, 8)),
+    # Binarisation adaptative (seuil variable selon les voisins)
+    preprocess_pipeline.step("threshold", block_size=11, c=2),
+    # Dilatation par un noyau 1x1 : sans effet, retirée à la construction du pipeline
+    preprocess_pipeline.step("dilate", kernel=(1, 1)),
+)
 
-            # Recherche du prénom
-            match_first_name = re.search(first_name_pattern, line)
-            if match_first_name and not first_name:
-                first_name = match_first_name.group(1).strip()
 
-        return name, first_name
-    except re.error as e:
-        raise ValueError(f"Erreur lors de l'extraction du nom et du prénom: {str(e)}")
+def preprocess_image(image):
+    """
+    Prétraitement amélioré de l'image pour une meilleure reconnaissance.
+    Opérateurs OpenCV construits une fois et images intermédiaires écrites dans
+    les tampons du worker (voir preprocess_pipeline) ; seule l'image finale est allouée
+    """
+    try:
+        return preprocess_pipeline.worker_pipeline("page", PREPROCESS_STEPS).run(image)
+    except cv2.error as e:
+        raise ValueError(f"Erreur OpenCV lors du prétraitement de l'image: {str(e)}")
     except Exception as e:
-        raise ValueError(f"Erreur inconnue lors de l'extraction du nom et du prénom: {str(e)}")
+        raise ValueError(f"Erreur inconnue lors du prétraitement de l'image: {str(e)}")
 
 
-def extract_birth_date(text: str) -> str:
+def filter_french_text(text: str) -> str:
     """
-    Extraction de la date de naissance
+    Filtrer uniquement le texte en français (les mots en écriture arabe sont retirés)
     """
     try:
-        # Pattern pour la date de naissance
-        pattern = r'Néle?[:\s]+(\d{2}.\d{2}.\d{4})|M\w*le[:\s]+(\d{2}.\d{2}.\d{4})'
-
-        match = re.search(pattern, text)
-        if match:
-            return match.group(1) if match.group(1) else match.group(2)
-        return None
-    except re.error as e:
-        raise ValueError(f"Erreur lors de l'extraction de la date de naissance: {str(e)}")
+        return script_router.latin_text(text)
     except Exception as e:
-        raise ValueError(f"Erreur inconnue lors de l'extraction de la date de naissance: {str(e)}")
+        raise ValueError(f"Erreur lors du filtrage du texte français: {str(e)}")
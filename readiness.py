@@ -0,0 +1,71 @@
+"""
+Readiness of a service, separate from liveness.
+
+``/health`` answers as soon as the process serves HTTP; ``GET /ready`` answers 503
+until the service's startup work (loading an index, warming up the OCR engines)
+is done, so an orchestrator only routes traffic to a replica that will answer its
+first request at full speed. A failed startup step keeps the service unready and
+is reported in the body.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+import metrics
+
+logger = logging.getLogger("readiness")
+
+
+class Readiness:
+    def __init__(self, service: str):
+        self.service = service
+        self.ready = False
+        self.error: Optional[str] = None
+        self.steps: Dict[str, float] = {}  # startup step -> duration, ms
+        self._created = time.perf_counter()  # about when the service module was imported
+        self._ready_after: Optional[float] = None
+
+    @contextmanager
+    def step(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.steps[name] = round(elapsed * 1000, 1)
+            metrics.observe_stage(self.service, f"startup_{name}", elapsed)
+
+    def set_ready(self) -> None:
+        self.ready = True
+        self._ready_after = time.perf_counter() - self._created
+        logger.info("%s ready after %.2f s (%s)", self.service, self._ready_after, self.steps)
+
+    def fail(self, error: BaseException) -> None:
+        self.error = f"{type(error).__name__}: {error}"
+        logger.error("%s startup failed, staying unready: %s", self.service, self.error)
+
+    def status(self) -> dict:
+        return {
+            "status": "ready" if self.ready else "failed" if self.error else "starting",
+            "ready_after_s": round(self._ready_after, 3) if self._ready_after is not None else None,
+            "steps_ms": dict(self.steps),
+            "error": self.error,
+        }
+
+
+def add_ready_route(app: FastAPI, readiness: Readiness, *depends_on: Readiness) -> None:
+    """
+    Serve ``GET /ready``: 200 once ``readiness`` and every service in ``depends_on``
+    (e.g. the apps of a monolith) are ready, 503 before.
+    """
+    @app.get("/ready", include_in_schema=False)
+    def ready():
+        body = readiness.status()
+        if depends_on:
+            body["depends_on"] = {other.service: other.status() for other in depends_on}
+        ok = readiness.ready and all(other.ready for other in depends_on)
+        return JSONResponse(content=body, status_code=200 if ok else 503)
@@ -0,0 +1,197 @@
+"""
+Script router for full-page OCR: each text line is read by a single-language model.
+
+Reading a whole photo with ``fra+ara`` (or ``fra+ara+eng``) runs every model over
+every line, and the Arabic text is thrown away afterwards since only the Latin
+fields are extracted. Here the page is first cut into text lines by a cheap
+morphological layout pass. Each line's script is guessed from its ink: Arabic is
+cursive, so much of an Arabic line is covered by components several times wider
+than they are tall, while Latin print breaks into one component per letter. The
+Latin lines are stacked into one strip and read in a single call with the Latin
+model alone. Arabic lines are skipped, or read the same way with the Arabic model
+when ``OCR_ARABIC_LINES=ocr``. A Latin-routed line that reads back as noise and
+looks partly joined is treated as Arabic.
+
+Text scripts are told apart by Unicode range (``script_of``), which replaces
+per-line language detection.
+"""
+import os
+import re
+from collections import Counter
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+import card_layout
+import tesseract_pool
+from tesseract_pool import OCRWord
+
+
+class RouterConfig:
+    LATIN_LANG = os.getenv("OCR_LATIN_LANG", "fra")
+    ARABIC_LANG = os.getenv("OCR_ARABIC_LANG", "ara")
+    ARABIC_LINES = os.getenv("OCR_ARABIC_LINES", "skip")  # skip | ocr
+    # Share of a line's width covered by joined (wide) components from which it is
+    # Arabic; Latin print stays well below, even blurred
+    ARABIC_MIN_JOINED = float(os.getenv("OCR_ARABIC_MIN_JOINED", "0.6"))
+    # A Latin-routed line this joined whose words average under REROUTE_CONFIDENCE
+    # is Arabic after all
+    REROUTE_MIN_JOINED = 0.3
+    REROUTE_CONFIDENCE = 30.0
+    MIN_CHAR_HEIGHT = 8  # pixels; smaller components are dots and noise
+    STRIP_PSM = 6  # the stacked lines form one uniform block of text
+    SPARSE_PSM = 11
+
+
+class TextLine(NamedTuple):
+    left: int
+    top: int
+    width: int
+    height: int
+    joined: float  # share of the width covered by components wider than 1.5x their line's letter height
+
+
+_ARABIC = re.compile("[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF]")
+
+counters: Counter = Counter()
+
+
+def script_of(text: str) -> str:
+    """
+    ``arabic``, ``latin`` (whichever has more letters) or ``none`` (no letters).
+    """
+    arabic = len(_ARABIC.findall(text))
+    latin = sum(char.isalpha() for char in text) - arabic
+    if not arabic and latin <= 0:
+        return "none"
+    return "arabic" if arabic > latin else "latin"
+
+
+def latin_text(text: str) -> str:
+    """
+    ``text`` without its Arabic words; lines left empty are dropped.
+    """
+    lines = (" ".join(word for word in line.split() if script_of(word) != "arabic") for line in text.split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+def find_lines(gray: np.ndarray) -> List[TextLine]:
+    """
+    Text lines of ``gray`` (dark text on a lighter background) in reading order.
+    """
+    ink = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 31, 15)
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    widths, heights = stats[1:, cv2.CC_STAT_WIDTH], stats[1:, cv2.CC_STAT_HEIGHT]
+    candidates = ((heights >= RouterConfig.MIN_CHAR_HEIGHT) & (heights <= gray.shape[0] / 8)
+                  & (widths <= gray.shape[1] / 4))
+    if not candidates.any():
+        return []
+    letter_height = float(np.median(heights[candidates]))
+    letters = candidates & (heights >= 0.4 * letter_height) & (heights <= 2.5 * letter_height)
+
+    # Letters only (no frames, photo edges or specks), smeared sideways into lines
+    keep = np.zeros(count, np.uint8)
+    keep[1:][letters] = 255
+    kernel = np.ones((1, max(3, int(1.5 * letter_height))), np.uint8)
+    smeared = cv2.morphologyEx(keep[labels], cv2.MORPH_CLOSE, kernel)
+    _, _, line_stats, _ = cv2.connectedComponentsWithStats(smeared, connectivity=8)
+
+    centers_x = stats[1:, cv2.CC_STAT_LEFT] + widths / 2
+    centers_y = stats[1:, cv2.CC_STAT_TOP] + heights / 2
+    lines = []
+    for left, top, width, height, _ in line_stats[1:]:
+        if height < 0.5 * letter_height or width < height:
+            continue
+        inside = (letters & (centers_x >= left) & (centers_x < left + width)
+                  & (centers_y >= top) & (centers_y < top + height))
+        if not inside.any():
+            continue
+        line_widths = widths[inside]
+        wide = line_widths > 1.5 * np.median(heights[inside])
+        lines.append(TextLine(int(left), int(top), int(width), int(height),
+                              float(line_widths[wide].sum()) / width))
+    return sorted(lines, key=lambda line: (line.top, line.left))
+
+
+def _read_strip(image: np.ndarray, lines: List[Tuple[int, TextLine]], lang: str, dpi: Optional[int],
+                ocr: Callable[..., List[OCRWord]]) -> Dict[int, List[OCRWord]]:
+    """
+    Stack the ``(index, line)`` crops of ``image`` into one strip, OCR it in one
+    call and return each line's words in page coordinates.
+    """
+    gap = max(8, int(np.median([line.height for _, line in lines]) // 2))
+    crops = []
+    for index, line in lines:
+        top, left = max(0, line.top - gap // 2), max(0, line.left - gap)
+        crops.append((index, left, top, image[top:line.top + line.height + gap // 2, left:line.left + line.width + gap]))
+
+    strip = np.full((sum(crop.shape[0] + gap for *_, crop in crops) + gap, max(crop.shape[1] for *_, crop in crops)),
+                    255, np.uint8)
+    offsets = []  # strip y of each crop
+    y = gap
+    for index, left, top, crop in crops:
+        strip[y:y + crop.shape[0], :crop.shape[1]] = crop
+        offsets.append((y, y + crop.shape[0], index, left, top))
+        y += crop.shape[0] + gap
+
+    by_line: Dict[int, List[OCRWord]] = {}
+    for word in ocr(strip, lang=lang, psm=RouterConfig.STRIP_PSM, dpi=dpi):
+        center = word.top + word.height / 2
+        for start, end, index, left, top in offsets:
+            if start <= center < end:
+                by_line.setdefault(index, []).append(
+                    word._replace(left=word.left + left, top=word.top - start + top, line=index))
+                break
+    return by_line
+
+
+def read_page(image: np.ndarray, dpi: Optional[int] = None, sparse: bool = False,
+              layout: Optional[np.ndarray] = None,
+              ocr: Optional[Callable[..., List[OCRWord]]] = None) -> List[OCRWord]:
+    """
+    OCR the page with one model per script and return its words (Latin lines only,
+    unless ``OCR_ARABIC_LINES=ocr``) with page coordinates.
+
+    Lines are found on ``layout`` when given: the grey page before binarization,
+    whose lines are not merged by threshold noise (resized to ``image`` if needed).
+    ``sparse`` skips the layout pass and reads the whole page with sparse-text
+    segmentation and the Latin model, for photos whose lines cannot be found.
+    """
+    ocr = ocr or tesseract_pool.image_to_data
+    gray = card_layout.to_gray(image)
+    if sparse:
+        counters["sparse_pages"] += 1
+        words = ocr(gray, lang=RouterConfig.LATIN_LANG, psm=RouterConfig.SPARSE_PSM, dpi=dpi)
+        return [word for word in words if script_of(word.text) != "arabic"]
+
+    if layout is not None:
+        layout = card_layout.to_gray(layout)
+        if layout.shape != gray.shape:
+            layout = cv2.resize(layout, (gray.shape[1], gray.shape[0]), interpolation=cv2.INTER_AREA)
+    lines = list(enumerate(find_lines(gray if layout is None else layout)))
+    counters["pages"] += 1
+    counters["lines"] += len(lines)
+    latin = [(i, line) for i, line in lines if line.joined < RouterConfig.ARABIC_MIN_JOINED]
+    arabic = [(i, line) for i, line in lines if line.joined >= RouterConfig.ARABIC_MIN_JOINED]
+
+    by_line = _read_strip(gray, latin, RouterConfig.LATIN_LANG, dpi, ocr) if latin else {}
+    for i, line in latin:
+        words = by_line.get(i)
+        if words and line.joined >= RouterConfig.REROUTE_MIN_JOINED and \
+                sum(w.conf for w in words) / len(words) < RouterConfig.REROUTE_CONFIDENCE:
+            del by_line[i]
+            arabic.append((i, line))
+            counters["rerouted_lines"] += 1
+    counters["latin_lines"] += len(latin)
+
+    if RouterConfig.ARABIC_LINES == "ocr" and arabic:
+        by_line.update(_read_strip(gray, sorted(arabic), RouterConfig.ARABIC_LANG, dpi, ocr))
+        counters["arabic_lines_read"] += len(arabic)
+    else:
+        counters["arabic_lines_skipped"] += len(arabic)
+    return [word for i in sorted(by_line) for word in by_line[i]]
+
+
+def stats() -> Dict[str, int]:
+    return dict(counters)
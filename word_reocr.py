@@ -0,0 +1,87 @@
+"""
+Targeted re-OCR of low-confidence words.
+
+A single misread character in the CIN or the birth date used to mean another
+full-page pass or a retake. Instead, the words of a page that look like one of
+those fields but were read with low confidence are cropped from their bounding
+boxes, enlarged, and read again on their own with a whitelist for that field.
+"""
+import os
+import re
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+import tesseract_pool
+from card_layout import DIGITS, UPPERCASE, to_gray
+from tesseract_pool import OCRWord
+
+
+class ReocrConfig:
+    MIN_CONFIDENCE = float(os.getenv("OCR_REOCR_MIN_CONFIDENCE", "80"))
+    MAX_WORDS = int(os.getenv("OCR_REOCR_MAX_WORDS", "8"))
+    TEXT_HEIGHT = 64  # crops are enlarged so the word is about this tall
+    MAX_SCALE = 4.0
+    PADDING = 4
+    LANG = "fra"
+    PSM_SINGLE_WORD = 8
+
+
+# Characters Tesseract commonly reads in place of digits
+_DIGITISH = r"[0-9OoIlSBZ]"
+
+# Word shape -> characters allowed when that word is read again
+FIELD_SHAPES = [
+    ("date", re.compile(rf"{_DIGITISH}{{1,2}}[./-]{_DIGITISH}{{1,2}}[./-]{_DIGITISH}{{2,4}}"), DIGITS + "./-"),
+    ("cin", re.compile(rf"[A-Za-z]{{1,2}}{_DIGITISH}{{4,7}}"), UPPERCASE + DIGITS),
+    ("number", re.compile(rf"{_DIGITISH}{{5,6}}"), DIGITS),
+]
+
+
+def field_whitelist(text: str) -> Optional[str]:
+    """
+    Whitelist for a word shaped like a CIN, a CIN number part or a date, else None.
+    """
+    text = text.strip(" :;,")
+    for _, pattern, whitelist in FIELD_SHAPES:
+        if pattern.fullmatch(text) and sum(c.isdigit() for c in text) >= 3:
+            return whitelist
+    return None
+
+
+def crop_word(gray: np.ndarray, word: OCRWord) -> np.ndarray:
+    pad = ReocrConfig.PADDING
+    y0, x0 = max(0, word.top - pad), max(0, word.left - pad)
+    crop = gray[y0:word.top + word.height + pad, x0:word.left + word.width + pad]
+    scale = min(ReocrConfig.MAX_SCALE, ReocrConfig.TEXT_HEIGHT / max(1, word.height))
+    if scale > 1:
+        crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+    _, binary = cv2.threshold(crop, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return binary
+
+
+def refine_words(image: np.ndarray, words: List[OCRWord]) -> List[OCRWord]:
+    """
+    Re-read the low-confidence field-like words of ``words`` (boxes relative to
+    ``image``) and keep the new reading when it is more confident.
+    """
+    candidates = [
+        (i, whitelist) for i, word in enumerate(words)
+        if word.conf < ReocrConfig.MIN_CONFIDENCE and (whitelist := field_whitelist(word.text))
+    ]
+    if not candidates:
+        return words
+
+    gray = to_gray(image)
+    refined = list(words)
+    for i, whitelist in sorted(candidates, key=lambda c: words[c[0]].conf)[:ReocrConfig.MAX_WORDS]:
+        word = words[i]
+        reread = tesseract_pool.image_to_data(crop_word(gray, word), lang=ReocrConfig.LANG,
+                                              psm=ReocrConfig.PSM_SINGLE_WORD, whitelist=whitelist)
+        if not reread:
+            continue
+        conf = min(w.conf for w in reread)
+        if conf > word.conf:
+            refined[i] = word._replace(text="".join(w.text for w in reread), conf=conf)
+    return refined